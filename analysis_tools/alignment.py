@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.funding_tools import FUNDING_RATE_PREFIX
+
+INTERVAL_COLUMN = "funding_interval_hours"
+
+
+@dataclass()
+class AlignmentReport:
+    # Rows of the first exchange, the timeline the other exchanges are aligned on
+    timeline_rows: int
+    # Timeline rows matched by each other exchange, and how many of them at the exact same time
+    matched: Dict[str, int] = field(default_factory=dict)
+    exact: Dict[str, int] = field(default_factory=dict)
+    # Timeline rows kept, with a print of every exchange
+    aligned_rows: int = 0
+
+    @property
+    def dropped_rows(self) -> int:
+        return self.timeline_rows - self.aligned_rows
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "matched": self.matched,
+            "exact": self.exact,
+            "unmatched": {exchange: self.timeline_rows - matched for exchange, matched in self.matched.items()},
+        })
+
+    def __str__(self):
+        return (f"{self.timeline_rows} timeline rows, {self.aligned_rows} aligned, {self.dropped_rows} dropped\n"
+                f"{self.to_frame().to_string()}")
+
+
+def align_funding(frames: Dict[str, pd.DataFrame], tolerance: pd.Timedelta,
+                  default_interval_hours: float = 8) -> Tuple[pd.DataFrame, AlignmentReport]:
+    """
+    As-of alignment of the funding prints of several exchanges, instead of an exact (timestamp, token) join.
+
+    frames maps each exchange to its prints (timestamp, token and a funding_rate_<exchange> column),
+    the first exchange gives the timeline. Each timeline row is matched with the print of the same
+    token nearest in time within tolerance on every other exchange (sorted as-of joins), rows missing
+    an exchange are dropped. Rates of the other exchanges are scaled to the funding interval of the
+    timeline row: rate * timeline interval / exchange interval, intervals are read from a
+    funding_interval_hours column or default_interval_hours.
+    Duplicated prints of an exchange are matched once. Rows keep the order of the first exchange.
+    """
+    exchanges = list(frames)
+    timeline = frames[exchanges[0]]
+    report = AlignmentReport(timeline_rows=len(timeline))
+
+    aligned = timeline.assign(_row=np.arange(len(timeline)), token=timeline["token"].astype(object))
+    aligned = aligned.sort_values("timestamp", kind="stable", ignore_index=True)
+    timeline_interval = _interval_hours(aligned, default_interval_hours)
+    for exchange in exchanges[1:]:
+        prints = frames[exchange].drop_duplicates(subset=["timestamp", "token"])
+        prints = prints.assign(token=prints["token"].astype(object), _time=prints["timestamp"],
+                               _interval=_interval_hours(prints, default_interval_hours))
+        # The rates are scaled to the timeline interval, the interval of the exchange is not kept
+        prints = prints.drop(columns=[INTERVAL_COLUMN], errors="ignore")
+        # Columns already in the timeline get the exchange as suffix
+        prints = prints.rename(columns={column: f"{column}_{exchange}" for column in prints.columns
+                                        if column in aligned.columns and column not in ("timestamp", "token")})
+        prints = prints.sort_values("timestamp", kind="stable")
+        aligned = pd.merge_asof(aligned, prints, on="timestamp", by="token", tolerance=tolerance, direction="nearest")
+
+        rate = FUNDING_RATE_PREFIX + exchange
+        is_matched = aligned[rate].notna().to_numpy()
+        report.matched[exchange] = int(is_matched.sum())
+        report.exact[exchange] = int((aligned["_time"] == aligned["timestamp"]).sum())
+        aligned[rate] = aligned[rate] * (timeline_interval / aligned["_interval"].to_numpy())
+        aligned = aligned.drop(columns=["_time", "_interval"])
+
+    rates = [FUNDING_RATE_PREFIX + exchange for exchange in exchanges[1:]]
+    aligned = aligned.loc[aligned[rates].notna().all(axis=1).to_numpy()]
+    aligned = aligned.sort_values("_row", kind="stable").drop(columns=["_row"]).reset_index(drop=True)
+    report.aligned_rows = len(aligned)
+    return aligned, report
+
+
+def _interval_hours(prints: pd.DataFrame, default_interval_hours: float) -> np.ndarray:
+    if INTERVAL_COLUMN in prints.columns:
+        return prints[INTERVAL_COLUMN].to_numpy(dtype=float)
+    return np.full(len(prints), float(default_interval_hours))
@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.profiling import stage
+
+# About a week of 8h fundings, keeps the autocorrelation of the funding rates within a block
+BLOCK_SIZE = 21
+PATHS = 10_000
+# Bound of the temporary paths x timestamps arrays of a chunk
+CHUNK_BYTES = 256 * 2 ** 20
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+
+@dataclass()
+class BootstrapReport:
+    # One value by path
+    pnl: np.ndarray
+    apy: np.ndarray
+    fee: np.ndarray
+    # (paths, tokens) gain of the profitable INVESTED lines
+    gain_by_token: pd.DataFrame
+    # PnL and APY of the historical path, the order of apply()
+    historical_pnl: float
+    historical_apy: float
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"pnl": self.pnl, "apy": self.apy, "fee": self.fee})
+
+    def percentiles(self, q: Sequence[float] = PERCENTILES) -> pd.DataFrame:
+        # Percentiles of each metric over the paths, one row by percentile
+        frame = self.to_frame()
+        return pd.DataFrame({column: np.percentile(frame[column], q) for column in frame.columns},
+                            index=pd.Index(q, name="percentile"))
+
+    def summary(self) -> Dict:
+        return {
+            "paths": len(self.pnl),
+            "historical_pnl": self.historical_pnl,
+            "historical_apy": self.historical_apy,
+            "mean_pnl": float(self.pnl.mean()),
+            "std_pnl": float(self.pnl.std()),
+            # Mean of the 5% worst paths
+            "expected_shortfall_5": float(np.sort(self.pnl)[:max(1, len(self.pnl) // 20)].mean()),
+        }
+
+
+def timestamp_outcomes(df: pd.DataFrame, ledger):
+    """
+    Gain by token, line count by token and fee of each timestamp of a BestGain ledger (df is BestGain.df,
+    the source of its lines), in the order of the timestamps of df. A BestGain timestamp does not depend on
+    the others, so any sequence of timestamps has the PnL of the sum of their outcomes.
+    """
+    codes, timestamps = pd.factorize(df["timestamp"])
+    n, k = len(timestamps), len(ledger.tokens)
+    size = ledger.size
+    counted = np.flatnonzero(ledger.is_invested[:size] & ledger.is_profitable[:size])
+    group = codes[ledger.source[counted]]
+    flat = group * k + ledger.token_code[counted]
+    # NaN gains (a spot bar without close) are skipped like in the totals of the ledger
+    weights = np.nan_to_num(ledger.values["potential_gain_usd"][counted], nan=0.0)
+    gains = np.bincount(flat, weights=weights, minlength=n * k).reshape(n, k)
+    lines = np.bincount(flat, minlength=n * k).reshape(n, k)
+    # The fee of a timestamp is counted once, on its profitable lines
+    fees = np.zeros(n)
+    fees[group] = ledger.fee_amount[counted]
+    return gains, lines, fees
+
+
+def block_indices(rng: np.random.Generator, paths: int, length: int, n_timestamps: int, block_size: int) -> np.ndarray:
+    # (paths, length) timestamps of circular blocks of block_size consecutive timestamps starting at random
+    n_blocks = -(-length // block_size)
+    starts = rng.integers(0, n_timestamps, size=(paths, n_blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)) % n_timestamps
+    return indices.reshape(paths, -1)[:, :length]
+
+
+def bootstrap_pnl(df: pd.DataFrame, ledger, inventory: Dict[str, float], paths: int = PATHS,
+                  block_size: int = BLOCK_SIZE, length: Optional[int] = None, seed: Optional[int] = None,
+                  chunk_bytes: int = CHUNK_BYTES) -> BootstrapReport:
+    """
+    Block bootstrap of the BestGain PnL (df and ledger of BestGain.apply, either engine).
+
+    Each synthetic path is length timestamps (the history length by default) made of blocks of block_size
+    consecutive historical timestamps, so funding rates and spot prices of all the tokens are resampled
+    together and keep their autocorrelation within a block (block_size 1 is an iid bootstrap). The
+    timestamps of a path are counted in a (paths, timestamps) matrix multiplied with the (timestamps,
+    tokens) outcomes of timestamp_outcomes, by chunks of chunk_bytes of temporary arrays.
+    A timestamp is only traded when its gain is above its fees, so no timestamp loses and neither does a
+    path, whatever the draw: there is no loss probability to estimate, the risk is in the spread of the
+    final PnL. Re-running the allocation on the resampled rows would not change that, each timestamp is
+    allocated on its own rows and gives the same outcome. Losses of a held position between two fundings
+    (price moves, margin calls) are not modeled, see BestGain.monitor_margin.
+    pnl and apy are those of BestGain.apply_stats: gain of the profitable INVESTED lines minus their fees,
+    over the inventory of the tokens with such a line.
+    """
+    gains, lines, fees = timestamp_outcomes(df, ledger)
+    n, k = gains.shape
+    if n == 0:
+        raise ValueError("No timestamp in the ledger")
+    length = length or n
+    net = gains.sum(axis=1) - fees
+    amount = np.array([inventory[token] for token in ledger.tokens], dtype=float)
+    rng = np.random.default_rng(seed)
+
+    pnl, fee = np.empty(paths), np.empty(paths)
+    gain_by_token = np.empty((paths, k))
+    has_lines = np.empty((paths, k), dtype=bool)
+    # indices and timestamp counts (int then float) of a path
+    chunk = max(1, chunk_bytes // (8 * (length + 2 * n)))
+    with stage("bootstrap_pnl") as timed:
+        for start in range(0, paths, chunk):
+            stop = min(paths, start + chunk)
+            size = stop - start
+            indices = block_indices(rng, size, length, n, block_size)
+            counts = np.bincount((indices + (np.arange(size) * n)[:, None]).ravel(), minlength=size * n)
+            counts = counts.reshape(size, n).astype(float)
+            gain_by_token[start:stop] = counts @ gains
+            has_lines[start:stop] = counts @ lines > 0
+            fee[start:stop] = counts @ fees
+            pnl[start:stop] = counts @ net
+        timed.rows = paths * length
+
+    invested = has_lines @ amount
+    with np.errstate(invalid="ignore", divide="ignore"):
+        apy = np.round(pnl / invested, 4) * 100
+    historical_invested = amount[lines.sum(axis=0) > 0].sum()
+    historical_pnl = float(net.sum())
+    return BootstrapReport(
+        pnl=pnl,
+        apy=apy,
+        fee=fee,
+        gain_by_token=pd.DataFrame(gain_by_token, columns=ledger.tokens),
+        historical_pnl=historical_pnl,
+        historical_apy=float(round(historical_pnl / historical_invested, 4) * 100) if historical_invested else float("nan"),
+    )
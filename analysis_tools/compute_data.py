@@ -1,26 +1,48 @@
-from typing import Dict
+from typing import Dict, Optional
 
 import pandas as pd
 
-from analysis_tools.funding_tools import apply_is_market_funding_arb, apply_is_buy_long_perp_binance, \
-    apply_is_buy_long_perp_bybite, apply_init_quantity
+from analysis_tools.alignment import align_funding
+from analysis_tools.funding_tools import (FUNDING_RATE_PREFIX, best_funding, funding_exchanges, funding_rates,
+                                          init_quantity, is_buy_long_perp, is_market_funding_arb, is_unique_best)
+from analysis_tools.memo import memoize
+from analysis_tools.profiling import stage
 from static_data import INVENTORY
 
 
-def compute_funding_dataframe(dataset, inventory, initial_prices) -> pd.DataFrame:
-    funding_df = pd.merge(left=dataset.funding_rates_binance, right=dataset.funding_rates_bybit,
-                          on=["timestamp", "token"], how="inner")
+def compute_funding_dataframe(dataset, inventory, initial_prices, tolerance: Optional[pd.Timedelta] = None) -> pd.DataFrame:
+    # Saved by dataset version, inventory, prices and tolerance (see memo.memoize)
+    return memoize(_compute_funding_dataframe, dataset, inventory, initial_prices, tolerance)
+
+
+def _compute_funding_dataframe(dataset, inventory, initial_prices, tolerance: Optional[pd.Timedelta] = None) -> pd.DataFrame:
+    # One row by (timestamp, token) printed on every exchange, one funding_rate_<exchange> column each
+    # With a tolerance, the exchanges are aligned as-of on the binance prints (see align_funding) and the
+    # AlignmentReport is in funding_df.attrs["alignment"]
+    with stage("compute_funding_dataframe.join") as timed:
+        if tolerance is None:
+            frames = list(dataset.funding_frames().values())
+            funding_df = frames[0]
+            for frame in frames[1:]:
+                funding_df = pd.merge(left=funding_df, right=frame, on=["timestamp", "token"], how="inner")
+        else:
+            funding_df, report = align_funding(dataset.funding_frames(intervals=True), pd.Timedelta(tolerance))
+            funding_df.attrs["alignment"] = report
+        timed.rows = len(funding_df)
 
     # funding_df = funding_df.loc[funding_df["token"].isin((inventory.keys()))]
 
-    funding_df = funding_df.rename({
-        "last_funding_rate": "funding_rate_binance",
-        "funding_rate": "funding_rate_bybite",
-    }, axis=1)
-    funding_df["is_market_funding_arb"] = funding_df.apply(apply_is_market_funding_arb, axis=1)
-    funding_df["is_buy_long_perp_binance"] = funding_df["funding_rate_binance"].apply(apply_is_buy_long_perp_binance)
-    funding_df["is_buy_long_perp_bybite"] = funding_df["funding_rate_bybite"].apply(apply_is_buy_long_perp_bybite)
-    funding_df["is_funding_binance_best"] = funding_df.apply(
-        lambda x: x["funding_rate_binance"] > x["funding_rate_bybite"], axis=1)
-    funding_df["current_quantity_hold"] = funding_df.apply(apply_init_quantity, axis=1, args=(inventory, initial_prices))
-    return funding_df
\ No newline at end of file
+    # Tokens are categoricals with loading_data(lean=True), the strategies work on strings
+    for column in ["token", "symbol"]:
+        if isinstance(funding_df[column].dtype, pd.CategoricalDtype):
+            funding_df[column] = funding_df[column].astype(object)
+
+    exchanges = funding_exchanges(funding_df)
+    rates = funding_rates(funding_df, exchanges)
+    funding_df["is_market_funding_arb"] = is_market_funding_arb(rates)
+    for exchange in exchanges:
+        funding_df[f"is_buy_long_perp_{exchange}"] = is_buy_long_perp(funding_df[FUNDING_RATE_PREFIX + exchange])
+    venue, best = best_funding(rates)
+    funding_df["is_funding_binance_best"] = (venue == exchanges.index("binance")) & is_unique_best(rates, best)
+    funding_df["current_quantity_hold"] = init_quantity(funding_df["token"], inventory, initial_prices)
+    return funding_df
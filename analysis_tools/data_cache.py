@@ -0,0 +1,298 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Bump when the layout of a cache entry changes
+CACHE_VERSION = 2
+META_FILE = "meta.json"
+# Rows read at once when streaming a CSV or filtering a cache entry
+CHUNK_ROWS = 500_000
+# Format of the time columns of the files
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@dataclass()
+class RowFilter:
+    """
+    Rows kept while reading a file: time column in [start, end) and token column in tokens.
+    Columns are positions in the file, None disables a condition.
+    """
+    time_column: int = 0
+    token_column: int = 1
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    tokens: Optional[List[str]] = None
+
+    def mask(self, times: np.ndarray, tokens: np.ndarray, wanted_tokens=None) -> np.ndarray:
+        # wanted_tokens replaces self.tokens when the token column is encoded (cache codes)
+        keep = np.ones(len(times), dtype=bool)
+        if self.start is not None:
+            keep &= times >= np.datetime64(self.start, "ns")
+        if self.end is not None:
+            keep &= times < np.datetime64(self.end, "ns")
+        if self.tokens is not None:
+            keep &= np.isin(tokens, self.tokens if wanted_tokens is None else wanted_tokens)
+        return keep
+
+
+def read_csv_cached(path: str, parse_dates: List[str], cache_dir: str, usecols: Optional[List[int]] = None,
+                    categorical: bool = False, row_filter: Optional[RowFilter] = None) -> pd.DataFrame:
+    """
+    Read a CSV through a binary columnar cache.
+
+    Each column is stored once as a raw binary file (strings as integer codes + categories) and is
+    read back memory-mapped, so no CSV text and no date is parsed again. The entry name contains the
+    size and mtime of the source file: when the CSV changes a new entry is built and the old one
+    removed. Entries are written in a temporary directory then renamed, so several processes can
+    share the same cache.
+    usecols keeps only the columns at these positions, categorical returns string columns as
+    pandas categoricals instead of Python strings, row_filter keeps only the matching rows.
+    The entry is built and filtered CHUNK_ROWS rows at a time, memory stays bounded by the rows kept.
+    """
+    entry_dir = os.path.join(cache_dir, _entry_name(path, parse_dates))
+    if not os.path.isfile(os.path.join(entry_dir, META_FILE)):
+        if not _write_entry(path, parse_dates, cache_dir, entry_dir):
+            df = read_csv_filtered(path, parse_dates, usecols, row_filter)
+            return df.astype({column: "category" for column in df.columns[df.dtypes == object]}) if categorical else df
+        _remove_stale_entries(cache_dir, entry_dir)
+    return _read_entry(entry_dir, usecols, categorical, row_filter)
+
+
+def read_csv_filtered(path: str, parse_dates: List[str], usecols: Optional[List[int]] = None,
+                      row_filter: Optional[RowFilter] = None) -> pd.DataFrame:
+    # pd.read_csv, streamed CHUNK_ROWS rows at a time when rows are filtered
+    names = pd.read_csv(path, nrows=0).columns
+    columns = [names[i] for i in (usecols if usecols is not None else range(len(names)))]
+    if row_filter is None:
+        return pd.read_csv(path, parse_dates=[name for name in parse_dates if name in columns], usecols=usecols)
+
+    time_name = names[row_filter.time_column]
+    token_name = names[row_filter.token_column]
+    read_names = set(columns) | {time_name, token_name}
+    read_cols = [i for i, name in enumerate(names) if name in read_names]
+    chunks = []
+    for chunk in pd.read_csv(path, parse_dates=[name for name in parse_dates if name in read_names],
+                             usecols=read_cols, chunksize=CHUNK_ROWS):
+        keep = row_filter.mask(chunk[time_name].to_numpy(), chunk[token_name].to_numpy())
+        chunks.append(chunk.loc[keep, columns])
+    if not chunks:
+        return pd.read_csv(path, parse_dates=[name for name in parse_dates if name in columns], usecols=usecols)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def append_csv(path: str, rows: pd.DataFrame, parse_dates: List[str], cache_dir: Optional[str] = None,
+               time_column: int = 0, token_column: int = 1) -> bool:
+    """
+    Append rows (the columns of the file, in order) to a CSV file and to its cache entry in cache_dir.
+
+    Rows are sorted by time and token. When none is older than the last row of the file they are
+    appended to the CSV text and to the binary columns of the cache entry, which is then renamed after
+    the new size and mtime of the file: a large file is neither read nor cached again. Otherwise the
+    file is rewritten sorted and its entry is rebuilt on the next read.
+    Returns True when the rows were appended, False when the file was rewritten.
+    """
+    if rows.empty:
+        return True
+    with open(path, newline="") as f:
+        header = f.readline()
+    names = list(pd.read_csv(path, nrows=0).columns)
+    time_name = names[time_column]
+    rows = rows.set_axis(names, axis=1).sort_values([time_name, names[token_column]], kind="stable")
+
+    entry_dir = None
+    if cache_dir is not None:
+        times = read_csv_cached(path, parse_dates, cache_dir, usecols=[time_column])[time_name]
+        entry_dir = os.path.join(cache_dir, _entry_name(path, parse_dates))
+    else:
+        times = pd.read_csv(path, usecols=[time_column], parse_dates=[time_name])[time_name]
+    if len(times) and len(rows) and rows[time_name].iloc[0] < times.max():
+        df = pd.concat([pd.read_csv(path, parse_dates=parse_dates), rows], ignore_index=True)
+        df = df.sort_values([time_name, names[token_column]], kind="stable")
+        with open(path, "w", newline="") as f:
+            f.write(header)
+            df.to_csv(f, header=False, index=False, date_format=DATE_FORMAT)
+        return False
+
+    with open(path, "rb+") as f:
+        # The last line of a file written by hand may have no newline
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    with open(path, "a", newline="") as f:
+        rows.to_csv(f, header=False, index=False, date_format=DATE_FORMAT)
+    if entry_dir is not None and os.path.isfile(os.path.join(entry_dir, META_FILE)):
+        if not _append_entry(entry_dir, rows):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        else:
+            os.rename(entry_dir, os.path.join(cache_dir, _entry_name(path, parse_dates)))
+    return True
+
+
+def _append_entry(entry_dir: str, rows: pd.DataFrame) -> bool:
+    # Append rows to the columns of an entry, False when their types do not match the entry
+    with open(os.path.join(entry_dir, META_FILE)) as f:
+        meta = json.load(f)
+    encoded = []
+    for i, column in enumerate(meta["columns"]):
+        values = rows.iloc[:, i]
+        categories = None
+        if column["kind"] == "categorical":
+            if values.dtype != object or pd.api.types.infer_dtype(values, skipna=True) not in ("string", "empty"):
+                return False
+            categories = {category: code for code, category in enumerate(_load_categories(entry_dir, i))}
+            data = _encode(values, categories)
+        else:
+            data = values.to_numpy()
+        if data.dtype.str != column["dtype"]:
+            return False
+        encoded.append((data, categories))
+
+    # Readers map the first meta["rows"] rows only, the entry stays readable while it grows
+    for i, (data, categories) in enumerate(encoded):
+        with open(os.path.join(entry_dir, f"{i}.bin"), "ab") as f:
+            f.write(np.ascontiguousarray(data).tobytes())
+        if categories is not None:
+            _replace(os.path.join(entry_dir, f"{i}.categories.npy"),
+                     lambda f: np.save(f, np.asarray(list(categories), dtype=str)))
+    meta["rows"] += len(rows)
+    _replace(os.path.join(entry_dir, META_FILE), lambda f: f.write(json.dumps(meta).encode()))
+    return True
+
+
+def _replace(path: str, write):
+    # Write a file through a temporary file renamed over it
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _entry_name(path: str, parse_dates: List[str]) -> str:
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    options = hashlib.md5(",".join(parse_dates).encode()).hexdigest()[:8]
+    return f"{name}@{stat.st_size}-{stat.st_mtime_ns}-{options}-v{CACHE_VERSION}"
+
+
+def _write_entry(path: str, parse_dates: List[str], cache_dir: str, entry_dir: str) -> bool:
+    # False when the file can not be cached, the caller reads the CSV instead
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+    try:
+        meta = _write_columns(path, parse_dates, tmp_dir)
+        if meta is None:
+            return False
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp_dir, entry_dir)
+        return True
+    except OSError:
+        # Another process published the same entry first
+        return os.path.isfile(os.path.join(entry_dir, META_FILE))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _write_columns(path: str, parse_dates: List[str], tmp_dir: str) -> Optional[Dict]:
+    # Append each chunk to one binary file per column, None when a column can not be cached
+    rows = 0
+    columns = None
+    categories: List[Dict[str, int]] = []
+    with contextlib.ExitStack() as stack:
+        files = []
+        for chunk in pd.read_csv(path, parse_dates=parse_dates, chunksize=CHUNK_ROWS):
+            if columns is None:
+                columns = [{"name": column} for column in chunk.columns]
+                categories = [{} for _ in columns]
+                files = [stack.enter_context(open(os.path.join(tmp_dir, f"{i}.bin"), "wb")) for i in range(len(columns))]
+            for i, column in enumerate(columns):
+                values = chunk[column["name"]]
+                if values.dtype == object:
+                    # Object columns are only cached when they hold strings
+                    if pd.api.types.infer_dtype(values, skipna=True) != "string":
+                        return None
+                    kind, data = "categorical", _encode(values, categories[i])
+                else:
+                    kind, data = "values", values.to_numpy()
+                if column.setdefault("kind", kind) != kind or column.setdefault("dtype", data.dtype.str) != data.dtype.str:
+                    # The type of the column changes between chunks
+                    return None
+                files[i].write(np.ascontiguousarray(data).tobytes())
+            rows += len(chunk)
+    if columns is None:
+        return None
+
+    for i, column in enumerate(columns):
+        if column["kind"] == "categorical":
+            np.save(os.path.join(tmp_dir, f"{i}.categories.npy"), np.asarray(list(categories[i]), dtype=str))
+    return {"version": CACHE_VERSION, "rows": rows, "columns": columns}
+
+
+def _encode(values: pd.Series, categories: Dict[str, int]) -> np.ndarray:
+    # Codes in the categories seen so far, -1 for missing values
+    codes, uniques = pd.factorize(values)
+    mapping = np.array([categories.setdefault(value, len(categories)) for value in uniques] + [-1], dtype=np.int64)
+    return mapping[codes]
+
+
+def _read_entry(entry_dir: str, usecols: Optional[List[int]] = None, categorical: bool = False,
+                row_filter: Optional[RowFilter] = None) -> pd.DataFrame:
+    with open(os.path.join(entry_dir, META_FILE)) as f:
+        meta = json.load(f)
+    rows = None if row_filter is None else _filter_rows(entry_dir, meta, row_filter)
+    data = {}
+    for i in usecols if usecols is not None else range(len(meta["columns"])):
+        column = meta["columns"][i]
+        values = _load_column(entry_dir, meta, i)
+        if rows is not None:
+            values = values[rows]
+        if column["kind"] == "categorical":
+            values = pd.Categorical.from_codes(values, _load_categories(entry_dir, i))
+            if not categorical:
+                values = values.astype(object)
+        data[column["name"]] = values
+    return pd.DataFrame(data)
+
+
+def _load_column(entry_dir: str, meta: Dict, i: int) -> np.ndarray:
+    dtype = np.dtype(meta["columns"][i]["dtype"])
+    if meta["rows"] == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(os.path.join(entry_dir, f"{i}.bin"), dtype=dtype, mode="r", shape=(meta["rows"],))
+
+
+def _load_categories(entry_dir: str, i: int) -> np.ndarray:
+    return np.load(os.path.join(entry_dir, f"{i}.categories.npy")).astype(object)
+
+
+def _filter_rows(entry_dir: str, meta: Dict, row_filter: RowFilter) -> np.ndarray:
+    # Positions of the rows kept, the columns are scanned CHUNK_ROWS rows at a time
+    times = _load_column(entry_dir, meta, row_filter.time_column)
+    tokens = _load_column(entry_dir, meta, row_filter.token_column)
+    wanted_tokens = None
+    if row_filter.tokens is not None and meta["columns"][row_filter.token_column]["kind"] == "categorical":
+        wanted_tokens = np.flatnonzero(np.isin(_load_categories(entry_dir, row_filter.token_column), row_filter.tokens))
+    rows = [np.empty(0, dtype=np.int64)]
+    for start in range(0, meta["rows"], CHUNK_ROWS):
+        stop = start + CHUNK_ROWS
+        rows.append(start + np.flatnonzero(row_filter.mask(times[start:stop], tokens[start:stop], wanted_tokens)))
+    return np.concatenate(rows)
+
+
+def _remove_stale_entries(cache_dir: str, entry_dir: str):
+    prefix = os.path.basename(entry_dir).split("@")[0] + "@"
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and path != entry_dir:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,367 @@
+import asyncio
+import http.client
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import pandas as pd
+
+from analysis_tools.data_cache import append_csv, read_csv_cached
+from analysis_tools.loading_data import CACHE_DIR_NAME, FILES_DIR
+
+BINANCE_FUTURES_URL = "https://fapi.binance.com"
+BINANCE_SPOT_URL = "https://api.binance.com"
+BYBIT_URL = "https://api.bybit.com"
+
+# Requests sent at once and by second to each host
+CONCURRENCY = 8
+REQUESTS_PER_SECOND = 10.0
+RETRIES = 5
+# First retry delay in seconds, doubled at each retry
+BACKOFF = 0.5
+TIMEOUT = 30.0
+RETRY_STATUSES = {418, 429, 500, 502, 503, 504}
+HOUR_MS = 3_600_000
+
+
+class FetchError(Exception):
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+@dataclass()
+class Feed:
+    """
+    One file of files/ and the REST endpoint it is refreshed from.
+
+    params(symbol, start_ms, end_ms, limit) are the query parameters of a request for the records of
+    symbol in [start_ms, end_ms], parse(payload) returns (record time in ms, CSV row) pairs, the CSV
+    row is in the column order of the file. time_offset_ms is the time column of the file minus the
+    record time (the hourly file is indexed by close_time, klines by open time). Pages of records
+    newest first (descending) are paged backwards.
+    """
+    file_name: str
+    header: str
+    parse_dates: List[str]
+    base_url: str
+    path: str
+    interval_ms: int
+    limit: int
+    params: Callable[[str, int, int, int], Dict]
+    parse: Callable[[object], List[Tuple[int, list]]]
+    time_offset_ms: int = 0
+    descending: bool = False
+
+
+def _time(ms: int) -> pd.Timestamp:
+    # Records are stored to the second, a print a few ms late gets the time of the others
+    return pd.Timestamp(int(ms), unit="ms").floor("s")
+
+
+def _parse_binance_funding(payload) -> List[Tuple[int, list]]:
+    return [(int(record["fundingTime"]), [_time(record["fundingTime"]), record["symbol"], 8, float(record["fundingRate"])])
+            for record in payload]
+
+
+def _parse_bybit_funding(payload) -> List[Tuple[int, list]]:
+    if payload.get("retCode") != 0:
+        # 10006: too many requests
+        raise FetchError(f"Bybit error {payload.get('retCode')}: {payload.get('retMsg')}",
+                         retryable=payload.get("retCode") == 10006)
+    return [(int(record["fundingRateTimestamp"]),
+             [_time(record["fundingRateTimestamp"]), record["symbol"], record["symbol"], float(record["fundingRate"])])
+            for record in payload["result"]["list"]]
+
+
+def _parse_binance_klines(payload) -> List[Tuple[int, list]]:
+    # [open time, open, high, low, close, volume, close time, quote volume, trades, taker buy volume,
+    # taker buy quote volume, ignore], close_time is stored as open time + 1h like the existing file
+    return [(int(kline[0]), [_time(int(kline[0]) + HOUR_MS), None, _time(kline[0]), float(kline[1]), float(kline[2]),
+                             float(kline[3]), float(kline[4]), float(kline[5]), float(kline[7]), int(kline[8]),
+                             float(kline[9]), float(kline[10]), int(kline[11])])
+            for kline in payload]
+
+
+def binance_funding_feed(base_url: str = BINANCE_FUTURES_URL) -> Feed:
+    return Feed(
+        file_name="Binance_funding.csv",
+        header="calc_time,,funding_interval_hours,last_funding_rate",
+        parse_dates=["calc_time"],
+        base_url=base_url,
+        path="/fapi/v1/fundingRate",
+        interval_ms=8 * HOUR_MS,
+        limit=1000,
+        params=lambda symbol, start, end, limit: {"symbol": symbol, "startTime": start, "endTime": end, "limit": limit},
+        parse=_parse_binance_funding,
+    )
+
+
+def bybit_funding_feed(base_url: str = BYBIT_URL) -> Feed:
+    return Feed(
+        file_name="Bybit_funding.csv",
+        header="fundingRateTimestamp,,symbol,fundingRate",
+        parse_dates=["fundingRateTimestamp"],
+        base_url=base_url,
+        path="/v5/market/funding/history",
+        interval_ms=8 * HOUR_MS,
+        limit=200,
+        params=lambda symbol, start, end, limit: {"category": "linear", "symbol": symbol, "startTime": start,
+                                                  "endTime": end, "limit": limit},
+        parse=_parse_bybit_funding,
+        descending=True,
+    )
+
+
+def binance_hourly_feed(base_url: str = BINANCE_SPOT_URL) -> Feed:
+    return Feed(
+        file_name="Binance_hourly.csv",
+        header="close_time,,open_time,open,high,low,close,volume,quote_volume,count,taker_buy_volume,"
+               "taker_buy_quote_volume,ignore",
+        parse_dates=["close_time", "open_time"],
+        base_url=base_url,
+        path="/api/v3/klines",
+        interval_ms=HOUR_MS,
+        limit=1000,
+        params=lambda symbol, start, end, limit: {"symbol": symbol, "interval": "1h", "startTime": start,
+                                                  "endTime": end, "limit": limit},
+        parse=_parse_binance_klines,
+        time_offset_ms=HOUR_MS,
+    )
+
+
+def default_feeds() -> List[Feed]:
+    return [binance_funding_feed(), bybit_funding_feed(), binance_hourly_feed()]
+
+
+class RateLimiter:
+    # Token bucket: at most rate requests by second on average, burst at once
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._last is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._last = loop.time()
+                self._tokens = 1.0
+            self._tokens -= 1
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP connections to one host, at most size requests at once.
+    http.client is blocking, requests run in a thread of the pool while the event loop goes on.
+    """
+
+    def __init__(self, base_url: str, size: int = CONCURRENCY, timeout: float = TIMEOUT):
+        url = urlsplit(base_url)
+        self._connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self._host = url.hostname
+        self._port = url.port
+        self._prefix = url.path.rstrip("/")
+        self._timeout = timeout
+        self._idle: List[http.client.HTTPConnection] = []
+        self._semaphore = asyncio.Semaphore(size)
+        self._executor = ThreadPoolExecutor(size)
+        self.connections_opened = 0
+
+    async def get(self, path: str, params: Dict) -> Tuple[int, Dict[str, str], bytes]:
+        async with self._semaphore:
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = self._connection_class(self._host, self._port, timeout=self._timeout)
+                self.connections_opened += 1
+            url = f"{self._prefix}{path}?{urlencode(params)}"
+            try:
+                status, headers, body = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _request, connection, url)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                connection.close()
+            else:
+                self._idle.append(connection)
+            return status, headers, body
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle.clear()
+        self._executor.shutdown(wait=False)
+
+
+def _request(connection: http.client.HTTPConnection, url: str) -> Tuple[int, Dict[str, str], bytes]:
+    connection.request("GET", url, headers={"Accept": "application/json"})
+    response = connection.getresponse()
+    body = response.read()
+    return response.status, {key.lower(): value for key, value in response.getheaders()}, body
+
+
+@dataclass()
+class Client:
+    # Pool and rate limiter of each host, requests retried with exponential backoff
+    concurrency: int = CONCURRENCY
+    requests_per_second: float = REQUESTS_PER_SECOND
+    retries: int = RETRIES
+    backoff: float = BACKOFF
+    timeout: float = TIMEOUT
+    requests: int = 0
+    retried: int = 0
+    connections_opened: int = 0
+    _pools: Dict[str, ConnectionPool] = field(default_factory=dict, repr=False)
+    _limiters: Dict[str, RateLimiter] = field(default_factory=dict, repr=False)
+
+    async def get_json(self, base_url: str, path: str, params: Dict, parse: Callable):
+        if base_url not in self._pools:
+            self._pools[base_url] = ConnectionPool(base_url, self.concurrency, self.timeout)
+            self._limiters[base_url] = RateLimiter(self.requests_per_second, self.concurrency)
+        for attempt in range(self.retries + 1):
+            await self._limiters[base_url].acquire()
+            self.requests += 1
+            try:
+                status, headers, body = await self._pools[base_url].get(path, params)
+                if status != 200:
+                    retry_after = headers.get("retry-after")
+                    raise FetchError(f"HTTP {status} for {path} {params}", retryable=status in RETRY_STATUSES,
+                                     retry_after=float(retry_after) if retry_after else None)
+                return parse(json.loads(body))
+            except (OSError, http.client.HTTPException, ValueError, FetchError) as error:
+                retryable = error.retryable if isinstance(error, FetchError) else True
+                if not retryable or attempt == self.retries:
+                    raise
+                retry_after = error.retry_after if isinstance(error, FetchError) else None
+                self.retried += 1
+                # Random jitter so that the requests throttled together do not come back together
+                await asyncio.sleep(retry_after if retry_after is not None
+                                    else self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def close(self):
+        # The pools are bound to the event loop, a new run opens new ones
+        for pool in self._pools.values():
+            self.connections_opened += pool.connections_opened
+            pool.close()
+        self._pools.clear()
+        self._limiters.clear()
+
+
+async def fetch_records(client: Client, feed: Feed, symbol: str, start_ms: int, end_ms: int) -> List[Tuple[int, list]]:
+    """
+    Records of symbol with start_ms <= time <= end_ms, oldest first.
+    The range is cut in windows of feed.limit records requested at once, a full page is followed by
+    a request for the rest of its window.
+    """
+    window_ms = feed.limit * feed.interval_ms
+    windows = [(start, min(start + window_ms - 1, end_ms)) for start in range(start_ms, end_ms + 1, window_ms)]
+    pages = await asyncio.gather(*[_fetch_window(client, feed, symbol, start, end) for start, end in windows])
+    records = {}
+    for page in pages:
+        for time_ms, row in page:
+            row[1] = symbol
+            records[time_ms] = row
+    return [(time_ms, records[time_ms]) for time_ms in sorted(records)]
+
+
+async def _fetch_window(client: Client, feed: Feed, symbol: str, start_ms: int, end_ms: int) -> List[Tuple[int, list]]:
+    records = []
+    while start_ms <= end_ms:
+        page = await client.get_json(feed.base_url, feed.path, feed.params(symbol, start_ms, end_ms, feed.limit), feed.parse)
+        page = [(time_ms, row) for time_ms, row in page if start_ms <= time_ms <= end_ms]
+        records += page
+        if len(page) < feed.limit:
+            break
+        # Full page, the rest of the window is requested
+        if feed.descending:
+            end_ms = min(time_ms for time_ms, _ in page) - 1
+        else:
+            start_ms = max(time_ms for time_ms, _ in page) + 1
+    return records
+
+
+def last_times(path: str, feed: Feed, cache_dir: Optional[str]) -> Dict[str, pd.Timestamp]:
+    # Time of the last row of each token in the file, read through the cache
+    if not os.path.isfile(path):
+        return {}
+    if cache_dir is not None:
+        df = read_csv_cached(path, feed.parse_dates, cache_dir, usecols=[0, 1])
+    else:
+        df = pd.read_csv(path, usecols=[0, 1], parse_dates=feed.parse_dates[:1])
+    if df.empty:
+        return {}
+    return df.groupby(df.columns[1])[df.columns[0]].max().to_dict()
+
+
+async def refresh_feed(client: Client, feed: Feed, tokens: Optional[List[str]] = None, files_dir: str = FILES_DIR,
+                       start: Optional[datetime] = None, end: Optional[datetime] = None, use_cache: bool = True) -> int:
+    """
+    Fetch the records of each token newer than the last row of the file and append them to the file
+    and its cache (see data_cache.append_csv). tokens are those of the file by default, a token without
+    any row is fetched from start. end is now by default. Returns the number of rows added.
+    """
+    path = os.path.join(files_dir, feed.file_name)
+    cache_dir = os.path.join(files_dir, CACHE_DIR_NAME) if use_cache else None
+    if not os.path.isfile(path):
+        with open(path, "w") as f:
+            f.write(feed.header + "\n")
+    last = last_times(path, feed, cache_dir)
+    tokens = sorted(last) if tokens is None else tokens
+    end_ms = _ms(end or datetime.now(timezone.utc).replace(tzinfo=None))
+
+    ranges = {}
+    for token in tokens:
+        if token in last:
+            # Records after the second of the last row, rows are stored to the second
+            ranges[token] = _ms(last[token]) - feed.time_offset_ms + 1000
+        elif start is not None:
+            ranges[token] = _ms(start) - feed.time_offset_ms
+        else:
+            raise ValueError(f"{token} has no row in {feed.file_name}, a start date is needed")
+    pages = await asyncio.gather(*[fetch_records(client, feed, token, start_ms, end_ms)
+                                   for token, start_ms in ranges.items() if start_ms <= end_ms])
+    rows = [row for page in pages for time_ms, row in page if time_ms + feed.time_offset_ms <= end_ms]
+    if rows:
+        append_csv(path, pd.DataFrame(rows), feed.parse_dates, cache_dir)
+    return len(rows)
+
+
+async def refresh_async(feeds: List[Feed], tokens: Optional[List[str]] = None, files_dir: str = FILES_DIR,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None, use_cache: bool = True,
+                        client: Optional[Client] = None) -> Dict[str, int]:
+    client = client or Client()
+    try:
+        counts = await asyncio.gather(*[refresh_feed(client, feed, tokens, files_dir, start, end, use_cache)
+                                        for feed in feeds])
+    finally:
+        client.close()
+    return {feed.file_name: count for feed, count in zip(feeds, counts)}
+
+
+def refresh(feeds: Optional[List[Feed]] = None, tokens: Optional[List[str]] = None, files_dir: str = FILES_DIR,
+            start: Optional[datetime] = None, end: Optional[datetime] = None, use_cache: bool = True,
+            client: Optional[Client] = None) -> Dict[str, int]:
+    """
+    Bring the files of files_dir up to date (see refresh_feed), all the feeds and tokens at once.
+    Returns the number of rows added to each file.
+    """
+    return asyncio.run(refresh_async(feeds or default_feeds(), tokens, files_dir, start, end, use_cache, client))
+
+
+def _ms(time) -> int:
+    return int(pd.Timestamp(time).value // 1_000_000)
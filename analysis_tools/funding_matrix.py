@@ -0,0 +1,72 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.funding_tools import FUNDING_RATE_PREFIX, best_funding
+
+
+class FundingMatrix:
+    """
+    Dense timestamps x tokens x exchanges cube of funding rates, built once from the funding prints
+    of each exchange.
+
+    Like PriceIndex, timestamps are sorted and tokens are integer codes, exchanges are the last axis
+    so best_funding() picks the best venue of every (timestamp, token) in one operation whatever the
+    number of exchanges. A missing print is NaN in the cube.
+    """
+
+    def __init__(self, times: np.ndarray, tokens: List[str], exchanges: List[str], rates: np.ndarray):
+        self.times = np.asarray(times, dtype="datetime64[ns]")
+        self.tokens = list(tokens)
+        self.exchanges = list(exchanges)
+        self.rates = rates
+        self._token_index = pd.Index(self.tokens)
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], rate_columns: Dict[str, str]) -> "FundingMatrix":
+        """
+        frames maps each exchange to its prints (timestamp, token and the rate column given by
+        rate_columns). The first print wins when a (timestamp, token) pair is duplicated.
+        """
+        exchanges = list(frames)
+        prints = [frames[exchange].drop_duplicates(subset=["timestamp", "token"]) for exchange in exchanges]
+        times = np.unique(np.concatenate([p["timestamp"].to_numpy(dtype="datetime64[ns]") for p in prints]))
+        tokens = sorted(set().union(*(p["token"].unique().tolist() for p in prints)))
+        token_index = pd.Index(tokens)
+        rates = np.full((len(times), len(tokens), len(exchanges)), np.nan)
+        for venue, (exchange, p) in enumerate(zip(exchanges, prints)):
+            rows = np.searchsorted(times, p["timestamp"].to_numpy(dtype="datetime64[ns]"))
+            rates[rows, token_index.get_indexer(p["token"]), venue] = p[rate_columns[exchange]].to_numpy(dtype=float)
+        return cls(times, tokens, exchanges, rates)
+
+    def complete(self) -> np.ndarray:
+        # (timestamps, tokens) mask of the pairs with a print on every exchange
+        return ~np.isnan(self.rates).any(axis=-1)
+
+    def best(self):
+        # Best exchange code (-1 without print) and best rate of each (timestamp, token)
+        return best_funding(self.rates)
+
+    def lookup(self, tokens, times) -> np.ndarray:
+        # (pairs, exchanges) rates of each (token, time) pair, NaN when missing
+        times = np.asarray(times, dtype="datetime64[ns]")
+        rows = np.searchsorted(self.times, times)
+        codes = self._token_index.get_indexer(tokens)
+        found = (rows < len(self.times)) & (codes >= 0)
+        found[found] = self.times[rows[found]] == times[found]
+        values = np.full((len(times), len(self.exchanges)), np.nan)
+        values[found] = self.rates[rows[found], codes[found]]
+        return values
+
+    def to_frame(self) -> pd.DataFrame:
+        # Long frame of the complete pairs with the best exchange and rate, timestamp major
+        venue, best = self.best()
+        rows, codes = np.nonzero(self.complete())
+        return pd.DataFrame({
+            "timestamp": self.times[rows],
+            "token": np.asarray(self.tokens, dtype=object)[codes],
+            **{FUNDING_RATE_PREFIX + exchange: self.rates[rows, codes, i] for i, exchange in enumerate(self.exchanges)},
+            "best_exchange": np.asarray(self.exchanges, dtype=object)[venue[rows, codes]],
+            "best_funding_rate": best[rows, codes],
+        })
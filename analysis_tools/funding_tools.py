@@ -1,3 +1,12 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# funding_df has one funding_rate_<exchange> column by exchange
+FUNDING_RATE_PREFIX = "funding_rate_"
+
+
 def apply_is_market_funding_arb(row):
     return row["funding_rate_binance"] != row["funding_rate_bybite"]
 
@@ -19,3 +28,69 @@ def apply_init_quantity(row, inventory, initial_prices):
         price_current_token = initial_prices.get(token)
         return inventory.get(token) / price_current_token
 
+
+
+# Column kernels, same results as the apply_* helpers above computed on whole columns
+
+def is_market_funding_arb(rates: np.ndarray) -> np.ndarray:
+    # rates is (rows, exchanges), True when the exchanges do not all pay the same rate
+    return rates.max(axis=1) != rates.min(axis=1)
+
+
+def is_buy_long_perp(funding_rate: pd.Series) -> pd.Series:
+    return funding_rate < 0
+
+
+def init_quantity(token: pd.Series, inventory, initial_prices) -> pd.Series:
+    price_current_token = token.map(initial_prices)
+    if price_current_token.isna().any():
+        missing = token[price_current_token.isna()].unique().tolist()
+        raise KeyError(f"No initial price for {missing}")
+    # Tokens out of the inventory are valued with the USDT amount
+    amount = token.map(inventory).fillna(inventory.get("USDT"))
+    return amount / price_current_token
+
+
+# Kernels across exchanges, rates has the exchanges on its last axis
+
+def funding_exchanges(funding_df: pd.DataFrame) -> List[str]:
+    return [column[len(FUNDING_RATE_PREFIX):] for column in funding_df.columns if column.startswith(FUNDING_RATE_PREFIX)]
+
+
+def funding_rates(funding_df: pd.DataFrame, exchanges: Optional[List[str]] = None) -> np.ndarray:
+    # (rows, exchanges) matrix of the funding rates, exchanges in column order by default
+    if exchanges is None:
+        exchanges = funding_exchanges(funding_df)
+    return funding_df[[FUNDING_RATE_PREFIX + exchange for exchange in exchanges]].to_numpy(dtype=float)
+
+
+def best_funding(rates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exchange paying the highest rate and that rate, along the last axis of rates.
+    The first exchange wins ties, missing rates (NaN) are skipped: -1 and NaN when all are missing.
+    """
+    missing = np.isnan(rates)
+    venue = np.argmax(np.where(missing, -np.inf, rates), axis=-1)
+    best = np.take_along_axis(rates, venue[..., None], axis=-1)[..., 0]
+    all_missing = missing.all(axis=-1)
+    return np.where(all_missing, -1, venue), np.where(all_missing, np.nan, best)
+
+
+def is_unique_best(rates: np.ndarray, best: np.ndarray) -> np.ndarray:
+    # True when a single exchange pays the best rate
+    return (rates == best[..., None]).sum(axis=-1) == 1
+
+
+def compounded_quantity(quantity: np.ndarray, rate: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Quantity held before each row when the gain quantity * rate of every row is reinvested:
+    quantity times the product of (1 + rate) over the previous rows of the same group (ie: token),
+    rows being in time order.
+    """
+    growth = pd.Series(1 + np.asarray(rate, dtype=float))
+    if groups is None:
+        previous_growth = growth.cumprod().shift(fill_value=1.0)
+    else:
+        grouped = growth.groupby(np.asarray(groups), sort=False)
+        previous_growth = grouped.cumprod().groupby(np.asarray(groups), sort=False).shift(fill_value=1.0)
+    return np.asarray(quantity, dtype=float) * previous_growth.to_numpy()
@@ -1,31 +1,170 @@
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
+from analysis_tools.data_cache import RowFilter, read_csv_cached, read_csv_filtered
+from analysis_tools.funding_matrix import FundingMatrix
+from analysis_tools.funding_tools import FUNDING_RATE_PREFIX
+from analysis_tools.memo import fingerprint
+from analysis_tools.price_index import PriceIndex
+from analysis_tools.profiling import stage
+
+FILES_DIR = './files'
+CACHE_DIR_NAME = '.cache'
+
+FUNDING_BINANCE_COLUMNS = ['timestamp', 'token', 'funding_interval_hours', 'last_funding_rate']
+FUNDING_BYBIT_COLUMNS = ['timestamp', 'token', 'symbol', 'funding_rate']
+SPOT_COLUMNS = ['close_time', 'token', 'open_time', 'open', 'high', 'low', 'close', 'volume',
+                'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+# Hourly columns kept by the lean mode, the only ones read by the strategies
+LEAN_SPOT_COLUMNS = ['close_time', 'token', 'open_time', 'close']
+# Hourly columns stored as float32 by the lean mode (7 significant digits, enough for spot prices)
+LEAN_FLOAT32_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'quote_volume', 'taker_buy_volume',
+                        'taker_buy_quote_volume']
+FILE_NAMES = ['Binance_funding.csv', 'Bybit_funding.csv', 'Binance_hourly.csv']
+FRAME_NAMES = ['funding_rates_binance', 'funding_rates_bybit', 'spot_prices_binance']
+
 
 @dataclass()
 class Dataset:
     funding_rates_binance: pd.DataFrame
     funding_rates_bybit: pd.DataFrame
     spot_prices_binance: pd.DataFrame
+    # Prints of other exchanges by name (ie: okx), columns timestamp, token, funding_rate
+    funding_rates_others: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    # MinuteStore answering price_index() instead of spot_prices_binance, for minute resolution prices
+    minute_prices: Optional[Any] = field(default=None, repr=False)
+    # Files and options the frames were loaded with (set by loading_data), see version()
+    source: Optional[str] = field(default=None, repr=False)
+    _version: Optional[str] = field(default=None, repr=False, compare=False)
+    _price_indexes: Dict[str, PriceIndex] = field(default_factory=dict, repr=False, compare=False)
+    _funding_matrix: Optional[FundingMatrix] = field(default=None, repr=False, compare=False)
+
+    def price_index(self, time_column: str = "close_time") -> PriceIndex:
+        # Close prices indexed by time_column, built once and shared by every strategy
+        if time_column not in self._price_indexes:
+            if self.minute_prices is not None:
+                self._price_indexes[time_column] = self.minute_prices.price_index(time_column)
+            else:
+                self._price_indexes[time_column] = PriceIndex.from_spot_prices(self.spot_prices_binance, time_column)
+        return self._price_indexes[time_column]
+
+    def funding_frames(self, intervals: bool = False) -> Dict[str, pd.DataFrame]:
+        # Prints of each exchange with the rate in a funding_rate_<exchange> column (bybite for Bybit)
+        # Other exchanges only keep timestamp, token and their rate (and funding_interval_hours with intervals,
+        # for align_funding), so they add no column of the same name to the join
+        frames = {
+            "binance": self.funding_rates_binance.rename(columns={"last_funding_rate": FUNDING_RATE_PREFIX + "binance"}),
+            "bybite": self.funding_rates_bybit.rename(columns={"funding_rate": FUNDING_RATE_PREFIX + "bybite"}),
+        }
+        for exchange, funding_rates in self.funding_rates_others.items():
+            columns = ["timestamp", "token", FUNDING_RATE_PREFIX + exchange]
+            if intervals and "funding_interval_hours" in funding_rates.columns:
+                columns.append("funding_interval_hours")
+            frames[exchange] = funding_rates.rename(columns={"funding_rate": FUNDING_RATE_PREFIX + exchange})[columns]
+        return frames
+
+    def funding_matrix(self) -> FundingMatrix:
+        # Funding rates of every exchange as a timestamps x tokens x exchanges cube, built once
+        if self._funding_matrix is None:
+            frames = self.funding_frames()
+            self._funding_matrix = FundingMatrix.from_frames(
+                frames, {exchange: FUNDING_RATE_PREFIX + exchange for exchange in frames})
+        return self._funding_matrix
+
+    def memory_usage(self) -> pd.Series:
+        # Bytes used by each frame, strings included
+        return pd.Series({name: int(getattr(self, name).memory_usage(deep=True).sum()) for name in FRAME_NAMES})
+
+    def version(self) -> str:
+        # Hash identifying the data, from source or else from the content of the frames (computed once,
+        # the frames must not be modified afterwards)
+        if self._version is None:
+            frames = [self.source] if self.source is not None else [getattr(self, name) for name in FRAME_NAMES]
+            prices = [] if self.minute_prices is None else [self.minute_prices]
+            self._version = fingerprint(*frames, self.funding_rates_others, *prices)
+        return self._version
+
 
+def _read_csv(files_dir: str, file_name: str, parse_dates, use_cache: bool, usecols: Optional[List[int]] = None,
+              lean: bool = False, row_filter: Optional[RowFilter] = None) -> pd.DataFrame:
+    path = os.path.join(files_dir, file_name)
+    with stage(f"loading_data.{file_name}") as timed:
+        if use_cache:
+            df = read_csv_cached(path, parse_dates, os.path.join(files_dir, CACHE_DIR_NAME), usecols, lean, row_filter)
+        else:
+            df = read_csv_filtered(path, parse_dates, usecols, row_filter)
+        if lean:
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].astype("category")
+        timed.rows = len(df)
+    return df
 
-def loading_data() -> Dataset:
-    # Charger les fichiers CSV
-    funding_rates_binance = pd.read_csv('./files/Binance_funding.csv', parse_dates=['calc_time'])
-    funding_rates_bybit = pd.read_csv('./files/Bybit_funding.csv', parse_dates=['fundingRateTimestamp'])
-    spot_prices_binance = pd.read_csv('./files/Binance_hourly.csv', parse_dates=['close_time'])
 
-    spot_prices_binance["open_time"] = pd.to_datetime(spot_prices_binance["open_time"])
+def _to_float32(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    for column in df.columns.intersection(columns):
+        df[column] = df[column].astype(np.float32)
+    return df
+
+
+def loading_data(use_cache: bool = True, files_dir: str = FILES_DIR, lean: bool = False,
+                 start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                 tokens: Optional[List[str]] = None, minute_dir: Optional[str] = None) -> Dataset:
+    """
+    Load the funding and hourly files.
+    lean keeps only LEAN_SPOT_COLUMNS of the hourly file, stores tokens as categoricals and hourly prices
+    as float32. Timestamps stay datetime64[ns] (int64 epoch nanoseconds) and the funding columns keep
+    their dtypes, so compute_funding_dataframe returns the same frame in both modes.
+    start_date, end_date and tokens keep only the rows with start_date <= time < end_date (funding
+    timestamp, hourly close_time) of these tokens ('BTCUSDT', ...). The files are filtered while they
+    are read, chunk by chunk, so the memory used depends on the window and not on the size of the files.
+    minute_dir is a MinuteStore directory, the strategies then read their spot prices from its bars.
+    """
+    row_filter = None
+    if start_date is not None or end_date is not None or tokens is not None:
+        row_filter = RowFilter(start=start_date, end=end_date, tokens=tokens)
+
+    # Charger les fichiers CSV (via le cache binaire si use_cache)
+    spot_usecols = [SPOT_COLUMNS.index(column) for column in LEAN_SPOT_COLUMNS] if lean else None
+    funding_file, bybit_file, hourly_file = FILE_NAMES
+    funding_rates_binance = _read_csv(files_dir, funding_file, ['calc_time'], use_cache, lean=lean,
+                                      row_filter=row_filter)
+    funding_rates_bybit = _read_csv(files_dir, bybit_file, ['fundingRateTimestamp'], use_cache, lean=lean,
+                                    row_filter=row_filter)
+    spot_prices_binance = _read_csv(files_dir, hourly_file, ['close_time', 'open_time'], use_cache,
+                                    spot_usecols, lean, row_filter)
 
     # Renommer les colonnes pour faciliter la manipulation des données
-    funding_rates_binance.columns = ['timestamp', 'token', 'funding_interval_hours', 'last_funding_rate']
-    funding_rates_bybit.columns = ['timestamp', 'token', 'symbol', 'funding_rate']
-    spot_prices_binance.columns = ['close_time', 'token', 'open_time', 'open', 'high', 'low', 'close', 'volume',
-                                   'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+    funding_rates_binance.columns = FUNDING_BINANCE_COLUMNS
+    funding_rates_bybit.columns = FUNDING_BYBIT_COLUMNS
+    spot_prices_binance.columns = LEAN_SPOT_COLUMNS if lean else SPOT_COLUMNS
+
+    if lean:
+        spot_prices_binance = _to_float32(spot_prices_binance, LEAN_FLOAT32_COLUMNS)
 
     return Dataset(
         funding_rates_binance=funding_rates_binance,
         funding_rates_bybit=funding_rates_bybit,
         spot_prices_binance=spot_prices_binance,
+        minute_prices=_minute_store(minute_dir),
+        source=_files_source(files_dir, lean, start_date, end_date, tokens),
     )
+
+
+def _minute_store(minute_dir: Optional[str]):
+    if minute_dir is None:
+        return None
+    # minute_store reads the layout of the hourly file from this module
+    from analysis_tools.minute_store import MinuteStore
+    return MinuteStore(minute_dir)
+
+
+def _files_source(files_dir: str, *options) -> str:
+    # The files (path, size, modification time) and the options of loading_data
+    stats = [os.stat(os.path.join(files_dir, name)) for name in FILE_NAMES]
+    return fingerprint([(os.path.abspath(os.path.join(files_dir, name)), stat.st_size, stat.st_mtime_ns)
+                        for name, stat in zip(FILE_NAMES, stats)], *options)
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.profiling import stage
+
+# Longest holding period of the positions of a timestamp, the funding interval
+HOLD_PERIOD = pd.Timedelta(hours=8)
+# Hours marked at once, bounds the temporary hours x tokens arrays
+CHUNK_HOURS = 100_000
+PRICE_COLUMNS = ["low", "high", "close"]
+
+
+@dataclass()
+class MarginReport:
+    # One row by hourly bar opened while a position is held
+    hourly: pd.DataFrame
+    # margin_ratio under which the positions are liquidated, and the one kept by the allocation
+    liquidation_ratio: float
+    buffer_ratio: float
+
+    def breaches(self, ratio: Optional[float] = None) -> pd.DataFrame:
+        # Hours with a worst case margin_ratio under ratio, buffer_ratio by default
+        ratio = self.buffer_ratio if ratio is None else ratio
+        return self.hourly.loc[self.hourly["margin_ratio"] < ratio]
+
+    def summary(self) -> Dict:
+        hourly = self.hourly
+        worst = hourly["margin_ratio"].idxmin() if len(hourly) else None
+        return {
+            "hours": len(hourly),
+            "min_margin_ratio": float(hourly["margin_ratio"].min()),
+            "min_margin_time": None if worst is None else hourly.at[worst, "open_time"],
+            "buffer_breach_hours": int((hourly["margin_ratio"] < self.buffer_ratio).sum()),
+            "liquidation_hours": int((hourly["margin_ratio"] < self.liquidation_ratio).sum()),
+            "max_drawdown_usd": float(hourly["drawdown_usd"].min()),
+            "max_drawdown": float(hourly["drawdown"].min()),
+        }
+
+
+def monitor_margin(df: pd.DataFrame, ledger, spot_prices: pd.DataFrame, config,
+                   hold_period: pd.Timedelta = HOLD_PERIOD, chunk_hours: int = CHUNK_HOURS) -> MarginReport:
+    """
+    Hourly mark-to-market of the positions of a BestGain ledger (df is BestGain.df, the source of its lines).
+
+    The lines of each profitable timestamp are held until the next timestamp of df, and for hold_period at
+    most (a gap in the funding prints holds nothing), a timestamp that is not profitable holds nothing.
+    POSTED tokens are collateral worth collateral_value * price / required_collateral, INVESTED tokens
+    need quantity * price and the USDT line counts for its USD amount. Every hourly bar
+    opened while they are held is marked for all the tokens at once, with its low for the collateral and
+    its high for the needed amount (the worst case of the hour) and with its close for the excess margin.
+    margin_ratio is collateral / needed: the allocation keeps it above 1 / (1 - buffer_liquidation) at the
+    funding timestamp, under 1 the positions are liquidated. drawdown_usd is the fall of the excess margin
+    (collateral - needed at close) from its highest point of the holding period, drawdown the same as a
+    share of that highest point.
+    A missing bar takes the prices of the last bar of the token, a token without any bar yet counts for 0.
+    """
+    missing = [column for column in ["open_time"] + PRICE_COLUMNS if column not in spot_prices.columns]
+    if missing:
+        raise ValueError(f"spot_prices has no {missing} column, load the data without lean")
+
+    with stage("monitor_margin.positions"):
+        positions = _positions(df, ledger, config)
+    group_times = positions["times"]
+    hourly_columns = ["open_time", "timestamp", "collateral_usd", "needed_usd", "margin_ratio", "excess_usd",
+                      "drawdown_usd", "drawdown"]
+    buffer_ratio = 1 / (1 - config.buffer_liquidation)
+    if not len(group_times):
+        return MarginReport(pd.DataFrame(columns=hourly_columns), 1.0, buffer_ratio)
+
+    with stage("monitor_margin.prices") as timed:
+        hours, prices = _hourly_prices(spot_prices, ledger.tokens, group_times[0], group_times[-1] + hold_period)
+        timed.rows = len(hours)
+    groups = np.searchsorted(group_times, hours, side="right") - 1
+    # Bars opened hold_period or more after their timestamp are not held
+    in_period = hours - group_times[groups] < np.timedelta64(pd.Timedelta(hold_period))
+
+    with stage("monitor_margin.mark") as timed:
+        collateral = np.empty(len(hours))
+        needed = np.empty(len(hours))
+        excess = np.empty(len(hours))
+        for start in range(0, len(hours), chunk_hours):
+            rows = slice(start, start + chunk_hours)
+            posted, invested = positions["posted"][groups[rows]], positions["invested"][groups[rows]]
+            collateral[rows] = np.einsum("hk,hk->h", prices["low"][rows], posted)
+            needed[rows] = np.einsum("hk,hk->h", prices["high"][rows], invested)
+            excess[rows] = (np.einsum("hk,hk->h", prices["close"][rows], posted)
+                            - np.einsum("hk,hk->h", prices["close"][rows], invested))
+        collateral += positions["usdt_posted"][groups]
+        needed += positions["usdt_invested"][groups]
+        excess += positions["usdt_posted"][groups] - positions["usdt_invested"][groups]
+        timed.rows = len(hours)
+
+    held = (needed > 0) & in_period
+    hourly = pd.DataFrame({
+        "open_time": hours[held],
+        "timestamp": group_times[groups[held]],
+        "collateral_usd": collateral[held],
+        "needed_usd": needed[held],
+        "margin_ratio": collateral[held] / needed[held],
+        "excess_usd": excess[held],
+    })
+    peak = hourly["excess_usd"].groupby(groups[held]).cummax().to_numpy()
+    hourly["drawdown_usd"] = hourly["excess_usd"] - peak
+    hourly["drawdown"] = np.where(peak > 0, hourly["drawdown_usd"] / np.where(peak > 0, peak, 1), np.nan)
+    return MarginReport(hourly, 1.0, buffer_ratio)
+
+
+def _positions(df: pd.DataFrame, ledger, config) -> Dict[str, np.ndarray]:
+    # Positions of every timestamp of df: tokens posted (USD by unit of price) and invested (quantities)
+    # as timestamps x tokens arrays, USDT line amounts by timestamp, all 0 when the timestamp is not profitable
+    n = len(ledger)
+    held = ledger.is_profitable[:n]
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    times = np.unique(timestamps)
+    group_codes = np.searchsorted(times, timestamps[ledger.source[:n]][held])
+    token_code = ledger.token_code[:n][held]
+    is_usdt = ledger.is_usdt[:n][held]
+    is_invested = ledger.is_invested[:n][held]
+    values = {column: values[:n][held] for column, values in ledger.values.items()}
+
+    shape = (len(times), len(ledger.tokens))
+    posted = np.zeros(shape)
+    invested = np.zeros(shape)
+    is_posted_token = ~is_invested & ~is_usdt
+    is_invested_token = is_invested & ~is_usdt
+    np.add.at(posted, (group_codes[is_posted_token], token_code[is_posted_token]),
+              values["collateral_value"][is_posted_token] / config.required_collateral)
+    np.add.at(invested, (group_codes[is_invested_token], token_code[is_invested_token]),
+              values["current_quantity_hold"][is_invested_token])
+    return {
+        "times": times,
+        "posted": posted,
+        "invested": invested,
+        "usdt_posted": np.bincount(group_codes, weights=np.where(~is_invested & is_usdt, values["collateral_value_usd"], 0),
+                                   minlength=len(times)),
+        "usdt_invested": np.bincount(group_codes, weights=np.where(is_invested & is_usdt, values["collateral_needed_usd"], 0),
+                                     minlength=len(times)),
+    }
+
+
+def _hourly_prices(spot_prices: pd.DataFrame, tokens, start, end):
+    # Hourly low, high and close as hours x tokens arrays (tokens in ledger order) for the bars opened in [start, end)
+    token_codes = pd.Index(tokens).get_indexer(spot_prices["token"])
+    open_time = spot_prices["open_time"].to_numpy(dtype="datetime64[ns]")
+    keep = np.flatnonzero((token_codes >= 0) & (open_time >= np.datetime64(start, "ns")) & (open_time < np.datetime64(end, "ns")))
+    hour_codes, hours = pd.factorize(open_time[keep].view("int64"), sort=True)
+    token_codes = token_codes[keep]
+    cells = hour_codes * len(tokens) + token_codes
+    if np.bincount(cells, minlength=len(hours) * len(tokens)).max(initial=0) > 1:
+        # The first bar wins when a (token, open_time) pair is duplicated
+        _, first = np.unique(cells, return_index=True)
+        keep, hour_codes, token_codes = keep[first], hour_codes[first], token_codes[first]
+    prices = {}
+    for column in PRICE_COLUMNS:
+        matrix = np.full((len(hours), len(tokens)), np.nan)
+        matrix[hour_codes, token_codes] = spot_prices[column].to_numpy(dtype=float)[keep]
+        prices[column] = np.nan_to_num(pd.DataFrame(matrix, copy=False).ffill().to_numpy(), nan=0.0)
+    return hours.view("datetime64[ns]"), prices
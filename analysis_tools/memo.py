@@ -0,0 +1,221 @@
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Set to 1 to turn the memo on (main.py --memo does the same), it is off by default
+MEMO_ENV = "BACKTEST_MEMO"
+# In the files directory of the repository, whatever the working directory
+MEMO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "files", ".cache", "memo")
+MEMORY_ENTRIES = 32
+DISK_BYTES = 2 * 2 ** 30
+# Bump when the memoized functions change in a way their source file does not show
+MEMO_VERSION = 1
+
+
+def fingerprint(*parts) -> str:
+    """
+    Hash of the values of parts: frames by content (hash_pandas_object, index, columns and dtypes
+    included), dataclasses by their fields, dicts and lists by their items, anything else by repr.
+    Objects with a version() method (Dataset) are hashed by it.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        _update(digest, part)
+    return digest.hexdigest()
+
+
+def _update(digest, value):
+    if hasattr(value, "version") and callable(value.version):
+        digest.update(b"version:" + value.version().encode())
+    elif isinstance(value, pd.DataFrame):
+        digest.update(b"frame:" + repr((list(value.columns), [str(dtype) for dtype in value.dtypes])).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, (pd.Series, pd.Index)):
+        digest.update(b"series:" + str(value.dtype).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(b"array:" + value.dtype.str.encode() + repr(value.shape).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif is_dataclass(value):
+        digest.update(b"dataclass:" + type(value).__qualname__.encode())
+        for field in fields(value):
+            if not field.name.startswith("_"):
+                _update(digest, (field.name, getattr(value, field.name)))
+    elif isinstance(value, dict):
+        digest.update(b"dict:")
+        for key in sorted(value, key=repr):
+            _update(digest, (key, value[key]))
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}:{len(value)}".encode())
+        for item in value:
+            _update(digest, item)
+    else:
+        digest.update(b"value:" + repr(value).encode())
+
+
+def source_fingerprint(source) -> str:
+    # Hash of the source file of a function or a module, or of every module of a package, a memoized value
+    # is computed again when one of them is edited
+    if hasattr(source, "__path__"):
+        paths = sorted(os.path.join(directory, name) for directory in source.__path__
+                       for name in os.listdir(directory) if name.endswith(".py"))
+    else:
+        paths = [inspect.getsourcefile(source)]
+    digest = hashlib.sha1(str(MEMO_VERSION).encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode() + f.read())
+    return digest.hexdigest()
+
+
+class Memo:
+    """
+    Results by key, kept in memory (the memory_entries last used) and pickled in directory (the last
+    used up to disk_bytes, the least recently read files are removed first).
+
+    Values are frames that callers modify, so a copy is returned and a copy is stored. Files are
+    written in a temporary file then renamed, several processes (sweeps) can share directory.
+    directory None keeps results in memory only.
+    """
+
+    def __init__(self, directory: Optional[str] = MEMO_DIR, memory_entries: int = MEMORY_ENTRIES,
+                 disk_bytes: int = DISK_BYTES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+            value = compute()
+            self._put(key, value)
+        else:
+            self.hits += 1
+        return _copy(value)
+
+    def clear(self):
+        self._memory.clear()
+        for path in self._files():
+            _remove(path)
+
+    def _get(self, key: str) -> Any:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # The access time used by the eviction
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def _put(self, key: str, value: Any):
+        value = _copy(value)
+        self._remember(key, value)
+        path = self._path(key)
+        if path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            _remove(tmp_path)
+            return
+        self._evict()
+
+    def _remember(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # Least recently read files first, until the directory fits in disk_bytes
+        entries = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def _files(self):
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".pkl")]
+
+    def _path(self, key: str) -> Optional[str]:
+        return None if self.directory is None else os.path.join(self.directory, f"{key}.pkl")
+
+
+def _copy(value: Any) -> Any:
+    return value.copy() if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) else value
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Memo of the running process, None when memoization is off
+_memo: Optional[Memo] = Memo() if os.environ.get(MEMO_ENV, "0") == "1" else None
+
+
+def enable(memo: Optional[Memo] = None) -> Memo:
+    global _memo
+    _memo = memo or Memo()
+    return _memo
+
+
+def disable() -> Optional[Memo]:
+    global _memo
+    memo, _memo = _memo, None
+    return memo
+
+
+def get_memo() -> Optional[Memo]:
+    return _memo
+
+
+def memoize(function: Callable, *args, sources: Iterable = ()) -> Any:
+    """
+    function(*args), or its result saved for the same args (see fingerprint) and the same source files
+    of function, of the analysis_tools package and of sources, the other modules it depends on.
+    Nothing is hashed when the memo is off.
+    """
+    if _memo is None:
+        return function(*args)
+    package = sys.modules[__name__.rpartition(".")[0]]
+    key = fingerprint(function.__module__, function.__qualname__,
+                      [source_fingerprint(source) for source in (function, package, *sources)], *args)
+    return _memo.get_or_compute(key, lambda: function(*args))
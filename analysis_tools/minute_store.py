@@ -0,0 +1,209 @@
+import json
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.loading_data import FILES_DIR, SPOT_COLUMNS
+from analysis_tools.memo import fingerprint
+
+MINUTE_DIR = os.path.join(FILES_DIR, "minute")
+META_FILE = "meta.json"
+# Bump when the layout of a token directory changes
+STORE_VERSION = 1
+TIME_COLUMN = "open_time"
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+# Rows read at once by import_csv
+CHUNK_ROWS = 1_000_000
+
+
+class MinuteStore:
+    """
+    Bars (open_time, open, high, low, close, volume) of each token in one directory by token under root:
+    one raw binary file by column, open_time as int64 nanoseconds sorted ascending, and a meta.json with
+    the number of rows. Columns are memory-mapped, a query reads the pages it touches only: a range is a
+    view found by binary search on open_time, as-of lookups are binary searches too.
+
+    Tokens only grow by append (newer bars), readers map the rows of meta.json so a token stays readable
+    while it is appended to. interval is the length of a bar, the close_time of a bar is open_time + interval.
+    """
+
+    def __init__(self, root: str = MINUTE_DIR, interval: pd.Timedelta = pd.Timedelta(minutes=1)):
+        self.root = root
+        self.interval = np.timedelta64(pd.Timedelta(interval))
+        # Memory maps by token, with the rows they were opened with
+        self._maps: Dict[str, Dict[str, np.ndarray]] = {}
+        self._price_indexes: Dict[tuple, "StorePriceIndex"] = {}
+
+    def tokens(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, name, META_FILE)))
+
+    def rows(self, token: str) -> int:
+        meta = self._meta(token)
+        return 0 if meta is None else meta["rows"]
+
+    def bars(self, token: str) -> Dict[str, np.ndarray]:
+        # Read-only memory maps of the columns of token, open_time as datetime64[ns]
+        rows = self.rows(token)
+        maps = self._maps.get(token)
+        if maps is None or len(maps[TIME_COLUMN]) != rows:
+            maps = {column: self._map(token, column, rows) for column in [TIME_COLUMN] + BAR_COLUMNS}
+            maps[TIME_COLUMN] = maps[TIME_COLUMN].view("datetime64[ns]")
+            self._maps[token] = maps
+        return maps
+
+    def range(self, token: str, start=None, end=None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        # Bars opened in [start, end), indexed by open_time, the columns are views on the memory maps
+        bars = self.bars(token)
+        times = bars[TIME_COLUMN]
+        first = 0 if start is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(start), "ns")))
+        last = len(times) if end is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(end), "ns")))
+        return pd.DataFrame({column: bars[column][first:last] for column in columns or BAR_COLUMNS},
+                            index=pd.DatetimeIndex(times[first:last], name=TIME_COLUMN), copy=False)
+
+    def lookup(self, tokens, times, column: str = "close") -> np.ndarray:
+        # Value of the bar of each token opened exactly at each time, NaN when there is none
+        return self._search(tokens, times, column, exact=True)
+
+    def has_bar(self, tokens, times) -> np.ndarray:
+        # Whether each token has a bar opened exactly at each time, even with NaN values
+        return self._search(tokens, times, None, exact=True)
+
+    def asof(self, tokens, times, column: str = "close", tolerance=None) -> np.ndarray:
+        # Value of the last bar of each token opened at or before each time, NaN when there is none or
+        # when it was opened more than tolerance before
+        return self._search(tokens, times, column, exact=False, tolerance=tolerance)
+
+    def price_index(self, time_column: str = "close_time", column: str = "close") -> "StorePriceIndex":
+        # Lookups with the interface of PriceIndex (see Dataset.price_index)
+        key = (time_column, column)
+        if key not in self._price_indexes:
+            self._price_indexes[key] = StorePriceIndex(self, time_column, column)
+        return self._price_indexes[key]
+
+    def version(self) -> str:
+        # Hash of the root and of the rows of each token, changes when bars are appended
+        return fingerprint(os.path.abspath(self.root), str(self.interval), STORE_VERSION,
+                           [(token, self.rows(token)) for token in self.tokens()])
+
+    def append(self, token: str, bars: pd.DataFrame) -> int:
+        """
+        Add the bars (open_time and BAR_COLUMNS columns) of token newer than its last stored bar,
+        returns the number of bars added. Duplicated open_time keep their last bar.
+        The columns are appended first, then meta.json is replaced: a failed append leaves the token
+        as it was, the extra bytes are cut by the next append.
+        """
+        times = pd.to_datetime(bars[TIME_COLUMN]).to_numpy(dtype="datetime64[ns]").view("int64")
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        # Last bar of each duplicated time
+        keep = np.append(times[1:] != times[:-1], True) if len(times) else np.zeros(0, dtype=bool)
+        meta = self._meta(token) or {"version": STORE_VERSION, "rows": 0, "last": None}
+        if meta["last"] is not None:
+            keep &= times > meta["last"]
+        rows = order[keep]
+        if len(rows) == 0:
+            return 0
+
+        token_dir = os.path.join(self.root, token)
+        os.makedirs(token_dir, exist_ok=True)
+        values = {TIME_COLUMN: times[keep]}
+        values.update({column: bars[column].to_numpy(dtype=np.float64)[rows] for column in BAR_COLUMNS})
+        for column, data in values.items():
+            path = self._path(token, column)
+            with open(path, "ab") as f:
+                # Bytes of a failed append after the rows of meta.json
+                f.truncate(meta["rows"] * data.itemsize)
+                f.write(np.ascontiguousarray(data).tobytes())
+        meta = {"version": STORE_VERSION, "rows": meta["rows"] + len(rows), "last": int(values[TIME_COLUMN][-1])}
+        fd, tmp_path = tempfile.mkstemp(dir=token_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(token_dir, META_FILE))
+        return len(rows)
+
+    def import_csv(self, path: str, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+        """
+        Append the bars of a CSV in the layout of Binance_hourly.csv (one token column, several tokens),
+        streamed chunk_rows rows at a time, the rows of each token must be in time order.
+        Bars already stored are skipped, importing a file again adds nothing. Returns the bars added by token.
+        """
+        added: Dict[str, int] = {}
+        usecols = [SPOT_COLUMNS.index(column) for column in ["token", TIME_COLUMN] + BAR_COLUMNS]
+        chunks = pd.read_csv(path, header=0, names=SPOT_COLUMNS, usecols=usecols, parse_dates=[TIME_COLUMN],
+                             chunksize=chunk_rows)
+        for chunk in chunks:
+            for token, bars in chunk.groupby("token", sort=False):
+                added[token] = added.get(token, 0) + self.append(token, bars)
+        return added
+
+    def _search(self, tokens, times, column: Optional[str], exact: bool, tolerance=None) -> np.ndarray:
+        # Values of column, or whether a bar is found when column is None
+        times = np.asarray(times, dtype="datetime64[ns]")
+        codes, uniques = pd.factorize(pd.Series(tokens).to_numpy())
+        values = np.full(len(times), np.nan) if column is not None else np.zeros(len(times), dtype=bool)
+        for code, token in enumerate(uniques):
+            if self.rows(token) == 0:
+                continue
+            bars = self.bars(token)
+            bar_times = bars[TIME_COLUMN]
+            where = np.flatnonzero(codes == code)
+            wanted = times[where]
+            rows = np.searchsorted(bar_times, wanted, side="right") - 1
+            found = rows >= 0
+            if exact:
+                found[found] = bar_times[rows[found]] == wanted[found]
+            elif tolerance is not None:
+                found[found] = wanted[found] - bar_times[rows[found]] <= np.timedelta64(pd.Timedelta(tolerance))
+            values[where[found]] = bars[column][rows[found]] if column is not None else True
+        return values
+
+    def _meta(self, token: str) -> Optional[Dict]:
+        path = os.path.join(self.root, token, META_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _path(self, token: str, column: str) -> str:
+        return os.path.join(self.root, token, f"{column}.bin")
+
+    def _map(self, token: str, column: str, rows: int) -> np.ndarray:
+        dtype = np.int64 if column == TIME_COLUMN else np.float64
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(token, column), dtype=dtype, mode="r", shape=(rows,))
+
+
+class StorePriceIndex:
+    """
+    lookup, has_bar, asof and get of PriceIndex answered from a MinuteStore, nothing is loaded in memory.
+    A close_time index finds the bar closed at the time (opened one interval before), an open_time
+    index the bar opened at the time, column is the value returned (close by default, like PriceIndex).
+    """
+
+    def __init__(self, store: MinuteStore, time_column: str = "close_time", column: str = "close"):
+        if time_column not in ("open_time", "close_time"):
+            raise ValueError(f"Unknown time column {time_column}, expected 'open_time' or 'close_time'")
+        self.store = store
+        self.column = column
+        self._shift = store.interval if time_column == "close_time" else np.timedelta64(0, "ns")
+
+    def lookup(self, tokens, times) -> np.ndarray:
+        return self.store.lookup(tokens, np.asarray(times, dtype="datetime64[ns]") - self._shift, self.column)
+
+    def has_bar(self, tokens, times) -> np.ndarray:
+        return self.store.has_bar(tokens, np.asarray(times, dtype="datetime64[ns]") - self._shift)
+
+    def asof(self, tokens, times, tolerance=None) -> np.ndarray:
+        return self.store.asof(tokens, np.asarray(times, dtype="datetime64[ns]") - self._shift, self.column, tolerance)
+
+    def get(self, token: str, time) -> float:
+        price = self.lookup([token], [np.datetime64(pd.Timestamp(time), "ns")])[0]
+        if np.isnan(price):
+            raise KeyError(f"No price for {token} at {time}")
+        return float(price)
@@ -0,0 +1,25 @@
+from typing import Dict, Optional
+
+import matplotlib
+
+
+def plot_gains(gains: Dict[str, float], title: str, path: Optional[str] = None):
+    """
+    Bar chart of the USD gain by token, saved to path (no display needed) or shown.
+    Only imported by main.py --plot, matplotlib is not loaded otherwise.
+    """
+    if path:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.bar(list(gains), list(gains.values()))
+    ax.axhline(0, color="black", linewidth=0.8)
+    ax.set_title(title)
+    ax.set_ylabel("gain ($)")
+    fig.tight_layout()
+    if path:
+        fig.savefig(path)
+        plt.close(fig)
+    else:
+        plt.show()
@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class PriceIndex:
+    """
+    Dense timestamps x tokens matrix of spot prices, built once from the hourly data.
+
+    Tokens are stored as integer codes (their column in the matrix) and timestamps are sorted, so a
+    price is found with a dict lookup (get), a binary search for batches (lookup), the last known
+    price for as-of queries (asof) or a view on consecutive rows (range).
+    Missing (timestamp, token) pairs are NaN in the matrix, has_bar tells them from bars with a NaN price.
+    """
+
+    def __init__(self, times: np.ndarray, tokens: List[str], prices: np.ndarray, bars: Optional[np.ndarray] = None):
+        self.times = np.asarray(times, dtype="datetime64[ns]")
+        self.tokens = list(tokens)
+        self.prices = prices
+        # Pairs with a row in the hourly data, the prices that are not NaN by default
+        self.bars = ~np.isnan(prices) if bars is None else bars
+        self._token_index = pd.Index(self.tokens)
+        self._token_codes: Dict[str, int] = {token: code for code, token in enumerate(self.tokens)}
+        self._time_rows: Optional[Dict[int, int]] = None
+        self._last_rows: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_spot_prices(cls, spot_prices: pd.DataFrame, time_column: str = "close_time",
+                         value_column: str = "close") -> "PriceIndex":
+        # The first row wins when a (token, time) pair is duplicated
+        prices = spot_prices.dropna(subset=["token", time_column]).drop_duplicates(subset=["token", time_column])
+        time_codes, times = pd.factorize(prices[time_column], sort=True)
+        token_codes, tokens = pd.factorize(prices["token"], sort=True)
+        matrix = np.full((len(times), len(tokens)), np.nan)
+        matrix[time_codes, token_codes] = prices[value_column].to_numpy(dtype=float)
+        bars = np.zeros(matrix.shape, dtype=bool)
+        bars[time_codes, token_codes] = True
+        return cls(np.asarray(times, dtype="datetime64[ns]"), tokens.tolist(), matrix, bars)
+
+    def token_codes(self, tokens) -> np.ndarray:
+        # -1 for unknown tokens
+        return self._token_index.get_indexer(tokens)
+
+    def time_rows(self, times) -> np.ndarray:
+        # Row of each timestamp, -1 when the timestamp is not in the index
+        times = np.asarray(times, dtype="datetime64[ns]")
+        rows = np.searchsorted(self.times, times)
+        found = rows < len(self.times)
+        found[found] = self.times[rows[found]] == times[found]
+        return np.where(found, rows, -1)
+
+    def get(self, token: str, time) -> float:
+        if self._time_rows is None:
+            self._time_rows = {t: row for row, t in enumerate(self.times.view("int64").tolist())}
+        row = self._time_rows.get(int(np.datetime64(time, "ns").view("int64")))
+        code = self._token_codes.get(token)
+        if row is None or code is None or np.isnan(self.prices[row, code]):
+            raise KeyError(f"No price for {token} at {time}")
+        return float(self.prices[row, code])
+
+    def lookup(self, tokens, times) -> np.ndarray:
+        # Price of each (token, time) pair, NaN when missing
+        return self._take(self.prices, self.time_rows(times), self.token_codes(tokens))
+
+    def has_bar(self, tokens, times) -> np.ndarray:
+        # Whether each (token, time) pair has a row in the hourly data, even with a NaN price
+        return self._take(self.bars, self.time_rows(times), self.token_codes(tokens), False)
+
+    def asof(self, tokens, times, tolerance=None) -> np.ndarray:
+        # Last known price at or before each time, NaN when there is none or when it is older than tolerance
+        if self._last_rows is None:
+            # Row of the last known price of each token at each row, -1 before the first price
+            rows = np.where(np.isnan(self.prices), -1, np.arange(len(self.times))[:, None])
+            self._last_rows = np.maximum.accumulate(rows, axis=0) if len(rows) else rows
+        times = np.asarray(times, dtype="datetime64[ns]")
+        rows = np.searchsorted(self.times, times, side="right") - 1
+        codes = self.token_codes(tokens)
+        price_rows = np.full(len(rows), -1)
+        found = (rows >= 0) & (codes >= 0)
+        price_rows[found] = self._last_rows[rows[found], codes[found]]
+        if tolerance is not None:
+            known = price_rows >= 0
+            known[known] = times[known] - self.times[price_rows[known]] <= np.timedelta64(pd.Timedelta(tolerance))
+            price_rows[~known] = -1
+        return self._take(self.prices, price_rows, codes)
+
+    def range(self, start=None, end=None, tokens: Optional[List[str]] = None) -> pd.DataFrame:
+        # Prices between start and end (both included), a view on the matrix when tokens is None
+        first = 0 if start is None else np.searchsorted(self.times, np.datetime64(start, "ns"), side="left")
+        last = len(self.times) if end is None else np.searchsorted(self.times, np.datetime64(end, "ns"), side="right")
+        prices = pd.DataFrame(self.prices[first:last], index=pd.DatetimeIndex(self.times[first:last]),
+                              columns=self.tokens, copy=False)
+        return prices if tokens is None else prices[tokens]
+
+    @staticmethod
+    def _take(matrix: np.ndarray, rows: np.ndarray, codes: np.ndarray, missing=np.nan) -> np.ndarray:
+        found = (rows >= 0) & (codes >= 0)
+        values = np.full(len(rows), missing, dtype=matrix.dtype)
+        values[found] = matrix[rows[found], codes[found]]
+        return values
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+# Path of the trace written by run_backtest, profiling is off when unset
+PROFILE_ENV = "BACKTEST_PROFILE"
+# Set to 0 to skip the peak memory (tracemalloc slows the run down)
+PROFILE_MEMORY_ENV = "BACKTEST_PROFILE_MEMORY"
+
+
+class _NullStage:
+    # Returned by stage() when profiling is off, setting rows on it is a no-op
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    def __init__(self, profiler: "Profiler", name: str):
+        self._profiler = profiler
+        self.name = name
+        # Number of rows produced by the stage, set by the caller
+        self.rows: Optional[int] = None
+        self.peak = 0
+        self.start_wall = 0.0
+        self.start_cpu = 0.0
+
+    def __enter__(self):
+        self._profiler._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._profiler._exit(self)
+        return False
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, peak traced memory and row count of nested stages.
+
+    Stages are opened with stage() in a with block. The peak memory of a stage includes its sub-stages
+    and is the highest memory traced by tracemalloc while it runs. The records are written as a
+    Chrome trace (chrome://tracing, Perfetto), the measures are in the args of each event.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.records: List[Dict] = []
+        self._stack: List[Stage] = []
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    def stage(self, name: str) -> Stage:
+        return Stage(self, name)
+
+    def _enter(self, stage: Stage):
+        if self.trace_memory:
+            # The peak reached so far belongs to the parent, then the peak restarts for the new stage
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(stage)
+        stage.start_cpu = time.process_time()
+        stage.start_wall = time.perf_counter()
+
+    def _exit(self, stage: Stage):
+        wall = time.perf_counter() - stage.start_wall
+        cpu = time.process_time() - stage.start_cpu
+        self._stack.pop()
+        record = {
+            "name": stage.name,
+            "depth": len(self._stack),
+            "start_s": stage.start_wall - self._origin,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "rows": stage.rows,
+        }
+        if self.trace_memory:
+            stage.peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, stage.peak)
+            record["peak_memory_mb"] = stage.peak / 2 ** 20
+        self.records.append(record)
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def chrome_trace(self) -> Dict:
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [{
+                "name": record["name"],
+                "cat": "stage",
+                "ph": "X",
+                "ts": record["start_s"] * 1e6,
+                "dur": record["wall_s"] * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": {key: value for key, value in record.items() if key not in ("name", "start_s")},
+            } for record in sorted(self.records, key=lambda r: r["start_s"])],
+        }
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, indent=1)
+
+
+# Profiler of the running process, None when profiling is off
+_profiler: Optional[Profiler] = None
+
+
+def enable(trace_memory: bool = True) -> Profiler:
+    global _profiler
+    if _profiler is not None:
+        _profiler.close()
+    _profiler = Profiler(trace_memory)
+    return _profiler
+
+
+def disable() -> Optional[Profiler]:
+    # Stop profiling and return the profiler with its records
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+def stage(name: str):
+    # Context manager timing a stage, nearly free when profiling is off
+    if _profiler is None:
+        return _NULL_STAGE
+    return _profiler.stage(name)
+
+
+def load_trace(path: str) -> List[Dict]:
+    # Records of a trace written by Profiler.write
+    with open(path) as f:
+        trace = json.load(f)
+    return [{"name": event["name"], **event["args"]} for event in trace["traceEvents"]]
@@ -0,0 +1,96 @@
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.loading_data import Dataset
+
+# Frames of the Dataset the BestGain workers read
+DATASET_FRAMES = ["funding_rates_binance", "funding_rates_bybit", "spot_prices_binance"]
+
+
+class SharedFrames:
+    """
+    Copy DataFrames into shared memory blocks so worker processes can read them without pickling.
+
+    share() returns a small picklable spec, attach_frame() rebuilds a read-only DataFrame on top of
+    the shared blocks in the worker. String columns are shared as the integer codes of a Categorical,
+    their categories go into the spec, and come back as a Categorical over the shared codes: no worker
+    copies the strings. The owner must call close() once the workers are done.
+    """
+
+    def __init__(self):
+        self._blocks: List[shared_memory.SharedMemory] = []
+
+    def share(self, df: pd.DataFrame) -> List[Dict]:
+        spec = []
+        for column in df.columns:
+            values = df[column]
+            categories = None
+            if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+                # The codes keep the smallest integer dtype of a Categorical, from_codes does not copy them
+                categorical = pd.Categorical(values)
+                array = categorical.codes
+                categories = categorical.categories.tolist()
+            else:
+                array = values.to_numpy()
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            spec.append({
+                "name": column,
+                "block": block.name,
+                "dtype": array.dtype.str,
+                "length": len(array),
+                "categories": categories,
+            })
+        return spec
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach_frame(spec: List[Dict], blocks: List[shared_memory.SharedMemory]) -> pd.DataFrame:
+    # blocks keeps the attached segments alive as long as the caller needs the frame
+    data = {}
+    for column in spec:
+        block = shared_memory.SharedMemory(name=column["block"])
+        blocks.append(block)
+        array = np.ndarray((column["length"],), dtype=np.dtype(column["dtype"]), buffer=block.buf)
+        array.flags.writeable = False
+        if column["categories"] is not None:
+            array = pd.Categorical.from_codes(array, column["categories"])
+        data[column["name"]] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def share_backtest_inputs(shared: SharedFrames, dataset: Dataset, funding_df: pd.DataFrame) -> Tuple:
+    # Picklable arguments of attach_backtest_inputs, for the initializer of a process pool
+    dataset_spec = {name: shared.share(getattr(dataset, name)) for name in DATASET_FRAMES}
+    return dataset_spec, dataset.source, shared.share(funding_df)
+
+
+def attach_backtest_inputs(worker: Dict, dataset_spec, dataset_source, funding_spec):
+    # Sets the dataset, funding_df and the blocks keeping them alive in the state of a worker process
+    blocks = []
+    worker["blocks"] = blocks
+    # The source of the loaded dataset keeps its version (see memo) without hashing the frames
+    worker["dataset"] = Dataset(**{name: attach_frame(spec, blocks) for name, spec in dataset_spec.items()},
+                                source=dataset_source)
+    worker["funding_df"] = attach_frame(funding_spec, blocks)
+
+
+def pnl_by_token_columns(recap: Dict) -> Dict[str, float]:
+    # pnl_<token> columns of a row of report from the recap of BestGain.apply_stats
+    pnl_by_token = recap["pnl_by_token"]
+    return {f"pnl_{token}": pnl for token, pnl in zip(pnl_by_token["token"], pnl_by_token["gain_with_fee"])}
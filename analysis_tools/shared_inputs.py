@@ -0,0 +1,68 @@
+import threading
+from typing import Any, Callable, Hashable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.funding_tools import best_funding, funding_exchanges, funding_rates
+
+
+class SharedInputs:
+    """
+    Intermediates of funding_df used by several strategies, computed once on first use and shared
+    read-only: arrays are returned with writeable=False, frames must not be modified by their readers.
+    Values are computed under a lock, strategies running in threads can share one SharedInputs.
+    Strategies given none build their own, so running a strategy alone does not change.
+    """
+
+    def __init__(self, funding_df: pd.DataFrame, config):
+        self.funding_df = funding_df
+        self.config = config
+        self._values = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        # Value of key, computed the first time it is asked for
+        with self._lock:
+            if key not in self._values:
+                value = compute()
+                for array in value if isinstance(value, tuple) else (value,):
+                    if isinstance(array, np.ndarray):
+                        array.flags.writeable = False
+                self._values[key] = value
+            return self._values[key]
+
+    @property
+    def exchanges(self) -> List[str]:
+        return self.get("exchanges", lambda: funding_exchanges(self.funding_df))
+
+    @property
+    def rates(self) -> np.ndarray:
+        # (rows, exchanges) funding rates, exchanges in the order of self.exchanges
+        return self.get("rates", lambda: funding_rates(self.funding_df, self.exchanges))
+
+    @property
+    def best(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Exchange paying the highest rate of each row and that rate (see best_funding)
+        return self.get("best", lambda: best_funding(self.rates))
+
+    @property
+    def gain_per_unit(self) -> np.ndarray:
+        # (rows, exchanges) funding earned by unit of token held, 0 where the perp is bought long
+        return self.get("gain_per_unit", self._gain_per_unit)
+
+    @property
+    def quantity_hold(self) -> np.ndarray:
+        return self.get("quantity_hold", lambda: self.funding_df["current_quantity_hold"].to_numpy(dtype=float))
+
+    def _gain_per_unit(self) -> np.ndarray:
+        is_long = np.column_stack([self.funding_df[f"is_buy_long_perp_{exchange}"].to_numpy(dtype=bool)
+                                   for exchange in self.exchanges])
+        return np.where(is_long, 0, self.rates)
+
+    def prepare(self) -> "SharedInputs":
+        # Computes the common values at once, before they are read by several threads
+        self.best
+        self.gain_per_unit
+        self.quantity_hold
+        return self
@@ -0,0 +1,64 @@
+"""
+Compare the loop and vectorized engines of BestGain.apply on the bundled data.
+
+Run from the repository root:
+    python -m benchmarks.best_gain_engines
+"""
+import argparse
+import time
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+from analysis_tools import memo
+from analysis_tools.compute_data import compute_funding_dataframe
+from analysis_tools.loading_data import loading_data
+from model.config import Config
+from static_data import START_TIME, END_TIME, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
+from strategy.best_gain import BestGain, ENGINE_LOOP, ENGINE_VECTORIZED
+
+
+def _time_engine(funding_df, config, engine, repeat):
+    best = None
+    strat = None
+    for _ in range(repeat):
+        strat = BestGain(funding_df, config, INVENTORY, INIT_QUANTITY, HAIRCUTS)
+        start = time.perf_counter()
+        strat.apply(engine=engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, strat.result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    # Time the computations, not the memo
+    memo.disable()
+
+    dataset = loading_data()
+    config = Config(
+        dataset=dataset,
+        start_date=datetime.strptime(START_TIME, "%d-%m-%Y"),
+        end_date=datetime.strptime(END_TIME, "%d-%m-%Y"),
+    )
+    funding_df = compute_funding_dataframe(dataset, INVENTORY, INITIAL_PRICES)
+
+    loop_time, loop_result = _time_engine(funding_df, config, ENGINE_LOOP, args.repeat)
+    vectorized_time, vectorized_result = _time_engine(funding_df, config, ENGINE_VECTORIZED, args.repeat)
+
+    # Both engines build the same typed result frame from their ledger
+    pd.testing.assert_frame_equal(vectorized_result, loop_result, check_dtype=True, check_exact=True)
+
+    print(f"rows {len(funding_df)}, timestamps {funding_df['timestamp'].nunique()}\n"
+          f"      loop {loop_time:.3f} s\n"
+          f"vectorized {vectorized_time:.3f} s\n"
+          f"   speedup {loop_time / vectorized_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Replay the bundled data as live events through BestGainOnline and check that every decision
+matches the batch BestGain.apply().
+
+The Bybit file has a few funding prints twice: the batch joins count them twice while the online
+evaluator keeps one print per (token, exchange), so both run on the data without duplicates.
+
+Run from the repository root:
+    python -m benchmarks.best_gain_online
+"""
+import time
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+from analysis_tools.compute_data import compute_funding_dataframe
+from analysis_tools.loading_data import Dataset, loading_data
+from model.config import Config
+from static_data import START_TIME, END_TIME, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
+from strategy.best_gain import BestGain, ENGINE_VECTORIZED
+from strategy.best_gain_online import BestGainOnline, FundingEvent, PriceEvent
+
+
+def _events(dataset):
+    # Funding prints then prices at each time, Binance first so tokens keep the order of funding_df
+    binance = dataset.funding_rates_binance
+    bybit = dataset.funding_rates_bybit
+    spot = dataset.spot_prices_binance
+    events = pd.concat([
+        pd.DataFrame({"time": binance["timestamp"], "priority": 0, "token": binance["token"],
+                      "value": binance["last_funding_rate"]}),
+        pd.DataFrame({"time": bybit["timestamp"], "priority": 1, "token": bybit["token"],
+                      "value": bybit["funding_rate"]}),
+        pd.DataFrame({"time": spot["close_time"], "priority": 2, "token": spot["token"], "value": spot["close"]}),
+    ], ignore_index=True).sort_values(["time", "priority"], kind="stable")
+    for time_, priority, token, value in events.itertuples(index=False):
+        if priority == 2:
+            yield PriceEvent(close_time=time_, token=token, close=value)
+        else:
+            yield FundingEvent(timestamp=time_, token=token, exchange="binance" if priority == 0 else "bybite",
+                               funding_rate=value)
+
+
+def main():
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    dataset = loading_data()
+    dataset = Dataset(
+        funding_rates_binance=dataset.funding_rates_binance.drop_duplicates(subset=["timestamp", "token"]),
+        funding_rates_bybit=dataset.funding_rates_bybit.drop_duplicates(subset=["timestamp", "token"]),
+        spot_prices_binance=dataset.spot_prices_binance,
+    )
+    config = Config(
+        dataset=dataset,
+        start_date=datetime.strptime(START_TIME, "%d-%m-%Y"),
+        end_date=datetime.strptime(END_TIME, "%d-%m-%Y"),
+    )
+    funding_df = compute_funding_dataframe(dataset, INVENTORY, INITIAL_PRICES)
+    batch = BestGain(funding_df, config, INVENTORY, INIT_QUANTITY, HAIRCUTS)
+    batch.apply(engine=ENGINE_VECTORIZED)
+
+    online = BestGainOnline(config, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES)
+    events = list(_events(dataset))
+    decisions = []
+    start = time.perf_counter()
+    for event in events:
+        decision = online.on_event(event)
+        if decision is not None:
+            decisions.append(decision)
+    decision = online.flush()
+    if decision is not None:
+        decisions.append(decision)
+    elapsed = time.perf_counter() - start
+
+    expected = batch.result.groupby("timestamp", sort=False)
+    assert len(decisions) == expected.ngroups, (len(decisions), expected.ngroups)
+    for decision, (timestamp, rows) in zip(decisions, expected):
+        assert decision.timestamp == timestamp, (decision.timestamp, timestamp)
+        assert list(decision.actions.items()) == list(zip(rows["token"], rows["ACTION"])), timestamp
+        assert decision.is_profitable == rows["is_profitable"].iloc[0], timestamp
+        assert decision.fee_amount == rows["fee_amount"].iloc[0], timestamp
+
+    print(f"events {len(events)}, decisions {len(decisions)} identical to the batch result\n"
+          f"{elapsed / len(events) * 1e6:.1f} us per event, "
+          f"{elapsed / len(decisions) * 1e3:.2f} ms per decision (evaluation included)")
+
+
+if __name__ == '__main__':
+    main()
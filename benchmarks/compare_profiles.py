@@ -0,0 +1,50 @@
+"""
+Compare two profiles written by run_backtest (BACKTEST_PROFILE=trace.json python main.py).
+
+Stages are summed by name, --tolerance fails when a stage got slower than the baseline by more than
+this ratio.
+
+Run from the repository root:
+    python -m benchmarks.compare_profiles baseline.json trace.json --tolerance 0.2
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from analysis_tools.profiling import load_trace
+
+
+def _by_stage(path: str) -> pd.DataFrame:
+    records = pd.DataFrame(load_trace(path)).reindex(columns=["name", "wall_s", "cpu_s", "peak_memory_mb", "rows"])
+    return records.groupby("name", sort=False).agg(
+        calls=("wall_s", "size"), wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"),
+        peak_memory_mb=("peak_memory_mb", "max"), rows=("rows", lambda rows: rows.sum(min_count=1)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("profile")
+    parser.add_argument("--tolerance", type=float, help="allowed wall time increase, ie: 0.2 for 20%%")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this")
+    args = parser.parse_args()
+
+    baseline = _by_stage(args.baseline)
+    profile = _by_stage(args.profile)
+    report = baseline.join(profile, how="outer", lsuffix="_baseline", rsuffix="_profile", sort=False)
+    report["wall_ratio"] = report["wall_s_profile"] / report["wall_s_baseline"]
+    print(report[["wall_s_baseline", "wall_s_profile", "wall_ratio", "cpu_s_baseline", "cpu_s_profile",
+                  "peak_memory_mb_baseline", "peak_memory_mb_profile", "rows_baseline", "rows_profile"]].to_string())
+
+    if args.tolerance is not None:
+        slower = report.loc[(report["wall_ratio"] > 1 + args.tolerance) & (report["wall_s_profile"] >= args.min_seconds)]
+        for name, row in slower.iterrows():
+            print(f"{name}: {row['wall_s_baseline']:.3f}s -> {row['wall_s_profile']:.3f}s", file=sys.stderr)
+        if len(slower):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
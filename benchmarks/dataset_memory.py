@@ -0,0 +1,38 @@
+"""
+Memory used by the Dataset frames with and without loading_data(lean=True).
+
+Run from the repository root:
+    python -m benchmarks.dataset_memory
+    python -m benchmarks.dataset_memory --files-dir /tmp/bench_files
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from analysis_tools.loading_data import FILES_DIR, loading_data
+
+
+def _load(files_dir, lean):
+    start = time.perf_counter()
+    dataset = loading_data(files_dir=files_dir, lean=lean)
+    return dataset, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-dir", default=FILES_DIR)
+    args = parser.parse_args()
+
+    full, full_seconds = _load(args.files_dir, lean=False)
+    lean, lean_seconds = _load(args.files_dir, lean=True)
+
+    report = pd.DataFrame({"full_mb": full.memory_usage(), "lean_mb": lean.memory_usage()}) / 1e6
+    report.loc["total"] = report.sum()
+    report["saving"] = 1 - report["lean_mb"] / report["full_mb"]
+    print(report.round(3).to_string())
+    print(f"load time full {full_seconds:.3f}s lean {lean_seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
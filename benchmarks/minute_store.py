@@ -0,0 +1,89 @@
+"""
+Minute bars of many tokens in a MinuteStore: build time, size on disk, as-of lookups and range queries,
+with the memory of the process, which only holds the pages the queries touched.
+
+Run from the repository root:
+    python -m benchmarks.minute_store
+    python -m benchmarks.minute_store --tokens 200 --days 365 --lookups 5000000
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.minute_store import BAR_COLUMNS, TIME_COLUMN, MinuteStore
+from benchmarks.synthetic_data import synthetic_tokens
+
+
+def _rss_mb() -> float:
+    # Current resident memory, from /proc where it exists
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _bars(rng: np.random.Generator, start: pd.Timestamp, minutes: int) -> pd.DataFrame:
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, minutes)))
+    spread = np.abs(rng.normal(0, 0.0002, minutes))
+    return pd.DataFrame({
+        TIME_COLUMN: pd.date_range(start, periods=minutes, freq="min"),
+        "open": np.concatenate([[100.0], close[:-1]]),
+        "high": close * (1 + spread),
+        "low": close * (1 - spread),
+        "close": close,
+        "volume": rng.uniform(0, 1000, minutes),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--days", type=float, default=180)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--dir", help="store directory, a temporary one by default")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2024-01-01")
+    minutes = int(args.days * 24 * 60)
+    tokens = synthetic_tokens(args.tokens)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MinuteStore(args.dir or tmp_dir)
+        began = time.perf_counter()
+        for token in tokens:
+            # Two appends by token, like a daily refresh
+            bars = _bars(rng, start, minutes)
+            store.append(token, bars.iloc[:minutes // 2])
+            store.append(token, bars.iloc[minutes // 2:])
+        build_seconds = time.perf_counter() - began
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(store.root) for name in names)
+        print(f"{len(tokens)} tokens x {minutes} bars written in {build_seconds:.2f} s, {size / 1e6:.0f} MB on disk")
+
+        # A new store object: nothing mapped yet
+        store = MinuteStore(store.root)
+        rss = _rss_mb()
+        query_tokens = np.asarray(tokens, dtype=object)[rng.integers(0, len(tokens), args.lookups)]
+        query_times = start + pd.to_timedelta(rng.uniform(0, args.days * 86400, args.lookups), unit="s")
+        began = time.perf_counter()
+        prices = store.asof(query_tokens, query_times.to_numpy())
+        asof_seconds = time.perf_counter() - began
+        print(f"{args.lookups} as-of lookups in {asof_seconds:.2f} s ({np.isnan(prices).sum()} without a bar), "
+              f"resident memory +{_rss_mb() - rss:.0f} MB")
+
+        began = time.perf_counter()
+        day = store.range(tokens[0], start + pd.Timedelta(days=10), start + pd.Timedelta(days=11))
+        range_ms = (time.perf_counter() - began) * 1000
+        shared = np.shares_memory(day["close"].to_numpy(), store.bars(tokens[0])["close"])
+        print(f"range of one day: {len(day)} bars in {range_ms:.2f} ms, view on the store: {shared}")
+        in_memory = len(tokens) * minutes * (len(BAR_COLUMNS) + 1) * 8
+        print(f"the same bars in a Dataset frame: about {in_memory / 1e6:.0f} MB in memory")
+
+
+if __name__ == '__main__':
+    main()
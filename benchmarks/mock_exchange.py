@@ -0,0 +1,177 @@
+"""
+Local mock of the Binance and Bybit REST endpoints read by analysis_tools.fetcher.
+
+Records are generated from the symbol and the time, so any symbol and date range can be served and
+two fetches of the same range get the same values. Only the records up to now_ms exist, moving it
+forward publishes new records. fail_every answers every n-th request with an HTTP 429.
+
+Run from the repository root, it refreshes files in a temporary directory from the mock in two steps
+and checks the result against a single full fetch:
+    python -m benchmarks.mock_exchange
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from analysis_tools.fetcher import (HOUR_MS, Client, binance_funding_feed, binance_hourly_feed, bybit_funding_feed,
+                                    refresh)
+from analysis_tools.loading_data import loading_data
+
+FUNDING_INTERVAL_MS = 8 * HOUR_MS
+
+
+def _noise(*key) -> float:
+    # Deterministic value in [-1, 1) for key
+    return zlib.crc32(repr(key).encode()) / 2 ** 31 - 1
+
+
+class MockExchange:
+    def __init__(self, now_ms: int, fail_every: Optional[int] = None):
+        self.now_ms = now_ms
+        self.fail_every = fail_every
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def _handler(self):
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive connections, like the exchanges
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with exchange._lock:
+                    exchange.connections += 1
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with exchange._lock:
+                    exchange.requests += 1
+                    fail = exchange.fail_every and exchange.requests % exchange.fail_every == 0
+                if fail:
+                    return self._send(429, {"code": -1003, "msg": "Too many requests"}, {"Retry-After": "0"})
+                routes = {
+                    "/fapi/v1/fundingRate": exchange.binance_funding,
+                    "/v5/market/funding/history": exchange.bybit_funding,
+                    "/api/v3/klines": exchange.binance_klines,
+                }
+                if url.path not in routes:
+                    return self._send(404, {"msg": "not found"})
+                self._send(200, routes[url.path](params))
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _times(self, params, interval_ms: int, delay_ms: int = 0) -> List[int]:
+        # Record times in [startTime, endTime] published before now_ms
+        start, end = int(params["startTime"]), min(int(params["endTime"]), self.now_ms)
+        first = -(-(start - delay_ms) // interval_ms) * interval_ms + delay_ms
+        return list(range(first, end + 1, interval_ms))
+
+    def binance_funding(self, params):
+        # Prints a few ms after the funding time, oldest first
+        times = self._times(params, FUNDING_INTERVAL_MS, delay_ms=3)[:int(params["limit"])]
+        symbol = params["symbol"]
+        return [{"symbol": symbol, "fundingTime": t, "fundingRate": f"{0.0001 + 0.0005 * _noise(symbol, t, 'binance'):.8f}",
+                 "markPrice": "0"} for t in times]
+
+    def bybit_funding(self, params):
+        # Newest first, the newest records of the range when it holds more than limit
+        times = self._times(params, FUNDING_INTERVAL_MS)[::-1][:int(params["limit"])]
+        symbol = params["symbol"]
+        return {"retCode": 0, "retMsg": "OK", "result": {"category": "linear", "list": [
+            {"symbol": symbol, "fundingRate": f"{0.0001 + 0.0005 * _noise(symbol, t, 'bybit'):.7f}",
+             "fundingRateTimestamp": str(t)} for t in times]}}
+
+    def binance_klines(self, params):
+        # Bars opened in the range and closed before now_ms
+        params = dict(params, endTime=min(int(params["endTime"]), self.now_ms - HOUR_MS))
+        symbol = params["symbol"]
+        klines = []
+        for t in self._times(params, HOUR_MS)[:int(params["limit"])]:
+            close = 100 * (1 + 0.2 * _noise(symbol, t))
+            klines.append([t, f"{close * 0.999:.4f}", f"{close * 1.01:.4f}", f"{close * 0.99:.4f}", f"{close:.4f}",
+                           "10.5", t + HOUR_MS - 1, "1050.5", 42, "5.25", "525.25", "0"])
+        return klines
+
+
+def _ms(date: datetime) -> int:
+    return int(pd.Timestamp(date).value // 1_000_000)
+
+
+def main():
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    tokens = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    start, middle, end = datetime(2023, 1, 1), datetime(2024, 1, 1), datetime(2024, 3, 1)
+
+    with MockExchange(_ms(middle), fail_every=7) as exchange, tempfile.TemporaryDirectory() as tmp_dir:
+        feeds = [binance_funding_feed(exchange.url), bybit_funding_feed(exchange.url), binance_hourly_feed(exchange.url)]
+        incremental_dir, full_dir = f"{tmp_dir}/incremental", f"{tmp_dir}/full"
+
+        os.makedirs(incremental_dir)
+        os.makedirs(full_dir)
+        client = Client(requests_per_second=200)
+        began = time.perf_counter()
+        added = refresh(feeds, tokens, incremental_dir, start=start, end=middle, client=client)
+        print(f"first fetch  {added} in {time.perf_counter() - began:.2f} s, {client.requests} requests, "
+              f"{client.retried} retried, {client.connections_opened} connections")
+        # Load once so that the cache exists and is appended to by the next refresh
+        loading_data(files_dir=incremental_dir)
+
+        exchange.now_ms = _ms(end)
+        client = Client(requests_per_second=200)
+        added = refresh(feeds, None, incremental_dir, end=end, client=client)
+        print(f"second fetch {added}, {client.requests} requests, {client.retried} retried")
+        assert refresh(feeds, None, incremental_dir, end=end) == {feed.file_name: 0 for feed in feeds}
+
+        refresh(feeds, tokens, full_dir, start=start, end=end)
+        incremental, full = loading_data(files_dir=incremental_dir), loading_data(use_cache=False, files_dir=full_dir)
+        for name in ["funding_rates_binance", "funding_rates_bybit", "spot_prices_binance"]:
+            pd.testing.assert_frame_equal(getattr(incremental, name), getattr(full, name))
+        print(f"incremental files equal to a full fetch, {len(incremental.spot_prices_binance)} hourly rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Time and memory profile of each pipeline stage on synthetic data of several sizes.
+
+Each size is TOKENSxYEARS, ie 8x0.5 is 8 tokens over 6 months. Results are written as JSON,
+give a previous results file with --compare to fail on stages that got slower.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --sizes 8x0.5 32x1 100x3 --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 8x0.5 32x1 100x3 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools import memo
+from analysis_tools.compute_data import compute_funding_dataframe
+from analysis_tools.loading_data import loading_data
+from benchmarks.synthetic_data import generate_files
+from model.config import Config
+from strategy.best_gain import BestGain, ENGINE_LOOP, ENGINE_VECTORIZED
+from strategy.max_function_rate_sec import MaxFundingRateSec
+from strategy.max_funding_rate import MaxFundingRate
+
+INVESTED_TOKENS = 8
+WINDOW_DAYS = 30
+
+
+def _pipeline(files_dir: str, initial_prices: Dict[str, float], engines: List[str]):
+    # Yields (stage, function) in order, each function returns the number of rows it produced
+    state = {}
+    tokens = [token for token in initial_prices if token != "USDT"][:INVESTED_TOKENS]
+    inventory = {token: 250_000 for token in tokens}
+    inventory["USDT"] = 500_000
+    init_quantity = {token: amount / initial_prices[token] for token, amount in inventory.items()}
+    haircuts = {token[:-4]: 0.9 for token in tokens}
+
+    def load_csv():
+        state["dataset"] = loading_data(use_cache=False, files_dir=files_dir)
+        return len(state["dataset"].spot_prices_binance)
+
+    def load_cached():
+        state["dataset"] = loading_data(files_dir=files_dir)
+        return len(state["dataset"].spot_prices_binance)
+
+    def load_window():
+        # Last WINDOW_DAYS of the files, read with the date-range filter
+        end = state["dataset"].spot_prices_binance["close_time"].max()
+        window = loading_data(files_dir=files_dir, start_date=end - pd.Timedelta(days=WINDOW_DAYS), end_date=end)
+        return len(window.spot_prices_binance)
+
+    def funding():
+        dataset = state["dataset"]
+        state["funding_df"] = compute_funding_dataframe(dataset, inventory, initial_prices)
+        state["config"] = Config(
+            dataset=dataset,
+            start_date=state["funding_df"]["timestamp"].min(),
+            end_date=state["funding_df"]["timestamp"].max(),
+        )
+        return len(state["funding_df"])
+
+    def price_index():
+        return state["dataset"].price_index("close_time").prices.size
+
+    def funding_matrix():
+        return state["dataset"].funding_matrix().rates.size
+
+    def best_gain(engine):
+        def run():
+            strat = BestGain(state["funding_df"], state["config"], inventory, init_quantity, haircuts)
+            strat.apply(engine=engine)
+            state["best_gain"] = strat
+            return len(strat.result)
+        return run
+
+    def best_gain_stats():
+        state["best_gain"].apply_stats(verbose=False)
+        return len(state["best_gain"].result)
+
+    def max_funding_rate():
+        strat = MaxFundingRate()
+        strat.apply(state["funding_df"].copy(), state["config"])
+        return len(state["funding_df"])
+
+    def max_funding_rate_sec():
+        strat = MaxFundingRateSec(state["funding_df"], state["config"], inventory, haircuts)
+        strat.apply()
+        return len(state["funding_df"])
+
+    yield "loading_data (csv)", load_csv
+    yield "loading_data (cache)", load_cached
+    yield f"loading_data (cache, {WINDOW_DAYS} days)", load_window
+    yield "compute_funding_dataframe", funding
+    yield "price_index", price_index
+    yield "funding_matrix", funding_matrix
+    for engine in engines:
+        yield f"BestGain.apply ({engine})", best_gain(engine)
+        yield f"BestGain.apply_stats ({engine})", best_gain_stats
+    yield "MaxFundingRate.apply", max_funding_rate
+    yield "MaxFundingRateSec.apply", max_funding_rate_sec
+
+
+def _run_size(n_tokens: int, years: float, funding_interval_hours: int, engines: List[str], trace_memory: bool,
+              data_dir: str) -> List[Dict]:
+    files_dir = os.path.join(data_dir, f"{n_tokens}x{years}x{funding_interval_hours}h")
+    initial_prices = generate_files(files_dir, n_tokens, years, funding_interval_hours)
+    # Build the binary cache so the cached stage only measures reading it
+    loading_data(files_dir=files_dir)
+    results = {}
+    # Timing pass, then a second pass under tracemalloc which slows Python code down
+    for stage, run in _pipeline(files_dir, initial_prices, engines):
+        wall, cpu = time.perf_counter(), time.process_time()
+        rows = run()
+        results[stage] = {
+            "tokens": n_tokens,
+            "years": years,
+            "funding_interval_hours": funding_interval_hours,
+            "stage": stage,
+            "seconds": time.perf_counter() - wall,
+            "cpu_seconds": time.process_time() - cpu,
+            "rows": int(rows),
+            "peak_memory_mb": None,
+        }
+        print(f"{n_tokens:>5} tokens {years:>5} years  {stage:<32} {results[stage]['seconds']:>9.3f} s", flush=True)
+    if trace_memory:
+        for stage, run in _pipeline(files_dir, initial_prices, engines):
+            tracemalloc.start()
+            run()
+            results[stage]["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+    return list(results.values())
+
+
+def _regressions(results: List[Dict], previous: List[Dict], tolerance: float, min_seconds: float) -> List[str]:
+    key = lambda r: (r["tokens"], r["years"], r["funding_interval_hours"], r["stage"])
+    previous_by_key = {key(r): r for r in previous}
+    messages = []
+    for result in results:
+        before = previous_by_key.get(key(result))
+        if before is None or result["seconds"] < min_seconds:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + tolerance):
+            messages.append(f"{result['stage']} ({result['tokens']} tokens, {result['years']} years): "
+                            f"{before['seconds']:.3f} s -> {result['seconds']:.3f} s")
+    return messages
+
+
+def _parse_size(size: str):
+    tokens, years = size.lower().split("x")
+    return int(tokens), float(years)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["8x0.5", "32x1"], help="TOKENSxYEARS")
+    parser.add_argument("--funding-interval", type=int, default=8, help="hours between two funding prints")
+    parser.add_argument("--engines", nargs="+", default=[ENGINE_VECTORIZED], choices=[ENGINE_LOOP, ENGINE_VECTORIZED])
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--data-dir", help="where to write the synthetic files, a temporary directory by default")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="previous JSON results, exit with an error on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this")
+    args = parser.parse_args()
+
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    # Time the computations, not the memo
+    memo.disable()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        results = []
+        for size in args.sizes:
+            n_tokens, years = _parse_size(size)
+            results += _run_size(n_tokens, years, args.funding_interval, args.engines, not args.no_memory, data_dir)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+        regressions = _regressions(results, previous, args.tolerance, args.min_seconds)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("\nNo regression")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Cold start time of main.py: each case runs in a new Python process, the wall time of the process is
+measured --repeat times. The previous main.py imported pandas, NumPy, matplotlib.pyplot and BestGain
+before parsing anything, the CLI only imports pandas and the selected strategy once the run starts.
+
+Run from the repository root:
+    python -m benchmarks.startup_time
+    python -m benchmarks.startup_time --repeat 20
+"""
+import argparse
+import importlib.util
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules imported before the backtest starts
+PREVIOUS_IMPORTS = ["pandas", "numpy", "matplotlib.pyplot", "strategy.best_gain", "run_backtest"]
+CLI_IMPORTS = ["main", "run_backtest", "strategy.best_gain"]
+
+
+def _import_code(modules):
+    return "; ".join(f"import {module}" for module in modules)
+
+
+def _time(command, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    previous = PREVIOUS_IMPORTS
+    if importlib.util.find_spec("matplotlib") is None:
+        print("matplotlib is not installed, the previous main.py is timed without it (its time is a lower bound)")
+        previous = [module for module in previous if not module.startswith("matplotlib")]
+
+    cases = {
+        "python (nothing imported)": [sys.executable, "-c", "pass"],
+        "previous main.py imports": [sys.executable, "-c", _import_code(previous)],
+        "main.py --help": [sys.executable, "main.py", "--help"],
+        "main.py imports up to the run": [sys.executable, "-c", _import_code(CLI_IMPORTS)],
+    }
+    # One untimed run of each case so that the .pyc files exist
+    for command in cases.values():
+        _time(command, 1)
+
+    print(f"{'case':<32}{'min (ms)':>10}{'median (ms)':>13}")
+    medians = {}
+    for name, command in cases.items():
+        seconds = _time(command, args.repeat)
+        medians[name] = statistics.median(seconds)
+        print(f"{name:<32}{min(seconds) * 1000:>10.1f}{medians[name] * 1000:>13.1f}")
+    previous_ms = medians["previous main.py imports"] * 1000
+    for name in ["main.py --help", "main.py imports up to the run"]:
+        print(f"{name}: {previous_ms / (medians[name] * 1000):.1f}x faster than the previous main.py")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic funding and hourly price files in the layout of the files/ directory.
+
+Prices follow a random walk by token and funding rates an AR(1) process around the 0.01% base
+rate, clipped to +-0.75% like the exchange caps.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+REAL_TOKENS = ["AAVEUSDT", "BNBUSDT", "BTCUSDT", "DOGEUSDT", "ETHUSDT", "MASKUSDT", "SOLUSDT", "XRPUSDT"]
+REAL_PRICES = [110.56, 313.57, 42503.5, 0.0899, 2297.41, 3.713, 102.041, 0.6166]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def synthetic_tokens(n_tokens: int) -> List[str]:
+    return (REAL_TOKENS + [f"TK{i:04d}USDT" for i in range(max(0, n_tokens - len(REAL_TOKENS)))])[:n_tokens]
+
+
+def generate_files(files_dir: str, n_tokens: int, years: float, funding_interval_hours: int = 8,
+                   start: datetime = datetime(2024, 1, 1), seed: int = 0) -> Dict[str, float]:
+    """
+    Write Binance_funding.csv, Bybit_funding.csv and Binance_hourly.csv in files_dir.
+    Returns the initial price of each token (plus USDT), to use as INITIAL_PRICES.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(files_dir, exist_ok=True)
+    tokens = np.array(synthetic_tokens(n_tokens), dtype=object)
+    hours = int(years * 365 * 24)
+    initial = np.array((REAL_PRICES + list(rng.uniform(0.05, 500, max(0, n_tokens - len(REAL_PRICES)))))[:n_tokens])
+
+    # Hourly candles, timestamp major then token like the real file
+    open_time = pd.date_range(start, periods=hours, freq="h")
+    log_returns = rng.normal(0, 0.006, size=(hours, n_tokens))
+    close = initial * np.exp(np.cumsum(log_returns, axis=0))
+    open_ = np.vstack([initial, close[:-1]])
+    spread = np.abs(rng.normal(0, 0.003, size=(hours, n_tokens)))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.gamma(2, 5_000, size=(hours, n_tokens))
+    count = rng.integers(1_000, 50_000, size=(hours, n_tokens))
+    taker_share = rng.uniform(0.3, 0.7, size=(hours, n_tokens))
+    hourly = pd.DataFrame({
+        "close_time": np.repeat((open_time + pd.Timedelta(hours=1)).strftime(DATE_FORMAT), n_tokens),
+        "": np.tile(tokens, hours),
+        "open_time": np.repeat(open_time.strftime(DATE_FORMAT), n_tokens),
+        "open": open_.ravel().round(6),
+        "high": high.ravel().round(6),
+        "low": low.ravel().round(6),
+        "close": close.ravel().round(6),
+        "volume": volume.ravel().round(3),
+        "quote_volume": (volume * close).ravel().round(5),
+        "count": count.ravel(),
+        "taker_buy_volume": (volume * taker_share).ravel().round(3),
+        "taker_buy_quote_volume": (volume * taker_share * close).ravel().round(5),
+        "ignore": 0,
+    })
+    hourly.to_csv(os.path.join(files_dir, "Binance_hourly.csv"), index=False)
+
+    # Funding prints every funding_interval_hours on both exchanges
+    funding_time = pd.date_range(start, periods=hours // funding_interval_hours, freq=f"{funding_interval_hours}h")
+    periods = len(funding_time)
+    binance_rate = _funding_rates(rng, periods, n_tokens)
+    bybit_rate = np.clip(binance_rate + rng.normal(0, 0.00005, size=(periods, n_tokens)), -0.0075, 0.0075)
+    calc_time = np.repeat(funding_time.strftime(DATE_FORMAT), n_tokens)
+    token_column = np.tile(tokens, periods)
+    pd.DataFrame({
+        "calc_time": calc_time,
+        "": token_column,
+        "funding_interval_hours": funding_interval_hours,
+        "last_funding_rate": binance_rate.ravel().round(8),
+    }).to_csv(os.path.join(files_dir, "Binance_funding.csv"), index=False)
+    pd.DataFrame({
+        "fundingRateTimestamp": calc_time,
+        "": token_column,
+        "symbol": token_column,
+        "fundingRate": bybit_rate.ravel().round(7),
+    }).to_csv(os.path.join(files_dir, "Bybit_funding.csv"), index=False)
+
+    initial_prices = dict(zip(tokens.tolist(), initial.tolist()))
+    initial_prices["USDT"] = 1
+    return initial_prices
+
+
+def _funding_rates(rng: np.random.Generator, periods: int, n_tokens: int) -> np.ndarray:
+    # AR(1) around 0.0001, 40% of the prints at exactly the 0.01% base rate
+    rates = np.empty((periods, n_tokens))
+    level = np.full(n_tokens, 0.0001)
+    shocks = rng.normal(0, 0.00008, size=(periods, n_tokens))
+    for i in range(periods):
+        level = 0.0001 + 0.9 * (level - 0.0001) + shocks[i]
+        rates[i] = level
+    rates = np.where(rng.random((periods, n_tokens)) < 0.4, 0.0001, rates)
+    return np.clip(rates, -0.0075, 0.0075)
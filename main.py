@@ -1,9 +1,96 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+"""
+Backtest a strategy over the files of files/.
 
-from run_backtest import run
+Settings come from static_data, then from the JSON file of --settings (any of "strategy", "start", "end",
+"config", "inventory", "init_quantity", "haircuts", "initial_prices"), then from the arguments.
+pandas, the strategy modules and matplotlib are only imported once the arguments are parsed, for the
+selected strategy and when --plot is set.
+
+Run from the repository root:
+    python main.py
+    python main.py --strategy max_funding_rate --start 01-02-2024 --end 30-04-2024
+    python main.py --settings run.json --set buffer_liquidation=0.05 --inventory BTCUSDT=500000 USDT=1000000
+    python main.py --engine vectorized --plot gains.png
+    python main.py --compare best_gain max_funding_rate max_funding_rate_sec --workers 3
+    python main.py --checkpoint files/.cache/best_gain.pkl
+    python main.py --memo
+"""
+import argparse
+import json
+
+from model.settings import BacktestSettings
+from strategy.registry import strategy_names
+
+
+def _json_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        # Plain strings (ie: price_tolerance=1min) do not need the JSON quotes
+        return value
+
+
+def _key_values(pairs, parse=_json_value):
+    # ["name=value", ...] to {name: parse(value)}, None when not given
+    if pairs is None:
+        return None
+    values = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=value, got {pair!r}")
+        values[name] = parse(value)
+    return values
 
-if __name__ == '__main__':
-    run()
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategy", choices=strategy_names(), help="best_gain by default")
+    parser.add_argument("--compare", nargs="+", choices=strategy_names(), metavar="STRATEGY",
+                        help="print the PnL, APY and fees of these strategies side by side")
+    parser.add_argument("--workers", type=int, default=1, help="strategies compared at once, in threads")
+    parser.add_argument("--settings", help="JSON file of settings")
+    parser.add_argument("--start", help="first day, dd-mm-yyyy")
+    parser.add_argument("--end", help="last day included, dd-mm-yyyy")
+    parser.add_argument("--set", nargs="+", metavar="FIELD=VALUE", help="Config fields, ie: taker_fee=0.0002")
+    parser.add_argument("--inventory", nargs="+", metavar="TOKEN=USD", help="USD amount by token")
+    parser.add_argument("--init-quantity", nargs="+", metavar="TOKEN=QUANTITY",
+                        help="quantity by token, the inventory at the initial prices by default")
+    parser.add_argument("--haircuts", nargs="+", metavar="TOKEN=HAIRCUT")
+    parser.add_argument("--engine",
+                        help="BestGain engine, loop by default or vectorized (always vectorized with is_partial_allocation)")
+    parser.add_argument("--plot", metavar="PATH", help="plot the gain by token to an image file, show to display it")
+    parser.add_argument("--profile", metavar="PATH", help="Chrome trace file of the stages of the run")
+    parser.add_argument("--checkpoint", metavar="PATH",
+                        help="best_gain only: process the timestamps after this checkpoint file, then update it")
+    parser.add_argument("--memo", action="store_true",
+                        help="reuse the funding dataframe and spot price merge saved in files/.cache/memo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Imported after the arguments: --help and argument errors do not load pandas
+    from run_backtest import compare, run
+    if args.memo:
+        from analysis_tools import memo
+        memo.enable()
+
+    settings = BacktestSettings.load(
+        args.settings,
+        strategy=args.strategy,
+        start=args.start,
+        end=args.end,
+        config=_key_values(args.set),
+        inventory=_key_values(args.inventory, float),
+        init_quantity=_key_values(args.init_quantity, float),
+        haircuts=_key_values(args.haircuts, float),
+    )
+    if args.compare:
+        print(compare(args.compare, settings, engine=args.engine, workers=args.workers).to_string())
+    else:
+        run(profile=args.profile, settings=settings, engine=args.engine, plot=args.plot, checkpoint=args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
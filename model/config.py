@@ -1,9 +1,12 @@
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import List, Dict
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
 
 from analysis_tools.loading_data import Dataset
 
+# Fields of the run (data and dates), the others are the parameters of the strategies
+RUN_FIELDS = ["dataset", "start_date", "end_date"]
+
 
 @dataclass()
 class Config:
@@ -16,7 +19,9 @@ class Config:
     taker_fee: float = 0.0001 # 0.1% to prevent liquidation
     spot_fee: float = 0.000055 # 0.055% to prevent liquidation
     tokens: List[str] = field(default_factory=list)
-    is_reinvest: bool = False # for max funding rate
+    is_reinvest: bool = False # for max funding rate, compound the gains into the quantity held
+    is_partial_allocation: bool = False # for best gain, invest part of a token when it does not fully fit
+    price_tolerance: Optional[timedelta] = None # for best gain, use the last spot price up to this old instead of an exact close_time match
 
     # Initial prices for each token
 
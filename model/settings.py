@@ -0,0 +1,57 @@
+import json
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+
+from static_data import START_TIME, END_TIME, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
+
+
+@dataclass()
+class BacktestSettings:
+    """
+    Inputs of a backtest run, the static_data values by default.
+
+    config holds the Config fields to set (ie: {"buffer_liquidation": 0.05}). When inventory is given
+    without init_quantity, the quantities are the inventory amounts at the initial prices.
+    Only the standard library is imported here so that the command line starts fast.
+    """
+    strategy: str = "best_gain"
+    start: str = START_TIME # dd-mm-yyyy
+    end: str = END_TIME # dd-mm-yyyy, last day included
+    config: Optional[Dict[str, Any]] = None
+    inventory: Optional[Dict[str, float]] = None
+    init_quantity: Optional[Dict[str, float]] = None
+    haircuts: Optional[Dict[str, float]] = None
+    initial_prices: Optional[Dict[str, float]] = None
+
+    def __post_init__(self):
+        self.config = dict(self.config or {})
+        self.initial_prices = dict(self.initial_prices or INITIAL_PRICES)
+        self.haircuts = dict(self.haircuts or HAIRCUTS)
+        if self.inventory is None:
+            self.inventory = dict(INVENTORY)
+            self.init_quantity = dict(self.init_quantity or INIT_QUANTITY)
+        elif self.init_quantity is None:
+            missing = sorted(set(self.inventory) - set(self.initial_prices))
+            if missing:
+                raise KeyError(f"No initial price for {missing}")
+            self.init_quantity = {token: amount / self.initial_prices[token] for token, amount in self.inventory.items()}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **overrides) -> "BacktestSettings":
+        """
+        Settings of the JSON file path (any of the fields), then overrides that are not None: config
+        entries are added to the config of the file, an inventory replaces the init_quantity of the file.
+        """
+        values = {}
+        if path:
+            with open(path) as f:
+                values = json.load(f)
+            unknown = set(values) - {field.name for field in fields(cls)}
+            if unknown:
+                raise ValueError(f"Unknown settings {sorted(unknown)} in {path}")
+        overrides = {name: value for name, value in overrides.items() if value is not None}
+        if "config" in overrides:
+            overrides["config"] = {**values.get("config", {}), **overrides["config"]}
+        if "inventory" in overrides and "init_quantity" not in overrides:
+            values.pop("init_quantity", None)
+        return cls(**{**values, **overrides})
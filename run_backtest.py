@@ -1,32 +1,95 @@
-from datetime import datetime
+import os
+from dataclasses import fields
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from model.config import Config
+import pandas as pd
 
+from model.config import Config, RUN_FIELDS
+from model.settings import BacktestSettings
+
+from analysis_tools import profiling
 from analysis_tools.compute_data import compute_funding_dataframe
 from analysis_tools.loading_data import loading_data
-from static_data import START_TIME, END_TIME
-from strategy.best_gain import BestGain
-
+from analysis_tools.profiling import PROFILE_ENV, PROFILE_MEMORY_ENV, stage
+from strategy.checkpoint import checkpoint_time
+from strategy.registry import run_strategy
 
-def run() -> None:
-    from static_data import INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
 
+def run(profile: Optional[str] = None, settings: Optional[BacktestSettings] = None, engine: Optional[str] = None,
+        plot: Optional[str] = None, checkpoint: Optional[str] = None) -> None:
+    """
+    Backtest the strategy of settings (BestGain over START_TIME - END_TIME with the static_data inputs by default).
+    profile (or the BACKTEST_PROFILE environment variable) is the path of a Chrome trace file
+    with the wall time, CPU time, peak memory and rows of each stage of the run.
+    plot draws the gain by token, "show" to display it, the path of an image file otherwise.
+    checkpoint is the path of a BestGain checkpoint: only the data after it is read and only the new
+    timestamps are processed, the checkpoint is then updated (see strategy.checkpoint).
+    """
+    settings = settings or BacktestSettings()
+    profile = profile or os.environ.get(PROFILE_ENV)
+    if profile:
+        profiling.enable(trace_memory=os.environ.get(PROFILE_MEMORY_ENV, "1") != "0")
+    try:
+        with stage("run_backtest"):
+            funding_df, config = prepare(settings, checkpoint_time(checkpoint) if checkpoint else None)
+            _, recap = run_strategy(settings.strategy, funding_df, config, settings, engine, checkpoint=checkpoint)
+    finally:
+        if profile:
+            profiling.disable().write(profile)
+            print(f"Profile written to {profile}")
+    if plot:
+        # matplotlib is only imported when a plot is asked for
+        from analysis_tools.plotting import plot_gains
+        plot_gains(recap["gain_by_token"], f"{settings.strategy} {settings.start} - {settings.end}",
+                   None if plot == "show" else plot)
 
-    dataset = loading_data()
 
-    config = Config(
-        dataset=dataset,
-        start_date=datetime.strptime(START_TIME, "%d-%m-%Y"),
-        end_date=datetime.strptime(END_TIME, "%d-%m-%Y"),
-    )
+def compare(names: List[str], settings: Optional[BacktestSettings] = None, engine: Optional[str] = None,
+            workers: int = 1) -> pd.DataFrame:
+    # Recap of each strategy of names over the same data, the inputs they share are computed once
+    from strategy.comparison import compare_strategies
 
-    funding_df = compute_funding_dataframe(dataset, INVENTORY, INITIAL_PRICES)
+    settings = settings or BacktestSettings()
+    with stage("run_backtest"):
+        funding_df, config = prepare(settings)
+        with stage("compare_strategies"):
+            return compare_strategies(names, funding_df, config, settings, engine, workers)
 
-    strat = BestGain(funding_df, config, INVENTORY, INIT_QUANTITY, HAIRCUTS)
 
-    strat.apply()
+def prepare(settings: BacktestSettings, processed_until: Optional[pd.Timestamp] = None):
+    # Funding dataframe and Config of the settings, from processed_until (a checkpoint) when it is set
+    start_date = datetime.strptime(settings.start, "%d-%m-%Y")
+    end_date = datetime.strptime(settings.end, "%d-%m-%Y")
+    config = Config(
+        dataset=None,
+        start_date=start_date,
+        end_date=end_date,
+        **_config_values(settings.config),
+    )
 
-    strat.apply_stats()
+    data_start = start_date
+    if processed_until is not None:
+        # The spot prices up to price_tolerance before the first new timestamp are still needed
+        data_start = max(start_date, processed_until - (config.price_tolerance or timedelta(0)))
+    # Only the rows of the backtest window are read, the end date is the last day included
+    with stage("loading_data"):
+        dataset = loading_data(start_date=data_start, end_date=end_date + timedelta(days=1))
+    config.dataset = dataset
 
+    with stage("compute_funding_dataframe") as timed:
+        funding_df = compute_funding_dataframe(dataset, settings.inventory, settings.initial_prices)
+        timed.rows = len(funding_df)
+    return funding_df, config
 
 
+def _config_values(values):
+    names = [field.name for field in fields(Config) if field.name not in RUN_FIELDS]
+    unknown = set(values) - set(names)
+    if unknown:
+        raise ValueError(f"Unknown config fields {sorted(unknown)}, one of {names}")
+    values = dict(values)
+    if values.get("price_tolerance") is not None:
+        # "1min", "2h"... in a file or on the command line
+        values["price_tolerance"] = pd.Timedelta(values["price_tolerance"]).to_pytimedelta()
+    return values
@@ -0,0 +1,48 @@
+"""
+Block bootstrap of the BestGain PnL over START_TIME - END_TIME.
+
+BestGain is applied once, then thousands of synthetic paths are drawn from blocks of consecutive
+funding timestamps (rates and spot prices of all the tokens together) and their PnL, APY and fees
+are computed at once (see analysis_tools/bootstrap.py).
+
+Run from the repository root:
+    python run_bootstrap.py --paths 100000 --block-size 21 --seed 0
+    python run_bootstrap.py --paths 10000 --length 1095 --output paths.csv
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from analysis_tools.bootstrap import BLOCK_SIZE, PATHS
+from analysis_tools.compute_data import compute_funding_dataframe
+from analysis_tools.loading_data import loading_data
+from model.config import Config
+from static_data import START_TIME, END_TIME, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
+from strategy.best_gain import BestGain, ENGINE_VECTORIZED
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", type=int, default=PATHS)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="consecutive timestamps of a block")
+    parser.add_argument("--length", type=int, help="timestamps of a path, the history length by default")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="CSV file with the PnL, APY and fees of each path")
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(START_TIME, "%d-%m-%Y")
+    end_date = datetime.strptime(END_TIME, "%d-%m-%Y")
+    dataset = loading_data(start_date=start_date, end_date=end_date + timedelta(days=1))
+    config = Config(dataset=dataset, start_date=start_date, end_date=end_date)
+    funding_df = compute_funding_dataframe(dataset, INVENTORY, INITIAL_PRICES)
+    strat = BestGain(funding_df, config, INVENTORY, INIT_QUANTITY, HAIRCUTS)
+    strat.apply(engine=ENGINE_VECTORIZED)
+
+    started = time.perf_counter()
+    report = strat.bootstrap(paths=args.paths, block_size=args.block_size, length=args.length, seed=args.seed)
+    print(f"{args.paths} paths in {time.perf_counter() - started:.2f} s\n")
+    print(report.percentiles().round(2).to_string())
+    print()
+    for name, value in report.summary().items():
+        print(f"{name:>22} {value:.4f}" if isinstance(value, float) else f"{name:>22} {value}")
+    if args.output:
+        report.to_frame().join(report.gain_by_token.add_prefix("gain_")).to_csv(args.output, index_label="path")
@@ -0,0 +1,38 @@
+"""
+Refresh the funding and hourly files of files/ from the Binance and Bybit REST APIs.
+
+Only the records newer than the last row of each token are fetched, they are appended to the files
+and to their cache. A token without any row in a file is fetched from --start.
+
+Run from the repository root:
+    python run_fetch.py
+    python run_fetch.py --tokens BTCUSDT ETHUSDT ARBUSDT --start 01-01-2024 --concurrency 16
+"""
+import argparse
+import time
+from datetime import datetime
+
+from analysis_tools.fetcher import CONCURRENCY, REQUESTS_PER_SECOND, Client, default_feeds, refresh
+from analysis_tools.loading_data import FILES_DIR
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", nargs="+", help="the tokens of each file by default")
+    parser.add_argument("--start", help="first day of the tokens without any row, dd-mm-yyyy")
+    parser.add_argument("--end", help="last time fetched, dd-mm-yyyy, now by default")
+    parser.add_argument("--files-dir", default=FILES_DIR)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests at once by host")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="requests by second by host")
+    args = parser.parse_args()
+
+    client = Client(concurrency=args.concurrency, requests_per_second=args.rate)
+    started = time.perf_counter()
+    added = refresh(
+        default_feeds(), args.tokens, args.files_dir,
+        start=datetime.strptime(args.start, "%d-%m-%Y") if args.start else None,
+        end=datetime.strptime(args.end, "%d-%m-%Y") if args.end else None,
+        client=client,
+    )
+    for file_name, rows in added.items():
+        print(f"{file_name:>20} {rows} rows added")
+    print(f"{client.requests} requests ({client.retried} retried) in {time.perf_counter() - started:.1f} s")
@@ -0,0 +1,133 @@
+"""
+Parameter sweep of the BestGain strategy.
+
+The grid is a JSON file mapping each swept parameter to the list of values to try, ie:
+    {"buffer_liquidation": [0.05, 0.1], "taker_fee": [0.0001, 0.0002], "haircuts": [{"BTC": 0.9, "ETH": 0.9}]}
+
+The other inputs are the backtest settings (static_data, or the JSON file of --settings like main.py),
+over the same start - end window as run_backtest.
+
+Run from the repository root:
+    python run_sweep.py grid.json --samples 50 --workers 8 --output sweep.csv
+    python run_sweep.py grid.json --settings run.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from analysis_tools.funding_tools import init_quantity
+from analysis_tools.shared_frame import (SharedFrames, attach_backtest_inputs, pnl_by_token_columns,
+                                        share_backtest_inputs)
+from model.config import Config
+from model.settings import BacktestSettings
+from run_backtest import prepare
+from strategy.best_gain import BestGain, ENGINE_VECTORIZED
+
+CONFIG_PARAMETERS = ["buffer_liquidation", "required_collateral", "spot_perp_fee", "taker_fee", "spot_fee",
+                     "is_partial_allocation"]
+DICT_PARAMETERS = ["haircuts", "inventory"]
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+def parameter_grid(grid: Dict[str, List]) -> List[Dict]:
+    unknown = set(grid) - set(CONFIG_PARAMETERS + DICT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}")
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def parameter_sample(grid: Dict[str, List], samples: int, seed: Optional[int] = None) -> List[Dict]:
+    combinations = parameter_grid(grid)
+    if samples >= len(combinations):
+        return combinations
+    return random.Random(seed).sample(combinations, samples)
+
+
+def _init_worker(dataset_spec, dataset_source, funding_spec, config: Config, settings: BacktestSettings):
+    attach_backtest_inputs(_worker, dataset_spec, dataset_source, funding_spec)
+    # config of the settings without its dataset, the swept parameters replace its fields
+    _worker["config"] = config
+    _worker["settings"] = settings
+
+
+def _run_combination(params: Dict) -> Dict:
+    funding_df = _worker["funding_df"]
+    settings = _worker["settings"]
+    inventory = params.get("inventory", settings.inventory)
+    init_quantity_by_token = settings.init_quantity
+    if "inventory" in params:
+        prices = settings.initial_prices
+        funding_df = funding_df.assign(current_quantity_hold=init_quantity(funding_df["token"], inventory, prices))
+        init_quantity_by_token = {token: amount / prices[token] for token, amount in inventory.items()}
+
+    config = replace(_worker["config"], dataset=_worker["dataset"],
+                     **{name: params[name] for name in CONFIG_PARAMETERS if name in params})
+    strat = BestGain(funding_df, config, inventory, init_quantity_by_token, params.get("haircuts", settings.haircuts))
+    strat.apply(engine=ENGINE_VECTORIZED)
+    strat.apply_stats(verbose=False)
+    return _recap_row(params, strat.recap)
+
+
+def _recap_row(params: Dict, recap: Dict) -> Dict:
+    row = {name: json.dumps(value) if name in DICT_PARAMETERS else value for name, value in params.items()}
+    row["pnl_with_fee"] = recap["pnl_with_fee"]
+    row["apy_with_fee"] = recap["apy_with_fee"]
+    row["fee_amount"] = recap["fee_amount"]
+    row.update(pnl_by_token_columns(recap))
+    return row
+
+
+def sweep(combinations: List[Dict], workers: Optional[int] = None,
+          settings: Optional[BacktestSettings] = None) -> pd.DataFrame:
+    """
+    Run BestGain for each parameter combination in a process pool, the other inputs are the ones of
+    settings (static_data by default) and the data is the start - end window of settings, like run_backtest.
+    The dataset and the funding dataframe are loaded once and shared read-only with the workers.
+    Returns one row per combination with its parameters and recap.
+    """
+    settings = settings or BacktestSettings()
+    funding_df, config = prepare(settings)
+    dataset = config.dataset
+
+    with SharedFrames() as shared:
+        inputs = share_backtest_inputs(shared, dataset, funding_df)
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(*inputs, replace(config, dataset=None), settings)) as executor:
+            chunksize = max(1, len(combinations) // (4 * workers))
+            rows = list(executor.map(_run_combination, combinations, chunksize=chunksize))
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("grid", help="JSON file with the values of each parameter")
+    parser.add_argument("--samples", type=int, help="run a random sample of the grid instead of the full grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="CSV file for the results, printed when omitted")
+    parser.add_argument("--settings", help="JSON file of backtest settings, like main.py")
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    if args.samples:
+        combinations = parameter_sample(grid, args.samples, args.seed)
+    else:
+        combinations = parameter_grid(grid)
+
+    results = sweep(combinations, args.workers, BacktestSettings.load(args.settings))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string())
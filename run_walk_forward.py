@@ -0,0 +1,139 @@
+"""
+Walk-forward backtest of the BestGain strategy.
+
+The START_TIME - END_TIME range is split in rolling windows (or expanding windows from START_TIME)
+evaluated in parallel, each window is a full BestGain backtest of its own dates. Periods are a
+number followed by D (days), W (weeks), M (months) or Y (years).
+
+Run from the repository root:
+    python run_walk_forward.py --window 1M --step 1M --workers 8 --output walk_forward.csv
+    python run_walk_forward.py --window 1M --step 1M --expanding
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.compute_data import compute_funding_dataframe
+from analysis_tools.loading_data import loading_data
+from analysis_tools.shared_frame import (SharedFrames, attach_backtest_inputs, pnl_by_token_columns,
+                                        share_backtest_inputs)
+from model.config import Config
+from static_data import START_TIME, END_TIME, INVENTORY, INIT_QUANTITY, HAIRCUTS, INITIAL_PRICES
+from strategy.best_gain import BestGain, ENGINE_VECTORIZED
+
+PERIOD_UNITS = {"D": "days", "W": "weeks", "M": "months", "Y": "years"}
+METRICS = ["pnl_with_fee", "apy_with_fee", "fee_amount"]
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+def parse_period(period: str) -> pd.DateOffset:
+    count, unit = period[:-1], period[-1:].upper()
+    if unit not in PERIOD_UNITS or not count.isdigit() or int(count) == 0:
+        raise ValueError(f"Invalid period {period}, expected a number followed by one of {list(PERIOD_UNITS)}")
+    return pd.DateOffset(**{PERIOD_UNITS[unit]: int(count)})
+
+
+def walk_forward_windows(start_date: datetime, end_date: datetime, window: pd.DateOffset, step: pd.DateOffset,
+                         expanding: bool = False) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    [start, end) windows inside [start_date, end_date).
+    Rolling windows last window and start every step, expanding windows all start at start_date and
+    grow by step. Only complete windows are returned.
+    """
+    start_date = pd.Timestamp(start_date)
+    windows = []
+    i = 0
+    while True:
+        window_start = start_date if expanding else start_date + step * i
+        window_end = start_date + window + step * i if expanding else window_start + window
+        if window_end > end_date:
+            break
+        windows.append((window_start, window_end))
+        i += 1
+    if not windows:
+        raise ValueError(f"No complete window between {start_date} and {end_date}")
+    return windows
+
+
+def _init_worker(dataset_spec, dataset_source, funding_spec):
+    attach_backtest_inputs(_worker, dataset_spec, dataset_source, funding_spec)
+
+
+def _run_window(window: Tuple[datetime, datetime]) -> Dict:
+    start_date, end_date = window
+    funding_df = _worker["funding_df"]
+    # funding_df is sorted by timestamp (see walk_forward), the window is a slice of it
+    timestamps = funding_df["timestamp"].to_numpy()
+    first, last = np.searchsorted(timestamps, [np.datetime64(start_date, "ns"), np.datetime64(end_date, "ns")])
+    window_df = funding_df.iloc[first:last].reset_index(drop=True)
+
+    row = {"window_start": start_date, "window_end": end_date, "timestamps": window_df["timestamp"].nunique()}
+    if window_df.empty:
+        return row
+
+    config = Config(dataset=_worker["dataset"], start_date=start_date, end_date=end_date - timedelta(days=1))
+    strat = BestGain(window_df, config, INVENTORY, INIT_QUANTITY, HAIRCUTS)
+    strat.apply(engine=ENGINE_VECTORIZED)
+    strat.apply_stats(verbose=False)
+    for metric in METRICS:
+        row[metric] = strat.recap[metric]
+    row.update(pnl_by_token_columns(strat.recap))
+    return row
+
+
+def walk_forward(windows: List[Tuple[datetime, datetime]], workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Run BestGain on each window in a process pool.
+    The data of all the windows is loaded once and shared read-only with the workers.
+    Returns one row per window with its recap, windows without data have no metric.
+    """
+    dataset = loading_data(start_date=min(start for start, _ in windows), end_date=max(end for _, end in windows))
+    funding_df = compute_funding_dataframe(dataset, INVENTORY, INITIAL_PRICES)
+    # The workers slice the windows out of funding_df by binary search on its timestamps
+    if not funding_df["timestamp"].is_monotonic_increasing:
+        funding_df = funding_df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+    with SharedFrames() as shared:
+        inputs = share_backtest_inputs(shared, dataset, funding_df)
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=inputs) as executor:
+            rows = list(executor.map(_run_window, windows))
+    return pd.DataFrame(rows)
+
+
+def walk_forward_summary(report: pd.DataFrame) -> pd.DataFrame:
+    # Distribution of each metric over the windows and share of windows above zero
+    metrics = report.reindex(columns=METRICS)
+    summary = metrics.describe().T
+    summary["positive_share"] = (metrics > 0).sum() / metrics.notna().sum()
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", default="1M", help="length of each window")
+    parser.add_argument("--step", help="shift between two windows, the window length by default")
+    parser.add_argument("--expanding", action="store_true", help="windows all start at START_TIME")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="CSV file for the report of each window")
+    args = parser.parse_args()
+
+    # END_TIME is the last day included
+    start_date = datetime.strptime(START_TIME, "%d-%m-%Y")
+    end_date = datetime.strptime(END_TIME, "%d-%m-%Y") + timedelta(days=1)
+    windows = walk_forward_windows(start_date, end_date, parse_period(args.window), parse_period(args.step or args.window),
+                                   args.expanding)
+
+    report = walk_forward(windows, args.workers)
+    if args.output:
+        report.to_csv(args.output, index=False)
+    else:
+        print(report.to_string())
+    print(f"\n{walk_forward_summary(report).to_string()}")
@@ -1,7 +1,249 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
 import pandas as pd
+from analysis_tools.bootstrap import BootstrapReport, bootstrap_pnl
+from analysis_tools.funding_tools import FUNDING_RATE_PREFIX, best_funding, funding_rates
+from analysis_tools.margin_monitor import MarginReport, monitor_margin
+from analysis_tools.memo import memoize
+from analysis_tools.profiling import stage
+from analysis_tools.shared_inputs import SharedInputs
 from model.config import Config
+from strategy.checkpoint import resume_checkpoint
+from strategy.result_ledger import ResultLedger, VALUE_COLUMNS
 import numpy as np
 
+ENGINE_LOOP = "loop"
+ENGINE_VECTORIZED = "vectorized"
+
+
+def _grouped_sum(values: np.ndarray, mask: np.ndarray, group_ids: np.ndarray, n_groups: int) -> np.ndarray:
+    # Sum of values[mask] by group, added one row after the other in row order like the loop engine does
+    # NaN values (a spot bar without close) are skipped like pandas sums do
+    mask = mask & ~np.isnan(values)
+    return np.bincount(group_ids[mask], weights=values[mask], minlength=n_groups)
+
+
+def _grouped_sort_desc(values: np.ndarray, group_ids: np.ndarray, n_groups: int) -> np.ndarray:
+    # Row order with groups in id order and values sorted descending inside each group.
+    # Each group goes through the same argsort as DataFrame.sort_values(ascending=False) and
+    # groups of the same size are sorted together as a 2-D block, so ties end up in the same order.
+    # NaN values go last in their row order, like na_position="last".
+    by_group = np.argsort(group_ids, kind="stable")
+    sizes = np.bincount(group_ids, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    order = np.empty_like(by_group)
+    for size in np.unique(sizes[sizes > 0]):
+        positions = starts[sizes == size, None] + np.arange(size)
+        reversed_rows = by_group[positions][:, ::-1]
+        ranked = np.take_along_axis(reversed_rows, np.argsort(values[reversed_rows], axis=1, kind="quicksort"), axis=1)
+        ranked = ranked[:, ::-1]
+        # Groups with NaN values are sorted one by one without them, then the NaN rows are appended
+        for i in np.flatnonzero(np.isnan(values[reversed_rows]).any(axis=1)):
+            rows = reversed_rows[i]
+            is_nan = np.isnan(values[rows])
+            rows = rows[~is_nan]
+            ranked[i] = np.concatenate([rows[np.argsort(values[rows], kind="quicksort")][::-1],
+                                        reversed_rows[i][is_nan][::-1]])
+        order[positions] = ranked
+    return order
+
+
+def _fractional_allocation(collateral_value_usd: np.ndarray, collateral_needed_usd: np.ndarray,
+                           potential_gain_usd: np.ndarray, owned: np.ndarray, group_ids: np.ndarray, n_groups: int,
+                           config: Config) -> np.ndarray:
+    # Fraction of each line to invest, the rest being posted as collateral.
+    # Investing x of a line needs x * collateral_needed_usd and removes x * collateral_value_usd from the
+    # posted collateral, so with b = buffer_liquidation each timestamp is the fractional knapsack
+    #     sum(x * (needed + (1 - b) * value)) <= (1 - b) * sum(value)
+    # maximizing the gain net of fees. It is solved for all the timestamps at once: lines are sorted
+    # by net gain per unit of capacity and filled until the capacity of their timestamp is used.
+    one_minus_buffer = 1 - config.buffer_liquidation
+    capacity = one_minus_buffer * _grouped_sum(collateral_value_usd, owned, group_ids, n_groups)
+    weight = collateral_needed_usd + one_minus_buffer * collateral_value_usd
+    net_gain = (potential_gain_usd * (1 - config.taker_fee) - 2 * config.spot_perp_fee * collateral_needed_usd
+                + 2 * config.spot_fee * collateral_value_usd)
+    candidate = owned & (net_gain > 0) & (weight > 0)
+    ratio = np.where(candidate, net_gain / np.where(candidate, weight, 1), -np.inf)
+
+    order = np.lexsort((-ratio, group_ids))
+    sorted_groups = group_ids[order]
+    sorted_weight = np.where(candidate[order], weight[order], 0)
+    used = np.cumsum(sorted_weight) - sorted_weight
+    group_starts = np.searchsorted(sorted_groups, np.arange(n_groups))
+    used -= used[np.minimum(group_starts, len(used) - 1)][sorted_groups] if len(used) else 0
+    left = capacity[sorted_groups] - used
+    fraction = np.zeros(len(order))
+    fraction[candidate[order]] = np.clip(left[candidate[order]] / sorted_weight[candidate[order]], 0, 1)
+
+    invested_fraction = np.zeros(len(order))
+    invested_fraction[order] = fraction
+    return invested_fraction
+
+
+@dataclass()
+class Allocation:
+    """
+    Output of allocate(). Arrays are in result order: for each timestamp the USDT line then the
+    tokens by potential gain descending. source is the input row each line comes from (the best
+    row of the timestamp for the USDT line). is_profitable and fee_amount are by timestamp.
+    invested_fraction is the share of each line that is invested, 0 or 1 unless partial.
+    """
+    source: np.ndarray
+    group_ids: np.ndarray
+    rank: np.ndarray
+    is_usdt: np.ndarray
+    owned: np.ndarray
+    quantity_hold: np.ndarray
+    collateral_value: np.ndarray
+    collateral_value_usd: np.ndarray
+    potential_gain: np.ndarray
+    potential_gain_usd: np.ndarray
+    collateral_needed_usd: np.ndarray
+    is_invested: np.ndarray
+    invested_fraction: np.ndarray
+    is_profitable: np.ndarray
+    fee_amount: np.ndarray
+
+
+def allocate(timestamp_codes: np.ndarray, token: np.ndarray, close: np.ndarray, quantity: np.ndarray,
+             rates: np.ndarray, config: Config, inventory: Dict,
+             init_quantity: Dict, haircuts: Dict, partial: bool = False) -> Allocation:
+    """
+    BestGain allocation of every timestamp at once, same decisions as the loop engine.
+    Rows are sorted once by (timestamp, potential_gain_usd), the USDT line is inserted at the
+    head of each timestamp and the greedy POSTED/INVESTED walk is done rank by rank,
+    each step handling the row of that rank for all the timestamps together.
+    timestamp_codes numbers the timestamps 0..n-1 in the order they are processed, rates holds the
+    funding rate of each exchange (rows, exchanges).
+    With partial, lines are allocated by _fractional_allocation instead of the greedy walk.
+    """
+    owned_tokens = list(inventory.keys())
+    one_minus_buffer = 1 - config.buffer_liquidation
+    n_groups = int(timestamp_codes.max()) + 1 if len(timestamp_codes) else 0
+    token_series = pd.Series(token)
+    is_owned = token_series.isin(owned_tokens).to_numpy()
+
+    # Row level values (see _calculate_collateral_values and _calculate_gain)
+    haircut = np.where(is_owned, token_series.str[:-4].map(haircuts).fillna(1).to_numpy(dtype=float), 1)
+    collateral_value = quantity * haircut
+    collateral_value_usd = (collateral_value * close) / config.required_collateral
+    _, best_rate = best_funding(rates)
+    no_gain = (rates <= 0).all(axis=1)
+    potential_gain = np.where(no_gain, 0, quantity * best_rate)
+    potential_gain_usd = potential_gain * close
+    collateral_needed_usd = quantity * close
+
+    # Sort by timestamp then by gain descending
+    order = _grouped_sort_desc(potential_gain_usd, timestamp_codes, n_groups)
+    sorted_groups = timestamp_codes[order]
+    group_sizes = np.bincount(sorted_groups, minlength=n_groups)
+    sorted_starts = np.cumsum(group_sizes) - group_sizes
+
+    # Layout with one USDT line at the head of each timestamp
+    n_rows = len(order) + n_groups
+    usdt_pos = sorted_starts + np.arange(n_groups)
+    token_pos = np.arange(len(order)) + sorted_groups + 1
+    group_ids = np.empty(n_rows, dtype=np.int64)
+    group_ids[usdt_pos] = np.arange(n_groups)
+    group_ids[token_pos] = sorted_groups
+    rank = np.arange(n_rows) - usdt_pos[group_ids]
+    source = np.empty(n_rows, dtype=np.int64)
+    source[token_pos] = order
+    # The USDT line is a copy of the best row of the timestamp
+    source[usdt_pos] = order[sorted_starts]
+    is_usdt = np.zeros(n_rows, dtype=bool)
+    is_usdt[usdt_pos] = True
+
+    cv_usd = collateral_value_usd[source]
+    needed_usd = collateral_needed_usd[source]
+    quantity_hold = quantity[source]
+    gain = potential_gain[source]
+    gain_usd = potential_gain_usd[source]
+    owned = is_owned[source]
+
+    usdt_quantity = init_quantity["USDT"]
+    usdt_close = close[source[usdt_pos]]
+    usdt_hold = usdt_quantity / usdt_close
+    cv_usd[usdt_pos] = usdt_quantity
+    needed_usd[usdt_pos] = usdt_quantity
+    quantity_hold[usdt_pos] = usdt_hold
+    gain[usdt_pos] = usdt_hold
+    gain_usd[usdt_pos] = np.where(no_gain[source[usdt_pos]], 0, usdt_hold * best_rate[source[usdt_pos]]) * usdt_close
+    owned[usdt_pos] = "USDT" in owned_tokens
+
+    if partial:
+        invested_fraction = _fractional_allocation(cv_usd, needed_usd, gain_usd, owned, group_ids, n_groups, config)
+        is_invested = invested_fraction > 0
+        gain_invested = np.bincount(group_ids, weights=invested_fraction * gain_usd, minlength=n_groups)
+        posted_value = np.bincount(group_ids, weights=np.where(owned, (1 - invested_fraction) * cv_usd, 0), minlength=n_groups)
+        invested_needed = np.bincount(group_ids, weights=invested_fraction * needed_usd, minlength=n_groups)
+    else:
+        # Greedy allocation, walked rank by rank for all timestamps at once
+        collateral_available = _grouped_sum(cv_usd, owned, group_ids, n_groups)
+        invested_amount = np.zeros(n_groups)
+        is_invested = np.zeros(n_rows, dtype=bool)
+        for k in range(int(group_sizes.max()) + 1 if n_groups else 0):
+            rows = usdt_pos[group_sizes + 1 > k] + k
+            rows = rows[owned[rows]]
+            groups = group_ids[rows]
+            temp = (collateral_available[groups] - cv_usd[rows]) * one_minus_buffer
+            # Not "<", like _apply_best_allocation: a NaN value (spot bar without close) is invested
+            invest = ~(temp < invested_amount[groups] + needed_usd[rows])
+            rows, groups = rows[invest], groups[invest]
+            collateral_available[groups] -= cv_usd[rows]
+            invested_amount[groups] += needed_usd[rows]
+            is_invested[rows] = True
+        invested_fraction = is_invested.astype(float)
+        gain_invested = _grouped_sum(gain_usd, is_invested, group_ids, n_groups)
+        posted_value = _grouped_sum(cv_usd, owned & ~is_invested, group_ids, n_groups)
+        invested_needed = _grouped_sum(needed_usd, is_invested, group_ids, n_groups)
+
+    # Fees and profitability by timestamp (see is_profitable_trade)
+    fees_amount_spot = 2 * (posted_value * config.spot_fee)
+    fees_amount_taker = gain_invested * config.taker_fee
+    fees_amount_spot_perp = 2 * (invested_needed * config.spot_perp_fee)
+    fees_amount = (fees_amount_spot + fees_amount_taker + fees_amount_spot_perp)
+
+    return Allocation(
+        source=source,
+        group_ids=group_ids,
+        rank=rank,
+        is_usdt=is_usdt,
+        owned=owned,
+        quantity_hold=quantity_hold,
+        collateral_value=collateral_value[source],
+        collateral_value_usd=cv_usd,
+        potential_gain=gain,
+        potential_gain_usd=gain_usd,
+        collateral_needed_usd=needed_usd,
+        is_invested=is_invested,
+        invested_fraction=invested_fraction,
+        is_profitable=gain_invested > fees_amount,
+        fee_amount=fees_amount,
+    )
+
+
+def merge_spot_prices(funding_df: pd.DataFrame, dataset, price_tolerance=None) -> pd.DataFrame:
+    # Add the spot price closed at the funding timestamp, rows without an hourly bar are dropped (a bar
+    # with a NaN close is kept, like the original merge did)
+    # With price_tolerance, the last price closed up to price_tolerance before the timestamp, rows without
+    # one are dropped
+    price_index = dataset.price_index("close_time")
+    if price_tolerance is None:
+        close = price_index.lookup(funding_df["token"], funding_df["timestamp"])
+        has_price = price_index.has_bar(funding_df["token"], funding_df["timestamp"])
+    else:
+        close = price_index.asof(funding_df["token"], funding_df["timestamp"], price_tolerance)
+        has_price = ~np.isnan(close)
+    unused_columns = ["funding_interval_hours", "symbol", "is_market_funding_arb"] + [
+        column for column in funding_df.columns if column.startswith("is_buy_long_perp_")]
+    merged_df = funding_df.loc[has_price].drop(unused_columns, axis=1).reset_index(drop=True)
+    merged_df["close_time"] = merged_df["timestamp"]
+    merged_df["close"] = close[has_price]
+    return merged_df
+
+
 class BestGain:
     """
     Strategy Explanation:
@@ -14,13 +256,19 @@ class BestGain:
     Important: We keep 5% of overcollateralization to avoid liquidation
     """
 
-    def __init__(self, funding_df: pd.DataFrame, config: Config, inventory, init_quantity, haircuts):
+    def __init__(self, funding_df: pd.DataFrame, config: Config, inventory, init_quantity, haircuts,
+                 shared: Optional[SharedInputs] = None):
         self.config = config
-        # Extract spot price data from the config
-        self.df_spot_perp = config.dataset.spot_prices_binance[["close_time", "close", "token"]]
-        # Merge funding data with spot price data
-        self.df = self._merge_data(funding_df)
-        # Placeholder for the final result
+        # Merge funding data with spot price data, once for all the strategies given the same shared inputs
+        with stage("BestGain._merge_data") as timed:
+            if shared is None:
+                self.df = self._merge_data(funding_df)
+            else:
+                self.df = shared.get(("merged_spot_prices", config.price_tolerance), lambda: self._merge_data(funding_df))
+            self.unpriced_rows = len(funding_df) - len(self.df)
+            timed.rows = len(self.df)
+        # Placeholder for the final result, the ledger is filled by apply()
+        self.ledger: ResultLedger = None
         self.result = None
         self.recap = None
         self.inventory = inventory
@@ -28,45 +276,148 @@ class BestGain:
         self.haircuts = haircuts
 
     def _merge_data(self, funding_df: pd.DataFrame) -> pd.DataFrame:
-        # Perform a merge on the funding data with spot prices on timestamp and token
-        merged_df = funding_df.merge(
-            self.df_spot_perp, left_on=["timestamp", "token"], right_on=["close_time", "token"]
-        ).drop(
-            ["funding_interval_hours", "symbol", "is_market_funding_arb", "is_buy_long_perp_binance", "is_buy_long_perp_bybite"], axis=1
-        )
-        return merged_df
+        # Saved by funding_df content, dataset version and price_tolerance (see memo.memoize)
+        return memoize(merge_spot_prices, funding_df, self.config.dataset, self.config.price_tolerance)
+
+    @property
+    def result(self) -> pd.DataFrame:
+        # Result frame, built from the ledger the first time it is read
+        if self._result is None and self.ledger is not None:
+            self._result = self.ledger.to_frame(self.df)
+        return self._result
+
+    @result.setter
+    def result(self, result: pd.DataFrame):
+        self._result = result
 
-    def apply(self):
-        df_list = []
+    def apply(self, engine: Optional[str] = None):
+        # engine is ENGINE_LOOP (None) or ENGINE_VECTORIZED, the partial allocation is always vectorized
+        if engine not in (None, ENGINE_LOOP, ENGINE_VECTORIZED):
+            raise ValueError(f"Unknown engine {engine}, expected '{ENGINE_LOOP}' or '{ENGINE_VECTORIZED}'")
+        self.result = None
+        if self.config.is_partial_allocation:
+            if engine == ENGINE_LOOP:
+                raise ValueError(f"The partial allocation is only computed as a batch over all the timestamps, "
+                                 f"use engine '{ENGINE_VECTORIZED}'")
+            return self._compute_best_allocation()
+        if engine == ENGINE_VECTORIZED:
+            return self._apply_vectorized()
+        owned_tokens = list(self.inventory.keys())
         unique_dates = self.df.timestamp.unique()
+        # At most one line by owned token and one USDT line by date
+        capacity = int(self.df["token"].isin(owned_tokens).sum()) + len(unique_dates)
+        self.ledger = ResultLedger(capacity, owned_tokens)
+        token_index = pd.Index(owned_tokens)
         # Process each unique date separately
-        for date in unique_dates:
-            self.collateral_posted = 0
-            # Filter rows for the current date
-            df_date = self.df[self.df.timestamp == date].copy()
+        for group, date in enumerate(unique_dates):
+            with stage("BestGain.apply.date") as timed:
+                sorted_df, source = self._apply_date(date)
+                self._write_date(group, sorted_df, source, token_index)
+                timed.rows = len(sorted_df)
+
+    def resume(self, checkpoint: str, engine: Optional[str] = None) -> int:
+        # apply() to the timestamps after the checkpoint file only, then checkpoint them all (see resume_checkpoint)
+        def apply(df: pd.DataFrame) -> ResultLedger:
+            self.df = df
+            self.apply(engine)
+            return self.ledger
+        return resume_checkpoint(self, checkpoint, apply)
+
+    def _write_date(self, group: int, sorted_df: pd.DataFrame, source: np.ndarray, token_index: pd.Index):
+        # Write the owned lines of a date in the ledger, the others are dropped
+        owned = sorted_df["token"].isin(token_index).to_numpy()
+        lines = sorted_df.loc[owned]
+        self.ledger.write(
+            np.full(len(lines), group), source[owned], np.flatnonzero(owned), token_index.get_indexer(lines["token"]),
+            lines["is_usdt_invest"].to_numpy(dtype=bool), (lines["ACTION"] == "INVESTED").to_numpy(),
+            lines["is_profitable"].to_numpy(dtype=bool), lines["fee_amount"].to_numpy(dtype=float),
+            {column: lines[column].to_numpy(dtype=float) for column in VALUE_COLUMNS},
+        )
+
+    def _apply_date(self, date):
+        # Lines of the date in allocation order and the row of self.df each line comes from
+        self.collateral_posted = 0
+        # Filter rows for the current date
+        df_date = self.df[self.df.timestamp == date].copy()
+        with stage("BestGain._calculate_collateral_values"):
             self._calculate_collateral_values(df_date)
+        with stage("BestGain._calculate_gain"):
             self._calculate_gain(df_date)
-            # Sort by potential gain in USD
-            sorted_df = df_date.sort_values(by=['potential_gain_usd'], ascending=False)
+        # Sort by potential gain in USD
+        sorted_df = df_date.sort_values(by=['potential_gain_usd'], ascending=False)
+        # The USDT line is a copy of the first row
+        source = np.concatenate([sorted_df.index[:1], sorted_df.index])
 
-            # USDT line management
-            sorted_df["is_usdt_invest"] = False
+        # USDT line management
+        sorted_df["is_usdt_invest"] = False
 
-            last_row_copy = self._compute_last_row(sorted_df)
-            # Append the modified row to the DataFrame using pd.concat
-            sorted_df = pd.concat([last_row_copy.to_frame().T, sorted_df], ignore_index=True)
-            # Sum up the total collateral needed for the day
-            self.collateral_available = sorted_df.loc[sorted_df["token"].isin(list(self.inventory.keys())), "collateral_value_usd"].sum()
-            self.invested_amount = 0
+        last_row_copy = self._compute_last_row(sorted_df)
+        # Append the modified row to the DataFrame using pd.concat
+        sorted_df = pd.concat([last_row_copy.to_frame().T, sorted_df], ignore_index=True)
+        # Sum up the total collateral needed for the day
+        self.collateral_available = sorted_df.loc[sorted_df["token"].isin(list(self.inventory.keys())), "collateral_value_usd"].sum()
+        self.invested_amount = 0
 
+        with stage("BestGain._compute_strategy"):
             self._compute_strategy(sorted_df)
+        return sorted_df, source
+
+    def _apply_vectorized(self, partial: bool = False):
+        """
+        Same allocation as the loop engine, computed for every timestamp at once (see allocate).
+        With partial, a token partly invested gives two lines: the INVESTED part and the POSTED
+        part, with quantities and values split by allocated_fraction.
+        """
+        df = self.df
+        timestamp_codes, _ = pd.factorize(df["timestamp"])
+        token = df["token"].to_numpy()
+        with stage("BestGain.allocate") as timed:
+            allocation = allocate(
+                timestamp_codes, token, df["close"].to_numpy(dtype=float),
+                df["current_quantity_hold"].to_numpy(dtype=float), funding_rates(df), self.config, self.inventory,
+                self.init_quantity, self.haircuts, partial=partial,
+            )
+            timed.rows = len(df)
 
-            df_list.append(sorted_df)
-        # Concatenate all the processed daily data
-        self.result = pd.concat(df_list)
-        self.result = self.result.loc[self.result["token"].isin((self.inventory.keys()))]
-        # Format the timestamp into a readable date format
-        self.result["date_daily"] = pd.to_datetime(self.result["timestamp"]).dt.strftime("%d-%m-%Y")
+        with stage("BestGain.ledger") as timed:
+            self.ledger = self._allocation_ledger(token, allocation, partial)
+            timed.rows = len(self.ledger)
+
+    def _allocation_ledger(self, token: np.ndarray, allocation: Allocation, partial: bool) -> ResultLedger:
+        # One line by owned token (two for a split token) with the decision of allocate
+        keep = np.flatnonzero(allocation.owned)
+        if partial:
+            fraction = allocation.invested_fraction[keep]
+            is_split = (fraction > 0) & (fraction < 1)
+            keep = np.repeat(keep, np.where(is_split, 2, 1))
+            # The second line of a split token is its posted part
+            is_posted_part = np.zeros(len(keep), dtype=bool)
+            is_posted_part[1:] = keep[1:] == keep[:-1]
+            is_invested = (allocation.invested_fraction[keep] > 0) & ~is_posted_part
+            allocated_fraction = np.where(is_invested, allocation.invested_fraction[keep],
+                                          1 - allocation.invested_fraction[keep])
+        else:
+            is_invested = allocation.is_invested[keep]
+            allocated_fraction = 1
+        source = allocation.source[keep]
+        groups = allocation.group_ids[keep]
+        owned_tokens = list(self.inventory.keys())
+        ledger = ResultLedger(len(keep), owned_tokens, partial)
+        ledger.write(
+            groups, source, allocation.rank[keep],
+            pd.Index(owned_tokens).get_indexer(np.where(allocation.is_usdt[keep], "USDT", token[source])),
+            allocation.is_usdt[keep], is_invested, allocation.is_profitable[groups], allocation.fee_amount[groups],
+            {
+                "current_quantity_hold": allocation.quantity_hold[keep] * allocated_fraction,
+                "collateral_value": allocation.collateral_value[keep] * allocated_fraction,
+                "collateral_value_usd": allocation.collateral_value_usd[keep] * allocated_fraction,
+                "potential_gain": allocation.potential_gain[keep] * allocated_fraction,
+                "potential_gain_usd": allocation.potential_gain_usd[keep] * allocated_fraction,
+                "collateral_needed_usd": allocation.collateral_needed_usd[keep] * allocated_fraction,
+            },
+            allocated_fraction,
+        )
+        return ledger
 
     def _compute_last_row(self, sorted_df):
         last_row_copy = sorted_df.iloc[0].copy()
@@ -110,22 +461,27 @@ class BestGain:
         return (gain_usd > fees_amount, fees_amount)
 
     def get_pnl_by_token(self) -> pd.DataFrame:
-        profitable_value = self.get_profitable_trade()
-        pnl_by_token = profitable_value.pivot_table(values="potential_gain_usd", index="token", columns=[],
-                                                    aggfunc='sum')
-        pnl_by_token.reset_index(inplace=True)
+        pnl_by_token = self.ledger.pnl_by_token()
         pnl_by_token["amount_invested"] = pnl_by_token["token"].apply(lambda x: self.inventory[x])
         pnl_by_token["APY_BY_TOKEN"] = pnl_by_token["potential_gain_usd"] / pnl_by_token["amount_invested"]
         return pnl_by_token
 
+    def monitor_margin(self, **kwargs) -> MarginReport:
+        # Hourly margin of the positions of apply() (see monitor_margin), needs the hourly high and low
+        return monitor_margin(self.df, self.ledger, self.config.dataset.spot_prices_binance, self.config, **kwargs)
+
+    def bootstrap(self, **kwargs) -> BootstrapReport:
+        # PnL distribution of block bootstrapped paths of the timestamps of apply() (see bootstrap_pnl)
+        return bootstrap_pnl(self.df, self.ledger, self.inventory, **kwargs)
+
     def get_profitable_trade(self):
-        return self.result.loc[(self.result["is_profitable"] == True) & (self.result["ACTION"] == "INVESTED")]
+        # Lines picked on the ledger, only their rows of the result frame are built
+        return self.ledger.to_frame(self.df, self.ledger.profitable_invested_lines())
 
-    def apply_stats(self):
-        profitable_value = self.get_profitable_trade()
+    def apply_stats(self, verbose: bool = True):
+        # From the totals of the ledger, the result frame is not needed
         pnl_by_token = self.get_pnl_by_token()
-
-        fee = profitable_value.pivot_table(values="fee_amount", index="timestamp", columns=[], aggfunc=np.mean).sum().values[0]
+        fee = self.ledger.fee_total()
 
         pnl_without_fee = pnl_by_token["potential_gain_usd"].sum()
 
@@ -135,12 +491,13 @@ class BestGain:
         pnl_by_token["gain_with_fee"] = (pnl / pnl_without_fee) * (pnl_by_token["potential_gain_usd"])
         pnl_by_token["APY_with_fee"] = pnl_by_token["gain_with_fee"] / pnl_by_token["amount_invested"]
 
-        print(f"PnL (with fees) {pnl:.2f} $\n"
-              f"           Fees {fee:.2f} $\n"
-              f"            APY {apy:.2f} %\n\n"
-              f"{'*' * 25} RECAP {'*' * 28}\n\n"
-              f"{pnl_by_token}"
-              )
+        if verbose:
+            print(f"PnL (with fees) {pnl:.2f} $\n"
+                  f"           Fees {fee:.2f} $\n"
+                  f"            APY {apy:.2f} %\n\n"
+                  f"{'*' * 25} RECAP {'*' * 28}\n\n"
+                  f"{pnl_by_token}"
+                  )
 
         self.recap = {
             "pnl_with_fee":pnl,
@@ -149,26 +506,31 @@ class BestGain:
             "pnl_by_token":pnl_by_token,
         }
 
+    @staticmethod
+    def _best_rate(row) -> float:
+        # Highest funding rate among the exchanges
+        return max(row[column] for column in row.index if column.startswith(FUNDING_RATE_PREFIX))
+
     @staticmethod
     def _apply_potential_gain(row):
         # Calculate potential gain based on funding rates
-        if row["funding_rate_binance"] <= 0 and row["funding_rate_bybite"] <= 0:
+        best_rate = BestGain._best_rate(row)
+        if best_rate <= 0:
             return 0
-        return row['current_quantity_hold'] * max(row["funding_rate_binance"], row["funding_rate_bybite"])
+        return row['current_quantity_hold'] * best_rate
 
     def _apply_potential_gain_usdt(self, row) -> float:
         available = (self.collateral_posted - self.collateral_needed) * (1 - self.config.buffer_liquidation)
         invest_usdt = self.inventory.get(row["token"]) if available > self.inventory.get(row["token"]) else available
-        return (invest_usdt / row['close']) * max(row["funding_rate_binance"], row["funding_rate_bybite"])
+        return (invest_usdt / row['close']) * self._best_rate(row)
 
     def _apply_best_allocation(self, row) -> str:
         if row["token"] not in list(self.inventory.keys()):
             return ["NOT OWNED"]
-        # result = self._compute_best_allocation(row)
         temp = (self.collateral_available - row["collateral_value_usd"]) * (1-self.config.buffer_liquidation)
         # Allocate collateral based on whether the total needed collateral has been posted
         if temp < self.invested_amount + row["collateral_needed_usd"]:
-            # todo to optimize to allow a partial allocation
+            # See Config.is_partial_allocation to invest only a part of the token
             self.collateral_posted += row["collateral_value_usd"]
             return "POSTED"
         else:
@@ -176,5 +538,6 @@ class BestGain:
             self.invested_amount += row["collateral_needed_usd"]
             return "INVESTED"
 
-    def _compute_best_allocation(self, row):
-        pass
+    def _compute_best_allocation(self):
+        # Partial allocation, solved for every timestamp at once (see _fractional_allocation)
+        self._apply_vectorized(partial=True)
@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+
+from model.config import Config
+from strategy.best_gain import allocate
+
+# Suffixes of the funding_rate_<exchange> columns of funding_df
+EXCHANGES = ("binance", "bybite")
+
+
+@dataclass()
+class FundingEvent:
+    timestamp: datetime
+    token: str
+    exchange: str  # one of BestGainOnline.exchanges
+    funding_rate: float
+
+
+@dataclass()
+class PriceEvent:
+    close_time: datetime
+    token: str
+    close: float
+
+
+@dataclass()
+class BestGainDecision:
+    timestamp: datetime
+    # POSTED or INVESTED for each token of the inventory (and USDT), in allocation order
+    actions: Dict[str, str]
+    # Share of each token invested, below 1 only with Config.is_partial_allocation
+    invested_fraction: Dict[str, float]
+    potential_gain_usd: Dict[str, float]
+    is_profitable: bool
+    fee_amount: float
+
+
+class BestGainOnline:
+    """
+    Streaming version of BestGain for live funding prints.
+
+    Events are fed one at a time in time order with on_event(). A token takes part in a timestamp
+    when it has a funding print on every exchange and a spot price closed at that timestamp, like
+    the inner joins of the batch pipeline. The timestamp is evaluated as soon as an event of a later
+    time arrives (or on flush()) and the decision is returned; only the rows of that timestamp are
+    kept, so each evaluation costs O(number of tokens).
+    The rates are reset once a timestamp is evaluated, so the tokens of a timestamp are in the order
+    of their first funding print at that timestamp: feed them in the row order of funding_df to get
+    the lines of the batch engines. exchanges lists the venues a token needs a print from, with the
+    names and in the column order of funding_df.
+    """
+
+    def __init__(self, config: Config, inventory, init_quantity, haircuts, initial_prices,
+                 exchanges: Sequence[str] = EXCHANGES):
+        self.config = config
+        self.exchanges = tuple(exchanges)
+        self.inventory = inventory
+        self.init_quantity = init_quantity
+        self.haircuts = haircuts
+        self.initial_prices = initial_prices
+        # Quantity held by token, constant over time like current_quantity_hold in funding_df
+        self._quantity_hold: Dict[str, float] = {}
+        # State of the timestamp being received
+        self._timestamp = None
+        self._rates: Dict[str, Dict[str, float]] = {}
+        self._closes: Dict[str, float] = {}
+
+    def on_event(self, event: Union[FundingEvent, PriceEvent]) -> Optional[BestGainDecision]:
+        time = event.timestamp if isinstance(event, FundingEvent) else event.close_time
+        decision = None
+        if self._timestamp is not None and time != self._timestamp:
+            if time < self._timestamp:
+                raise ValueError(f"Event at {time} received after {self._timestamp}, events must be in time order")
+            decision = self.flush()
+        self._timestamp = time
+
+        if isinstance(event, FundingEvent):
+            if event.exchange not in self.exchanges:
+                raise ValueError(f"Unknown exchange {event.exchange}, expected one of {self.exchanges}")
+            self._rates.setdefault(event.token, {})[event.exchange] = event.funding_rate
+        else:
+            self._closes[event.token] = event.close
+        return decision
+
+    def flush(self) -> Optional[BestGainDecision]:
+        # Evaluate the timestamp received so far, None when no token is complete
+        timestamp = self._timestamp
+        tokens = [token for token, rates in self._rates.items() if len(rates) == len(self.exchanges) and token in self._closes]
+        closes = self._closes
+        rates = self._rates
+        self._timestamp = None
+        self._rates = {}
+        self._closes = {}
+        if not tokens:
+            return None
+
+        token = np.array(tokens, dtype=object)
+        allocation = allocate(
+            np.zeros(len(tokens), dtype=np.int64),
+            token,
+            np.array([closes[t] for t in tokens], dtype=float),
+            np.array([self._get_quantity_hold(t) for t in tokens], dtype=float),
+            np.array([[rates[t][exchange] for exchange in self.exchanges] for t in tokens], dtype=float),
+            self.config, self.inventory, self.init_quantity, self.haircuts,
+            partial=self.config.is_partial_allocation,
+        )
+        lines = np.flatnonzero(allocation.owned)
+        names = np.where(allocation.is_usdt[lines], "USDT", token[allocation.source[lines]])
+        return BestGainDecision(
+            timestamp=timestamp,
+            actions={name: "INVESTED" if invested else "POSTED"
+                     for name, invested in zip(names, allocation.is_invested[lines])},
+            invested_fraction=dict(zip(names, allocation.invested_fraction[lines].tolist())),
+            potential_gain_usd=dict(zip(names, allocation.potential_gain_usd[lines].tolist())),
+            is_profitable=bool(allocation.is_profitable[0]),
+            fee_amount=float(allocation.fee_amount[0]),
+        )
+
+    def _get_quantity_hold(self, token: str) -> float:
+        # Same rule as funding_tools.init_quantity
+        if token not in self._quantity_hold:
+            amount = self.inventory[token] if token in self.inventory else self.inventory.get("USDT")
+            self._quantity_hold[token] = amount / self.initial_prices[token]
+        return self._quantity_hold[token]
@@ -0,0 +1,112 @@
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from analysis_tools.memo import fingerprint, source_fingerprint
+from model.config import RUN_FIELDS
+from strategy.result_ledger import ResultLedger
+
+# Bump when the content of a checkpoint changes
+CHECKPOINT_VERSION = 1
+
+
+@dataclass()
+class Checkpoint:
+    # Lines of the processed timestamps, their source is a row of rows
+    ledger: ResultLedger
+    # Rows of BestGain.df used by the lines
+    rows: pd.DataFrame
+    # Last processed timestamp, with or without lines
+    last_timestamp: pd.Timestamp
+    # Hash of the parameters and of the source of BestGain (see strategy_fingerprint)
+    parameters: str
+    version: int = CHECKPOINT_VERSION
+
+
+def strategy_fingerprint(strategy) -> str:
+    # Everything the decision of a timestamp depends on, besides its own rows (the RUN_FIELDS do not)
+    config = {field.name: getattr(strategy.config, field.name) for field in fields(strategy.config)
+              if field.name not in RUN_FIELDS}
+    return fingerprint(config, strategy.inventory, strategy.init_quantity, strategy.haircuts,
+                       source_fingerprint(type(strategy)), source_fingerprint(ResultLedger))
+
+
+def load_checkpoint(path: str) -> Optional[Checkpoint]:
+    # None when there is no checkpoint at path or it was written by another version
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        checkpoint = pickle.load(f)
+    return checkpoint if checkpoint.version == CHECKPOINT_VERSION else None
+
+
+def checkpoint_time(path: str) -> Optional[pd.Timestamp]:
+    # Last timestamp of the checkpoint at path, the data before it is not needed to resume
+    checkpoint = load_checkpoint(path)
+    return None if checkpoint is None else checkpoint.last_timestamp
+
+
+def save_checkpoint(strategy, path: str, last_timestamp: Optional[pd.Timestamp] = None):
+    """
+    Checkpoint of a BestGain applied to its df: the ledger and the rows of df its lines come from, so
+    that a later resume does not need the data of the processed timestamps. last_timestamp is the last
+    timestamp of df by default. Written in a temporary file renamed over path.
+    """
+    ledger = strategy.ledger
+    if ledger is None or not len(ledger):
+        raise ValueError("Nothing to save, apply() first")
+    used, source = np.unique(ledger.source[:ledger.size], return_inverse=True)
+    compact = ResultLedger.concat([ledger], [0])
+    compact.source[:] = source
+    checkpoint = Checkpoint(
+        ledger=compact,
+        rows=strategy.df.iloc[used].reset_index(drop=True),
+        last_timestamp=pd.Timestamp(strategy.df["timestamp"].max() if last_timestamp is None else last_timestamp),
+        parameters=strategy_fingerprint(strategy),
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def resume_checkpoint(strategy, path: str, apply) -> int:
+    """
+    Apply a BestGain to the timestamps of its df after the checkpoint at path only, then save the checkpoint
+    of all the processed timestamps. apply(df) runs the strategy on df and returns its ledger.
+    A BestGain timestamp does not depend on the others, so the lines of the checkpoint are kept as they are
+    and the rows of df up to its last timestamp are skipped: df only needs the new rows (ie: loading_data
+    from checkpoint_time(path)). Without a checkpoint every timestamp of df is processed.
+    The strategy ends with df the checkpoint rows followed by the new rows and the ledger of both.
+    Returns the number of timestamps processed.
+    """
+    checkpoint = load_checkpoint(path)
+    df = strategy.df
+    if checkpoint is not None:
+        if checkpoint.parameters != strategy_fingerprint(strategy):
+            raise ValueError(f"The checkpoint {path} was made with other parameters or another version of "
+                             f"the strategy, remove it to process every timestamp again")
+        df = df.loc[df["timestamp"] > checkpoint.last_timestamp].reset_index(drop=True)
+
+    processed = df["timestamp"].nunique()
+    # The checkpoint rows only hold timestamps with lines, the last processed one may have none
+    last_timestamp = df["timestamp"].max() if processed else checkpoint.last_timestamp
+    if checkpoint is None:
+        strategy.ledger = apply(df)
+    elif processed:
+        ledger = apply(df)
+        strategy.df = pd.concat([checkpoint.rows, df], ignore_index=True)
+        strategy.ledger = ResultLedger.concat([checkpoint.ledger, ledger], [0, len(checkpoint.rows)])
+    else:
+        strategy.df = checkpoint.rows
+        strategy.ledger = checkpoint.ledger
+    strategy.result = None
+    save_checkpoint(strategy, path, last_timestamp)
+    return processed
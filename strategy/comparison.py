@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import pandas as pd
+
+from analysis_tools import profiling
+from analysis_tools.shared_inputs import SharedInputs
+from strategy.registry import run_strategy
+
+RECAP_COLUMNS = ["pnl_with_fee", "apy_with_fee", "fee_amount"]
+
+
+def compare_strategies(names: List[str], funding_df: pd.DataFrame, config, settings, engine: Optional[str] = None,
+                       workers: int = 1) -> pd.DataFrame:
+    """
+    Run the strategies of the registry on the same funding_df and return one row of recap by strategy
+    (pnl_with_fee, apy_with_fee, fee_amount and the gain of each token in gain_<token> columns).
+
+    The best rates, gains by unit and spot prices are computed once in a SharedInputs given read-only to
+    every strategy. With workers > 1 the strategies run in threads sharing these inputs, one after the other
+    when profiling is on (the profiler follows a single stack of stages).
+    """
+    shared = SharedInputs(funding_df, config).prepare()
+
+    def run(name):
+        _, recap = run_strategy(name, funding_df, config, settings, engine, shared=shared, verbose=False)
+        return recap
+
+    if workers > 1 and profiling.get_profiler() is None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            recaps = list(executor.map(run, names))
+    else:
+        recaps = [run(name) for name in names]
+
+    rows = []
+    for name, recap in zip(names, recaps):
+        row = {"strategy": name, **{column: recap[column] for column in RECAP_COLUMNS}}
+        row.update({f"gain_{token}": gain for token, gain in recap["gain_by_token"].items()})
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("strategy")
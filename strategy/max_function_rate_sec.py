@@ -1,9 +1,13 @@
+from typing import Dict, Optional
+
 import pandas as pd
 import numpy as np
 
 
+from analysis_tools.funding_tools import compounded_quantity, is_unique_best
+from analysis_tools.price_index import PriceIndex
+from analysis_tools.shared_inputs import SharedInputs
 from model.config import Config
-from static_data import HAIRCUTS
 
 
 class MaxFundingRateSec:
@@ -18,68 +22,101 @@ class MaxFundingRateSec:
     otherwise you just keep the amount of crypto
     """
 
-    def __init__(self, df_funding: pd.DataFrame, config: Config):
+    def __init__(self, df_funding: pd.DataFrame, config: Config, inventory: Dict[str, float],
+                 haircuts: Dict[str, float], shared: Optional[SharedInputs] = None):
         self.result: pd.DataFrame = None
+        # df_funding is not modified, shared holds the best rates computed once for all strategies
         self.df_funding = df_funding
         self.config = config
+        # The USDT of the inventory is the collateral of the hedges, haircuts by token without USDT (ie: BTC)
+        self.inventory = inventory
+        self.haircuts = haircuts
+        self.shared = shared or SharedInputs(df_funding, config)
+        # Crypto earned by row and the quantity held before it, index of df_funding
+        self.gain_crypto: pd.Series = None
+        self.quantity_hold: pd.Series = None
 
     def apply(self):
-        result = {}
+        """
+        Vectorized version of the original row by row walk over df_funding (ordered by timestamp):
+        - during the first timestamp we keep the token with the best funding rate,
+        - from there every row books the USDT gain of the token kept at the previous row, then keeps
+          its own token if one of its funding rates is positive,
+        - the entry price of a booked gain is the spot price opened at the first timestamp and the exit
+          price the spot price closed at the timestamp of the row.
+        The gains are made on the USDT of the inventory, with the haircut of the token.
+        With Config.is_reinvest, gains are compounded: each booked USDT gain is added to the USDT
+        of collateral and the crypto earned on a funding is held for the next fundings of the token.
+        """
 
-        spot_perp_price = self.config.dataset.spot_prices_binance
-
-        usdt_gain = []
-
-        gain_crypto = []
-        prev_date = None
-        current_max_funding = (None, None)
-
-        for i, row in self.df_funding.iterrows():
-            if prev_date is None:
-                prev_date = row["timestamp"]
-                current_max_funding = (row["token"], row["funding_rate_binance"]) if row["funding_rate_binance"] > row["funding_rate_bybite"] else (row["token"], row["funding_rate_bybite"])
-            if prev_date != row["timestamp"] and current_max_funding[0] not in [None, ""]:
-                # Compute USDT INVESTMENT
-                spot_price_t_1 = spot_perp_price.loc[(spot_perp_price["open_time"] == prev_date) & (spot_perp_price["token"] == current_max_funding[0])]["close"].values[0]
-                spot_price_t = spot_perp_price.loc[(spot_perp_price["close_time"] == row["timestamp"]) & (spot_perp_price["token"] == current_max_funding[0])]["close"].values[0]
-                amount_gained = (((HAIRCUTS.get(current_max_funding[0], 1) * 500_000) / spot_price_t_1) * current_max_funding[1]) * spot_price_t
-                usdt_gain.append(amount_gained)
-                current_max_funding = ["", 0]
-
-
-            if any([current_max_funding[1]<row["funding_rate_bybite"], current_max_funding[1]<row["funding_rate_binance"]]):
-                current_max_funding = (row["token"], row["funding_rate_binance"]) if row["funding_rate_binance"] > row[
-                    "funding_rate_bybite"] else (row["token"], row["funding_rate_bybite"])
-
-            if not self.config.is_reinvest:
-                if not row["is_buy_long_perp_binance"] and row["funding_rate_binance"] > row["funding_rate_bybite"]:
-                    gain_crypto.append(row["funding_rate_binance"]*row["current_quantity_hold"])
-                elif not row["is_buy_long_perp_bybite"] and row["funding_rate_bybite"] > row["funding_rate_binance"]:
-                    gain_crypto.append(row["funding_rate_bybite"]*row["current_quantity_hold"])
-                else:
-                    gain_crypto.append(0)
+        result = {}
+        df = self.df_funding
+        open_prices = self.config.dataset.price_index("open_time")
+        close_prices = self.config.dataset.price_index("close_time")
+
+        timestamp = df["timestamp"].to_numpy()
+        token = df["token"].to_numpy()
+        rates = self.shared.rates
+        _, best_rate = self.shared.best
+
+        usdt_gain = np.array([])
+        if len(df):
+            first_date = timestamp[0]
+            is_first_date = timestamp == first_date
+            # Token kept after each row, "" when nothing is kept
+            kept_token = np.where(best_rate > 0, token, "").astype(object)
+            kept_rate = np.where(best_rate > 0, best_rate, 0)
+            # During the first timestamp the kept token is the first best funding rate
+            first_rows = np.flatnonzero(is_first_date)
+            first_best = first_rows[np.argmax(best_rate[first_rows])]
+            kept_token[first_rows[-1]] = token[first_best]
+            kept_rate[first_rows[-1]] = best_rate[first_best]
+
+            booked = np.flatnonzero(~is_first_date)
+            booked = booked[kept_token[booked - 1] != ""]
+            booked_token = kept_token[booked - 1]
+            spot_price_t_1 = _lookup_close(open_prices, booked_token, np.full(len(booked), first_date))
+            spot_price_t = _lookup_close(close_prices, booked_token, timestamp[booked])
+            haircut = np.array([self.haircuts.get(t[:-4], 1) for t in booked_token], dtype=float)
+            collateral = float(self.inventory.get("USDT", 0))
+            if self.config.is_reinvest:
+                # USDT earned by each USDT of collateral, the collateral grows with the previous bookings
+                gain_rate = ((haircut / spot_price_t_1) * kept_rate[booked - 1]) * spot_price_t
+                usdt_gain = compounded_quantity(np.full(len(booked), collateral), gain_rate) * gain_rate
             else:
-                raise Exception("This strategy is not implemented with a reinvesment feature")
-
-        self.df_funding["result"] = gain_crypto
-
-        for token in self.df_funding["token"].unique().tolist():
-            if token == "USDT":
-                continue
-            df = self.df_funding.loc[self.df_funding["token"]==f"{token}"]
-            quantity = float(df["result"].sum())
-            result[token] = {
+                usdt_gain = (((haircut * collateral) / spot_price_t_1) * kept_rate[booked - 1]) * spot_price_t
+
+        quantity_hold = self.shared.quantity_hold
+        # Gain of the exchange paying strictly more than the others, when its rate is positive
+        is_earned = is_unique_best(rates, best_rate) & (best_rate >= 0)
+        if self.config.is_reinvest:
+            quantity_hold = compounded_quantity(quantity_hold, np.where(is_earned, best_rate, 0), token)
+        gain_crypto = np.where(is_earned, best_rate * quantity_hold, 0)
+        self.quantity_hold = pd.Series(quantity_hold, index=df.index, name="current_quantity_hold")
+        self.gain_crypto = pd.Series(gain_crypto, index=df.index, name="result")
+
+        tokens = [t for t in df["token"].unique().tolist() if t != "USDT"]
+        rows_by_token = df.groupby("token", sort=False).indices
+        end_prices = _lookup_close(close_prices, tokens, np.full(len(tokens), np.datetime64(self.config.end_date, "ns")))
+        for token_name, end_price in zip(tokens, end_prices):
+            quantity = float(gain_crypto[rows_by_token[token_name]].sum())
+            result[token_name] = {
                 "quantity": float(quantity),
-                "amount_usd": float(quantity * self.config.dataset.spot_prices_binance.loc[(self.config.dataset.spot_prices_binance["close_time"]==self.config.end_date) & (self.config.dataset.spot_prices_binance["token"]==f"{token}USDT")]["close"].values[0])
+                "amount_usd": float(quantity * end_price)
             }
+        # Summed one value after the other like sum() on a list
+        total_usdt_gain = float(np.cumsum(usdt_gain)[-1]) if len(usdt_gain) else 0
         result["USDUSDT"] = {
-            "quantity": sum(usdt_gain),
-            "amount_usd": sum(usdt_gain)
+            "quantity": total_usdt_gain,
+            "amount_usd": total_usdt_gain
         }
 
         self.result = pd.DataFrame(result)
 
 
-
-
-
+def _lookup_close(price_index: PriceIndex, tokens, times) -> np.ndarray:
+    prices = price_index.lookup(tokens, times)
+    if np.isnan(prices).any():
+        missing = sorted({(str(t), str(d)) for t, d, p in zip(tokens, times, prices) if np.isnan(p)})
+        raise KeyError(f"No spot price for {missing[:5]}")
+    return prices
@@ -1,7 +1,11 @@
+from typing import Optional
+
 import pandas as pd
 import numpy as np
 
 
+from analysis_tools.funding_tools import compounded_quantity
+from analysis_tools.shared_inputs import SharedInputs
 from model.config import Config
 
 
@@ -19,30 +23,39 @@ class MaxFundingRate:
 
     def __init__(self):
         self.result: pd.DataFrame = None
+        # Crypto earned by row on each exchange (gain_crypto_<exchange> columns), index of df_funding
+        self.gain_crypto: pd.DataFrame = None
 
-    def apply(self, df_funding: pd.DataFrame, config: Config):
+    def apply(self, df_funding: pd.DataFrame, config: Config, shared: Optional[SharedInputs] = None):
+        # df_funding is not modified, shared holds the best rates and gains by unit computed once for all strategies
+        shared = shared or SharedInputs(df_funding, config)
         result = {}
 
         last_date = df_funding["timestamp"].unique().tolist()[-1]
-
-        if not config.is_reinvest:
-            df_funding["gain_crypto_binance"] = np.where(df_funding["is_buy_long_perp_binance"], 0, df_funding["current_quantity_hold"]*(df_funding["funding_rate_binance"]))
-            df_funding["gain_crypto_bybite"] = np.where(df_funding["is_buy_long_perp_bybite"], 0, df_funding["current_quantity_hold"]*(df_funding["funding_rate_bybite"]))
-        else:
-            raise Exception("This strategy is not implemented with a reinvesment feature")
-
+        price_index = config.dataset.price_index("close_time")
+
+        exchanges = shared.exchanges
+        # Exchange with the best funding rate
+        venue, best_rate = shared.best
+        quantity_hold = shared.quantity_hold
+        if config.is_reinvest:
+            # The crypto earned on each funding is held for the next fundings of the token
+            quantity_hold = compounded_quantity(quantity_hold, np.where(best_rate >= 0, best_rate, 0),
+                                                df_funding["token"].to_numpy())
+
+        gains = quantity_hold[:, None] * shared.gain_per_unit
+        self.gain_crypto = pd.DataFrame(gains, columns=[f"gain_crypto_{exchange}" for exchange in exchanges],
+                                        index=df_funding.index)
+        # Gain of that exchange
+        best_gain = pd.Series(np.take_along_axis(gains, venue[:, None], axis=1)[:, 0], index=df_funding.index)
 
         for token in df_funding["token"].unique().tolist():
             if token == "USDT":
                 continue
-            df = df_funding.loc[df_funding["token"]==f"{token}"][["is_funding_binance_best", "gain_crypto_binance", "gain_crypto_bybite"]]
-            df["result"] = df.apply(lambda x: x["gain_crypto_binance"] if x["is_funding_binance_best"] else x["gain_crypto_bybite"], axis=1)
-            quantity = float(df["result"].sum())
+            quantity = float(best_gain.loc[df_funding["token"]==f"{token}"].sum())
             result[token] = {
                 "quantity": float(quantity),
-                "amount_usd": float(quantity * config.dataset.spot_prices_binance.loc[(config.dataset.spot_prices_binance["close_time"]==last_date) & (config.dataset.spot_prices_binance["token"]==f"{token}")]["close"].values[0])
+                "amount_usd": float(quantity * price_index.get(token, last_date))
             }
 
         self.result = pd.DataFrame(result)
-
-
@@ -0,0 +1,100 @@
+"""
+Strategies runnable from main.py, by name.
+
+A strategy module is only imported when its strategy is run, listing the strategies imports nothing.
+Each runner takes the strategy class, the funding dataframe, the Config, the BacktestSettings, the
+engine and the SharedInputs (None to compute them), applies the strategy, prints its recap when verbose
+and returns the strategy with its recap: pnl_with_fee, apy_with_fee, fee_amount and gain_by_token (USD).
+"""
+import importlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Strategy class of each name, "module:Class"
+STRATEGIES: Dict[str, str] = {}
+_RUNNERS: Dict[str, Callable] = {}
+# Strategies whose runner takes a checkpoint path, to process only the timestamps after it
+CHECKPOINTED = ["best_gain"]
+
+
+def register(name: str, path: str):
+    # Decorator of the runner of the strategy class path ("module:Class")
+    def decorator(runner: Callable) -> Callable:
+        STRATEGIES[name] = path
+        _RUNNERS[name] = runner
+        return runner
+    return decorator
+
+
+def strategy_names() -> List[str]:
+    return list(STRATEGIES)
+
+
+def load_strategy(name: str) -> type:
+    if name not in STRATEGIES:
+        raise KeyError(f"Unknown strategy {name!r}, one of {strategy_names()}")
+    module_name, class_name = STRATEGIES[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def run_strategy(name: str, funding_df, config, settings, engine: Optional[str] = None, shared=None,
+                 verbose: bool = True, checkpoint: Optional[str] = None) -> Tuple[object, Dict]:
+    if checkpoint is not None and name not in CHECKPOINTED:
+        raise ValueError(f"{name} can not be resumed from a checkpoint, only {CHECKPOINTED}")
+    runner = _RUNNERS[name]
+    if name in CHECKPOINTED:
+        return runner(load_strategy(name), funding_df, config, settings, engine, shared, verbose, checkpoint)
+    return runner(load_strategy(name), funding_df, config, settings, engine, shared, verbose)
+
+
+def _result_recap(result, settings) -> Dict:
+    # No fee model in the MaxFundingRate strategies, the APY is over the whole inventory
+    gain_by_token = {token: float(amount) for token, amount in result.loc["amount_usd"].items()}
+    pnl = sum(gain_by_token.values())
+    return {
+        "pnl_with_fee": pnl,
+        "apy_with_fee": round(pnl / sum(settings.inventory.values()), 4) * 100,
+        "fee_amount": float("nan"),
+        "gain_by_token": gain_by_token,
+    }
+
+
+@register("best_gain", "strategy.best_gain:BestGain")
+def _run_best_gain(strategy_class, funding_df, config, settings, engine, shared, verbose, checkpoint):
+    from analysis_tools.profiling import stage
+
+    strat = strategy_class(funding_df, config, settings.inventory, settings.init_quantity, settings.haircuts,
+                           shared=shared)
+    with stage("BestGain.apply") as timed:
+        options = {"engine": engine} if engine else {}
+        if checkpoint:
+            processed = strat.resume(checkpoint, **options)
+            if verbose:
+                print(f"{processed} new timestamps processed, checkpoint {checkpoint} updated\n")
+        else:
+            strat.apply(**options)
+        timed.rows = len(strat.ledger)
+
+    with stage("BestGain.apply_stats"):
+        strat.apply_stats(verbose=verbose)
+    pnl_by_token = strat.recap["pnl_by_token"]
+    recap = {name: float(strat.recap[name]) for name in ["pnl_with_fee", "apy_with_fee", "fee_amount"]}
+    recap["gain_by_token"] = dict(zip(pnl_by_token["token"], pnl_by_token["gain_with_fee"].astype(float)))
+    return strat, recap
+
+
+@register("max_funding_rate", "strategy.max_funding_rate:MaxFundingRate")
+def _run_max_funding_rate(strategy_class, funding_df, config, settings, engine, shared, verbose):
+    strat = strategy_class()
+    strat.apply(funding_df, config, shared)
+    if verbose:
+        print(strat.result)
+    return strat, _result_recap(strat.result, settings)
+
+
+@register("max_funding_rate_sec", "strategy.max_function_rate_sec:MaxFundingRateSec")
+def _run_max_funding_rate_sec(strategy_class, funding_df, config, settings, engine, shared, verbose):
+    strat = strategy_class(funding_df, config, settings.inventory, settings.haircuts, shared)
+    strat.apply()
+    if verbose:
+        print(strat.result)
+    return strat, _result_recap(strat.result, settings)
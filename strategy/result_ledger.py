@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Values of a result line, in the column order of BestGain.result
+VALUE_COLUMNS = ["current_quantity_hold", "collateral_value", "collateral_value_usd", "potential_gain",
+                 "potential_gain_usd", "collateral_needed_usd"]
+
+
+class ResultLedger:
+    """
+    Result lines of BestGain in preallocated typed arrays, filled in place by the engines.
+
+    A line is a row of the merged funding frame (source) with the values computed for it. The gain
+    by token and the fee of each timestamp of the profitable INVESTED lines are accumulated as the
+    lines are written, so the recap is computed from O(tokens) values and to_frame() only builds
+    the wide result frame when it is asked for.
+    Every line of a timestamp must be written by the same write() call.
+    """
+
+    def __init__(self, capacity: int, tokens: List[str], partial: bool = False):
+        self.tokens = list(tokens)
+        self.partial = partial
+        self.size = 0
+        self.source = np.empty(capacity, dtype=np.int64)
+        self.rank = np.empty(capacity, dtype=np.int64)
+        self.token_code = np.empty(capacity, dtype=np.int64)
+        self.is_usdt = np.empty(capacity, dtype=bool)
+        self.is_invested = np.empty(capacity, dtype=bool)
+        self.is_profitable = np.empty(capacity, dtype=bool)
+        self.fee_amount = np.empty(capacity)
+        self.allocated_fraction = np.empty(capacity)
+        self.values = {column: np.empty(capacity) for column in VALUE_COLUMNS}
+        # Aggregates of the profitable INVESTED lines
+        self.gain_by_token = np.zeros(len(self.tokens))
+        self.lines_by_token = np.zeros(len(self.tokens), dtype=np.int64)
+        self._fees: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return self.size
+
+    def write(self, group_ids: np.ndarray, source: np.ndarray, rank: np.ndarray, token_code: np.ndarray,
+              is_usdt: np.ndarray, is_invested: np.ndarray, is_profitable: np.ndarray, fee_amount: np.ndarray,
+              values: Dict[str, np.ndarray], allocated_fraction: Union[float, np.ndarray] = 1.0):
+        # group_ids numbers the timestamps of the lines, the fee is counted once per timestamp
+        start, stop = self.size, self.size + len(source)
+        if stop > len(self.source):
+            raise ValueError(f"Ledger full, capacity {len(self.source)} lines")
+        self.source[start:stop] = source
+        self.rank[start:stop] = rank
+        self.token_code[start:stop] = token_code
+        self.is_usdt[start:stop] = is_usdt
+        self.is_invested[start:stop] = is_invested
+        self.is_profitable[start:stop] = is_profitable
+        self.fee_amount[start:stop] = fee_amount
+        self.allocated_fraction[start:stop] = allocated_fraction
+        for column in VALUE_COLUMNS:
+            self.values[column][start:stop] = values[column]
+        self.size = stop
+
+        counted = np.flatnonzero(self.is_invested[start:stop] & self.is_profitable[start:stop]) + start
+        # NaN gains (a spot bar without close) are skipped like the pandas sums of the result frame
+        gains = self.values["potential_gain_usd"][counted]
+        self.gain_by_token += np.bincount(self.token_code[counted], weights=np.nan_to_num(gains, nan=0.0),
+                                          minlength=len(self.tokens))
+        self.lines_by_token += np.bincount(self.token_code[counted], minlength=len(self.tokens))
+        _, first = np.unique(np.asarray(group_ids)[counted - start], return_index=True)
+        self._fees.append(self.fee_amount[counted[first]])
+
+    @classmethod
+    def concat(cls, ledgers: List["ResultLedger"], source_offsets: List[int]) -> "ResultLedger":
+        """
+        Lines of ledgers one after the other with their totals, in a ledger of their total size.
+        The source of the lines of each ledger is shifted by its offset, ledgers must have the same tokens.
+        """
+        tokens, partial = ledgers[0].tokens, ledgers[0].partial
+        if any(ledger.tokens != tokens or ledger.partial != partial for ledger in ledgers):
+            raise ValueError("Ledgers of different tokens or allocation modes")
+        result = cls(sum(ledger.size for ledger in ledgers), tokens, partial)
+        start = 0
+        for ledger, offset in zip(ledgers, source_offsets):
+            stop = start + ledger.size
+            result.source[start:stop] = ledger.source[:ledger.size] + offset
+            for name in ["rank", "token_code", "is_usdt", "is_invested", "is_profitable", "fee_amount",
+                         "allocated_fraction"]:
+                getattr(result, name)[start:stop] = getattr(ledger, name)[:ledger.size]
+            for column in VALUE_COLUMNS:
+                result.values[column][start:stop] = ledger.values[column][:ledger.size]
+            result.gain_by_token += ledger.gain_by_token
+            result.lines_by_token += ledger.lines_by_token
+            result._fees.extend(ledger._fees)
+            start = stop
+        result.size = start
+        return result
+
+    def pnl_by_token(self) -> pd.DataFrame:
+        # potential_gain_usd of the profitable INVESTED lines by token, sorted by token
+        has_lines = self.lines_by_token > 0
+        pnl_by_token = pd.DataFrame({
+            "token": np.asarray(self.tokens, dtype=object)[has_lines],
+            "potential_gain_usd": self.gain_by_token[has_lines],
+        })
+        return pnl_by_token.sort_values("token", ignore_index=True)
+
+    def fee_total(self) -> float:
+        # Fees of the timestamps with a profitable INVESTED line
+        return float(np.concatenate(self._fees).sum()) if self._fees else 0.0
+
+    def profitable_invested_lines(self) -> np.ndarray:
+        # Positions of the profitable INVESTED lines, the ones of the recap
+        return np.flatnonzero(self.is_invested[:self.size] & self.is_profitable[:self.size])
+
+    def to_frame(self, df: pd.DataFrame, lines: Optional[np.ndarray] = None) -> pd.DataFrame:
+        # Wide result frame: the source rows of df with the values of each line, of all the lines by default
+        lines = np.arange(self.size) if lines is None else np.asarray(lines)
+        result = df.iloc[self.source[lines]].copy()
+        result.index = self.rank[lines]
+        result["token"] = np.asarray(self.tokens, dtype=object)[self.token_code[lines]]
+        for column in VALUE_COLUMNS:
+            result[column] = self.values[column][lines]
+        result["is_usdt_invest"] = self.is_usdt[lines]
+        result["ACTION"] = np.where(self.is_invested[lines], "INVESTED", "POSTED").astype(object)
+        if self.partial:
+            result["allocated_fraction"] = self.allocated_fraction[lines]
+        result["is_profitable"] = self.is_profitable[lines]
+        result["fee_amount"] = self.fee_amount[lines]
+        # Formatted once by timestamp
+        codes, timestamps = pd.factorize(result["timestamp"])
+        result["date_daily"] = pd.to_datetime(timestamps).strftime("%d-%m-%Y").to_numpy(dtype=object)[codes]
+        return result